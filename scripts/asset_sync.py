@@ -0,0 +1,239 @@
+# coding: utf-8
+"""Synchronisation incrémentale d'arborescences (ressources du site) et manifestes de construction"""
+import os
+import json
+import posixpath
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl  # Absent sous Windows : pas de clonage (reflink)
+except ImportError:
+    fcntl = None
+
+# Manifeste de synchronisation, écrit à la racine de chaque arborescence de destination
+SYNC_MANIFEST = ".sync-manifest.json"
+
+# ioctl Linux de clonage de fichier (Btrfs, XFS... : copie sans dupliquer les données)
+FICLONE = 0x40049409
+
+# Nombre de caractères du hash ajoutés au nom des fichiers empreintés (styles.<hash>.css)
+FINGERPRINT_LENGTH = 10
+
+# Versions précompressées écrites à côté des fichiers du site (voir precompress.py)
+COMPRESSED_SUFFIXES = (".gz", ".br")
+
+# Nombre de copies simultanées (les copies attendent surtout le disque)
+SYNC_WORKERS = 8
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Calcule le hash SHA-256 du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """Charge un manifeste JSON, ou renvoie un manifeste vide s'il est absent ou illisible"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """Écrit le manifeste de façon atomique (fichier temporaire puis renommage)"""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def fingerprint_name(relative, digest, length=FINGERPRINT_LENGTH):
+    """Nom de fichier portant l'empreinte de son contenu : styles.css → styles.<hash>.css
+
+    Un nom qui est déjà le début du hash du contenu (image adressée par contenu) est conservé.
+    """
+    folder, name = posixpath.split(relative)
+    stem, ext = os.path.splitext(name)
+    if len(stem) >= length and digest.startswith(stem):
+        return relative
+    return posixpath.join(folder, f"{stem}.{digest[:length]}{ext}")
+
+
+def scan_tree(root):
+    """Renvoie {chemin relatif (séparateur /): os.stat_result} des fichiers de l'arborescence
+
+    Les fichiers et dossiers cachés (commençant par un point) sont ignorés.
+    """
+    files = {}
+    pending = [("", root)]
+    while pending:
+        prefix, folder = pending.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            relative = prefix + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                pending.append((relative + "/", entry.path))
+            elif entry.is_file():
+                files[relative] = entry.stat()
+    return files
+
+
+def _copy_data(src, dst):
+    """Copie le contenu de `src` dans le nouveau fichier `dst` par le moyen le plus rapide disponible"""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return
+            except OSError:
+                pass  # Système de fichiers sans clonage, ou autre volume
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining <= 0:
+                    return
+            except OSError:
+                pass
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+    shutil.copyfile(src, dst)
+
+
+def sync_file(src, dst, link=False):
+    """Remplace `dst` par une copie de `src` (contenu et dates), de façon atomique
+
+    Avec `link`, un lien physique est tenté d'abord (même volume) : aucune donnée
+    n'est copiée, mais la destination partage alors le fichier de la source.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = dst + ".sync-tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    if link:
+        try:
+            os.link(src, tmp_path)
+            os.replace(tmp_path, dst)
+            if os.path.exists(tmp_path):  # `dst` était déjà ce même fichier
+                os.remove(tmp_path)
+            return
+        except OSError:
+            pass
+
+    _copy_data(src, tmp_path)
+    shutil.copystat(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def sync_tree(src_dir, dest_dir, link=False, verify_hash=False, fingerprint=False, workers=None):
+    """Rend `dest_dir` identique à `src_dir` en ne copiant que les fichiers modifiés
+
+    Un fichier est à jour quand la destination a la taille et la date de modification
+    de la source (les copies conservent la date). Avec `verify_hash`, une source
+    seulement « touchée » (même contenu que lors de la dernière synchronisation,
+    d'après le hash du manifeste) n'est pas recopiée : seule la date est reportée.
+    Avec `fingerprint`, chaque fichier est écrit sous un nom portant l'empreinte de
+    son contenu (voir `fingerprint_name`), qui peut donc être mis en cache sans limite ;
+    ces fichiers sont toujours copiés (ou clonés), jamais liés : une source réécrite
+    sur place (miniature régénérée...) changerait sinon le contenu d'un nom empreinté.
+    Les hash ne sont recalculés que pour les sources dont la taille ou la date a changé.
+    Les fichiers de la destination absents de la source sont supprimés.
+
+    Renvoie le résumé {"copied": n, "unchanged": n, "deleted": n, "files": {source: destination}}
+    (chemins relatifs, séparateur /).
+    """
+    link = link and not fingerprint
+    manifest_path = os.path.join(dest_dir, SYNC_MANIFEST)
+    manifest = load_manifest(manifest_path)
+    sources = scan_tree(src_dir)
+    outputs = scan_tree(dest_dir)
+
+    def same_stat(file_stat, entry):
+        return (file_stat.st_size, file_stat.st_mtime_ns) == (entry.get("size"), entry.get("mtime_ns"))
+
+    with ThreadPoolExecutor(max_workers=workers or SYNC_WORKERS) as executor:
+        # Hash des sources modifiées depuis la dernière synchronisation (les autres sont dans le manifeste)
+        hashes = {}
+        if verify_hash or fingerprint:
+            to_hash = [relative for relative, src_stat in sources.items()
+                       if not (same_stat(src_stat, manifest.get(relative, {})) and manifest[relative].get("hash"))]
+            paths = [os.path.join(src_dir, relative) for relative in to_hash]
+            hashes = dict(zip(to_hash, executor.map(file_hash, paths)))
+
+        new_manifest = {}
+        to_copy = []
+        unchanged = 0
+        for relative, src_stat in sources.items():
+            previous = manifest.get(relative, {})
+            digest = hashes.get(relative) or (previous.get("hash") if same_stat(src_stat, previous) else None)
+            target = fingerprint_name(relative, digest) if fingerprint else relative
+            dest_stat = outputs.get(target)
+
+            entry = {"size": src_stat.st_size, "mtime_ns": src_stat.st_mtime_ns, "target": target}
+            if digest:
+                entry["hash"] = digest
+            new_manifest[relative] = entry
+
+            if fingerprint and dest_stat and os.path.samestat(dest_stat, src_stat):
+                # Lien physique d'une synchronisation précédente : remplacé par une copie
+                to_copy.append((relative, target))
+            elif dest_stat and same_stat(dest_stat, entry):
+                unchanged += 1
+            elif (verify_hash and dest_stat and digest == previous.get("hash")
+                  and previous.get("target", relative) == target and same_stat(dest_stat, previous)):
+                # Destination intacte depuis la dernière synchronisation et contenu identique : reporter la date
+                os.utime(os.path.join(dest_dir, target), ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+                unchanged += 1
+            else:
+                to_copy.append((relative, target))
+
+        def copy(item):
+            relative, target = item
+            sync_file(os.path.join(src_dir, relative), os.path.join(dest_dir, target), link=link)
+
+        list(executor.map(copy, to_copy))
+
+    targets = {entry["target"] for entry in new_manifest.values()}
+    # Les versions précompressées d'un fichier copié restent (precompress les met à jour)
+    stale = [relative for relative in outputs if relative not in targets
+             and not (relative.endswith(COMPRESSED_SUFFIXES) and os.path.splitext(relative)[0] in targets)]
+    for relative in stale:
+        os.remove(os.path.join(dest_dir, relative))
+    if stale:
+        _remove_empty_dirs(dest_dir)
+
+    if new_manifest != manifest:
+        os.makedirs(dest_dir, exist_ok=True)
+        save_manifest(manifest_path, new_manifest)
+
+    return {
+        "copied": len(to_copy),
+        "unchanged": unchanged,
+        "deleted": len(stale),
+        "files": {relative: entry["target"] for relative, entry in new_manifest.items()},
+    }
+
+
+def _remove_empty_dirs(root):
+    """Supprime les dossiers vides sous `root` (sans supprimer `root`)"""
+    for folder, dirs, files in os.walk(root, topdown=False):
+        if folder != root and not os.listdir(folder):
+            os.rmdir(folder)
@@ -0,0 +1,524 @@
+# coding: utf-8
+"""Mesures de performance de la chaîne de traitement, sans affichage
+
+Le banc génère des données synthétiques (collections de 1 000 à 1 000 000 de
+figurines aux tags répartis comme dans une vraie collection : quelques tags très
+courants et une longue traîne de tags rares, et des images de la résolution
+voulue), puis exécute chaque étape dans un processus séparé :
+    thumbnails        create_thumbnails (puis une seconde passe sans changement)
+    collection_json   create_collection_json (import des images)
+    copy_assets       copy_assets des images (copie puis synchronisation sans changement)
+    generate_site     generate_site (pages HTML et données du site)
+    manager_load      chargement du gestionnaire : store.iter_load par lots + CollectionIndex.extend
+    manager_sort      construction des vues triées (SortedView)
+    manager_filter    requêtes du filtre (CollectionIndex.filter)
+    manager_save      save_all et modifications unitaires (put)
+
+Pour chaque étape sont relevés la durée, le débit et la mémoire maximale (RSS)
+du processus. Les résultats sont ajoutés, une exécution par ligne JSON, au
+fichier de résultats (benchmark-results.jsonl à la racine du projet) avec le
+commit courant : `compare` affiche l'évolution entre les deux dernières exécutions.
+
+Utilisation en ligne de commande :
+    python benchmark.py run [--sizes 1000,10000] [--stages generate_site,manager_load] [--images 100]
+    python benchmark.py compare
+"""
+import os
+import io
+import sys
+import json
+import time
+import queue
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+from datetime import datetime, timedelta
+
+try:
+    import resource  # Absent sous Windows : la mémoire maximale n'est alors pas relevée
+except ImportError:
+    resource = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(PROJECT_ROOT, "benchmark-results.jsonl")
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_IMAGE_COUNT = 100
+DEFAULT_RESOLUTION = (1600, 1200)
+DEFAULT_BACKENDS = ("sqlite", "journal", "json")
+
+# Étapes travaillant sur les images synthétiques ; les autres sur les collections
+IMAGE_STAGES = ("thumbnails", "collection_json", "copy_assets")
+COLLECTION_STAGES = ("generate_site", "manager_load", "manager_sort", "manager_filter", "manager_save")
+
+# Taille des lots du chargement progressif (LOAD_BATCH_SIZE de figurine-manager.py)
+MANAGER_BATCH_SIZE = 2000
+
+# Nombre de modifications unitaires (put) mesurées par moteur de stockage
+PUT_COUNT = 20
+
+# Écart (en proportion) au-delà duquel `compare` signale une régression
+REGRESSION_THRESHOLD = 0.10
+
+# Vocabulaire des données synthétiques
+NAME_WORDS = ("Dragon", "Chevalier", "Gobelin", "Mage", "Golem", "Orc", "Elfe", "Nain", "Vampire",
+              "Squelette", "Troll", "Paladin", "Sorcière", "Minotaure", "Hydre", "Robot", "Pilote",
+              "Marine", "Samouraï", "Pirate")
+NAME_QUALIFIERS = ("rouge", "noir", "ancien", "des glaces", "de feu", "sombre", "royal", "sauvage",
+                   "mécanique", "maudit", "géant", "ailé")
+COMMON_TAGS = ("peint", "28mm", "fantasy", "non peint", "32mm", "sci-fi", "résine", "héros",
+               "monstre", "75mm", "historique", "décor", "horreur", "véhicule", "buste")
+TAG_WEIGHT_EXPONENT = 1.1  # Loi de Zipf : le tag de rang r a un poids 1 / r^1.1
+TAGS_PER_FIGURINE = (0, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 5, 6)
+
+
+# Données synthétiques
+
+def tag_vocabulary(size):
+    """Tags de la collection synthétique : les tags courants puis une longue traîne"""
+    rare_count = max(50, size // 200)
+    return list(COMMON_TAGS) + [f"série {number}" for number in range(1, rare_count + 1)]
+
+
+def synthetic_figurines(size, seed=0):
+    """Génère `size` figurines (dicts) au format de la collection"""
+    rng = random.Random(seed)
+    tags = tag_vocabulary(size)
+    cumulative = []
+    total = 0.0
+    for rank in range(1, len(tags) + 1):
+        total += 1 / rank ** TAG_WEIGHT_EXPONENT
+        cumulative.append(total)
+
+    start = datetime(2020, 1, 1)
+    span = int((datetime(2026, 1, 1) - start).total_seconds())
+    for figurine_id in range(1, size + 1):
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_QUALIFIERS)} {rng.randrange(1, 1000)}"
+        image = f"images/full/{rng.getrandbits(80):020x}.jpg"
+        count = rng.choice(TAGS_PER_FIGURINE)
+        yield {
+            "id": figurine_id,
+            "name": name,
+            "fullImage": image,
+            "thumbnail": image.replace("images/full/", "images/thumbnails/", 1),
+            "tags": list(dict.fromkeys(rng.choices(tags, cum_weights=cumulative, k=count))),
+            "modified_date": (start + timedelta(seconds=rng.randrange(span))).isoformat(),
+            "phash": f"{rng.getrandbits(64):016x}",
+        }
+
+
+def write_collection(path, size):
+    """Écrit une collection synthétique de `size` figurines dans le fichier JSON `path`"""
+    from collection_store import write_json_stream
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_json_stream(path, synthetic_figurines(size))
+
+
+def write_images(folder, count, resolution, seed=0):
+    """Écrit `count` images JPEG synthétiques (dégradé et formes) de la résolution donnée
+
+    Les noms suivent la convention d'import (nom__tag_tag.jpg).
+    """
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    width, height = resolution
+    gradient = Image.linear_gradient("L").resize(resolution)
+    for number in range(count):
+        low = tuple(rng.randrange(128) for _ in range(3))
+        high = tuple(rng.randrange(128, 256) for _ in range(3))
+        image = Image.merge("RGB", [gradient.point(lambda v, a=a, b=b: a + (b - a) * v // 255)
+                                    for a, b in zip(low, high)])
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randrange(width), rng.randrange(height)
+            radius = rng.randrange(width // 20 + 1, width // 4 + 2)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        tags = rng.sample(COMMON_TAGS[:6], 2)
+        filename = f"{rng.choice(NAME_WORDS).lower()}_{number}__{tags[0]}_{tags[1]}.jpg".replace(" ", "-")
+        image.save(os.path.join(folder, filename), quality=90)
+
+
+# Mesures
+
+def current_rss():
+    """Mémoire résidente actuelle du processus en octets (None hors Linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss(who="self"):
+    """Mémoire résidente maximale en octets du processus ("self") ou de ses sous-processus ("children")"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss est en kio sous Linux, en octets sous macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def megabytes(value):
+    return None if value is None else round(value / (1024 * 1024), 1)
+
+
+class StageRun:
+    """Mesures d'une étape, dans le processus qui l'exécute"""
+
+    def __init__(self, stage, size):
+        self.stage = stage
+        self.size = size
+        self.results = []
+
+    def measure(self, label, items, unit, func, *args, **kwargs):
+        """Exécute func(*args, **kwargs) et enregistre sa durée ; renvoie son résultat"""
+        setup_rss = current_rss()
+        start = time.perf_counter()
+        value = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        self.results.append({
+            "stage": label,
+            "size": self.size,
+            "seconds": round(seconds, 4),
+            "items": items,
+            "unit": unit,
+            "throughput": round(items / seconds, 1) if seconds > 0 else None,
+            "setup_rss_mb": megabytes(setup_rss),
+            "peak_rss_mb": megabytes(peak_rss("self")),
+            "children_peak_rss_mb": megabytes(peak_rss("children")),
+        })
+        return value
+
+
+def _fresh_dir(path):
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def stage_thumbnails(run, context):
+    from prepare_data import create_thumbnails
+    output = _fresh_dir(os.path.join(context["run_dir"], "thumbnails"))
+    count = context["image_count"]
+    run.measure("thumbnails", count, "images", create_thumbnails,
+                context["images_dir"], output, workers=context["workers"])
+    run.measure("thumbnails_noop", count, "images", create_thumbnails,
+                context["images_dir"], output, workers=context["workers"])
+
+
+def stage_collection_json(run, context):
+    from prepare_data import create_collection_json
+    images_dir = os.path.join(_fresh_dir(os.path.join(context["run_dir"], "images")), "full")
+    shutil.copytree(context["images_dir"], images_dir)
+    output_json = os.path.join(_fresh_dir(os.path.join(context["run_dir"], "data")), "collection.json")
+    run.measure("collection_json", context["image_count"], "images", create_collection_json,
+                images_dir, output_json, workers=context["workers"])
+
+
+def stage_copy_assets(run, context):
+    from generate_site import copy_assets
+    src_dir = os.path.dirname(context["images_dir"])
+    dest_dir = _fresh_dir(os.path.join(context["run_dir"], "dist"))
+    subdir = os.path.basename(context["images_dir"])
+    # Options du script de génération du site pour les images
+    options = {"verify_hash": True, "fingerprint": True, "url_prefix": "images/"}
+    count = context["image_count"]
+    run.measure("copy_assets", count, "images", copy_assets, src_dir, dest_dir, [subdir], **options)
+    run.measure("copy_assets_noop", count, "images", copy_assets, src_dir, dest_dir, [subdir], **options)
+
+
+def stage_generate_site(run, context):
+    from generate_site import generate_site
+    output_dir = _fresh_dir(os.path.join(context["run_dir"], "site"))
+    run.measure("generate_site", run.size, "figurines", generate_site,
+                os.path.join(PROJECT_ROOT, "src", "template.html"), output_dir, context["collection"])
+
+
+def _open_backend(context, backend):
+    """Stockage `backend` initialisé avec la collection synthétique (copie propre à l'étape)"""
+    from collection_store import open_store, store_path
+    data_dir = _fresh_dir(os.path.join(context["run_dir"], f"data-{backend}"))
+    shutil.copy(context["collection"], os.path.join(data_dir, "collection.json"))
+    return open_store(store_path(data_dir, backend), backend)
+
+
+def _load_manager(store):
+    """Chargement du gestionnaire : lecture par lots, chaque lot ajouté aux index"""
+    from collection_index import CollectionIndex
+    index = CollectionIndex()
+    batch = []
+    for figurine in store.iter_load():
+        batch.append(figurine)
+        if len(batch) >= MANAGER_BATCH_SIZE:
+            index.extend(batch)
+            batch = []
+    index.extend(batch)
+    return index
+
+
+def stage_manager_load(run, context):
+    for backend in context["backends"]:
+        # L'ouverture SQLite importe collection.json (comme après prepare_data.py)
+        store = run.measure(f"store_open[{backend}]", run.size, "figurines", _open_backend, context, backend)
+        try:
+            run.measure(f"manager_load[{backend}]", run.size, "figurines", _load_manager, store)
+        finally:
+            store.close()
+
+
+def stage_manager_sort(run, context):
+    from collection_index import SORT_KEYS, SortedView
+    from collection_store import open_store
+    store = open_store(context["collection"], "json")
+    figurines = list(store.iter_load())
+    for name, key in SORT_KEYS.items():
+        run.measure(f"manager_sort[{name}]", run.size, "figurines", SortedView, key, figurines)
+
+
+def stage_manager_filter(run, context):
+    from collection_index import CollectionIndex
+    from collection_store import open_store
+    store = open_store(context["collection"], "json")
+    index = CollectionIndex(list(store.iter_load()))
+    common, second, rare = COMMON_TAGS[0], COMMON_TAGS[1], tag_vocabulary(run.size)[-1]
+    queries = [f"#{common}", f"#{common} #{second}", f'#{common} OR tag:"{rare}"', f"-#{common}",
+               NAME_WORDS[0].lower(), f"{NAME_WORDS[0].lower()} #{second}"]
+    # Premier filtre : applique les ajouts en attente de l'index des tags
+    run.measure("manager_filter[first]", 1, "requêtes", index.filter, queries[0], "name")
+    run.measure("manager_filter", len(queries), "requêtes",
+                lambda: [index.filter(query, "name") for query in queries])
+
+
+def _put_all(store, figurines):
+    for figurine in figurines:
+        figurine["name"] = figurine.get("name", "") + " (modifié)"
+        store.put(figurine)
+
+
+def stage_manager_save(run, context):
+    for backend in context["backends"]:
+        store = _open_backend(context, backend)
+        try:
+            figurines = list(store.iter_load())
+            run.measure(f"manager_save[{backend}]", run.size, "figurines", store.save_all, figurines)
+            modified = random.Random(0).sample(figurines, min(PUT_COUNT, len(figurines)))
+            run.measure(f"manager_put[{backend}]", len(modified), "figurines", _put_all, store, modified)
+        finally:
+            store.close()
+
+
+STAGES = {
+    "thumbnails": stage_thumbnails,
+    "collection_json": stage_collection_json,
+    "copy_assets": stage_copy_assets,
+    "generate_site": stage_generate_site,
+    "manager_load": stage_manager_load,
+    "manager_sort": stage_manager_sort,
+    "manager_filter": stage_manager_filter,
+    "manager_save": stage_manager_save,
+}
+
+
+def _stage_process(stage, size, context, results):
+    """Point d'entrée du processus d'une étape : exécute l'étape et renvoie ses mesures"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    run = StageRun(stage, size)
+    try:
+        output = contextlib.nullcontext() if context["verbose"] else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            STAGES[stage](run, context)
+    except Exception as e:
+        run.results.append({"stage": stage, "size": size, "error": f"{type(e).__name__}: {e}"})
+    results.put(run.results)
+
+
+def run_stage(stage, size, context):
+    """Exécute une étape dans un nouveau processus (mémoire maximale propre à l'étape)"""
+    mp_context = multiprocessing.get_context("spawn")
+    results = mp_context.Queue()
+    process = mp_context.Process(target=_stage_process, args=(stage, size, context, results))
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                pass
+            if not process.is_alive():
+                # Le processus a pu envoyer ses mesures juste avant de se terminer
+                try:
+                    return results.get(timeout=1)
+                except queue.Empty:
+                    raise RuntimeError(f"L'étape {stage} ({size}) s'est arrêtée sans résultat "
+                                       f"(code de sortie {process.exitcode})") from None
+    finally:
+        process.join()
+
+
+def git_commit():
+    """Commit courant (suivi de "-dirty" si l'arbre de travail est modifié), ou None"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if status else commit
+
+
+def run_benchmarks(stages, sizes, image_count, resolution, backends, workers=None,
+                   results_file=RESULTS_FILE, work_dir=None, verbose=False):
+    """Génère les données, exécute les étapes et ajoute l'exécution au fichier de résultats"""
+    # Un dossier de travail donné est conservé : les données générées y sont réutilisées
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="figurines-benchmark-")
+    context = {"run_dir": os.path.join(work_dir, "run"), "workers": workers,
+               "backends": list(backends), "verbose": verbose}
+    results = []
+    try:
+        image_stages = [stage for stage in stages if stage in IMAGE_STAGES]
+        if image_stages:
+            images_dir = os.path.join(work_dir, f"images-{image_count}-{resolution[0]}x{resolution[1]}", "full")
+            if not os.path.isdir(images_dir):
+                print(f"Génération de {image_count} images {resolution[0]}x{resolution[1]}...")
+                write_images(images_dir, image_count, resolution)
+            for stage in image_stages:
+                results += _report(run_stage(stage, image_count, dict(context, images_dir=images_dir,
+                                                                      image_count=image_count)))
+
+        collection_stages = [stage for stage in stages if stage in COLLECTION_STAGES]
+        for size in sizes if collection_stages else ():
+            collection = os.path.join(work_dir, f"collection-{size}", "collection.json")
+            if not os.path.exists(collection):
+                print(f"Génération d'une collection de {size} figurines...")
+                write_collection(collection, size)
+            for stage in collection_stages:
+                results += _report(run_stage(stage, size, dict(context, collection=collection)))
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    entry = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"sizes": list(sizes), "images": image_count, "resolution": list(resolution),
+                     "backends": list(backends), "workers": workers},
+        "results": results,
+    }
+    with open(results_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"Résultats ajoutés à {results_file}")
+    return entry
+
+
+def _report(measures):
+    for measure in measures:
+        if "error" in measure:
+            print(f"  {measure['stage']:<28} {measure['size']:>8}  ÉCHEC : {measure['error']}")
+        else:
+            peak = measure["peak_rss_mb"]
+            print(f"  {measure['stage']:<28} {measure['size']:>8}  {measure['seconds']:>9.3f} s"
+                  f"  {measure['throughput'] or 0:>12.1f} {measure['unit']}/s"
+                  f"  {'?' if peak is None else peak:>8} Mio")
+    return measures
+
+
+def load_results(results_file=RESULTS_FILE):
+    """Exécutions enregistrées dans le fichier de résultats, de la plus ancienne à la plus récente"""
+    entries = []
+    with open(results_file, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return entries
+
+
+def compare_results(base, current):
+    """Compare deux exécutions : [(étape, taille, durée avant, durée après, écart relatif)]
+
+    Seules les mesures présentes dans les deux exécutions sont comparées.
+    """
+    before = {(m["stage"], m["size"]): m for m in base["results"] if "error" not in m}
+    rows = []
+    for measure in current["results"]:
+        previous = before.get((measure["stage"], measure["size"]))
+        if previous is None or "error" in measure or not previous["seconds"]:
+            continue
+        change = measure["seconds"] / previous["seconds"] - 1
+        rows.append((measure["stage"], measure["size"], previous["seconds"], measure["seconds"], change))
+    return rows
+
+
+def print_comparison(base, current, threshold=REGRESSION_THRESHOLD):
+    print(f"{base.get('commit')} ({base['date']}) → {current.get('commit')} ({current['date']})")
+    regressions = 0
+    for stage, size, before, after, change in compare_results(base, current):
+        flag = ""
+        if change > threshold:
+            flag = "  ← plus lent"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  plus rapide"
+        print(f"  {stage:<28} {size:>8}  {before:>9.3f} s → {after:>9.3f} s  {change:+7.1%}{flag}")
+    return regressions
+
+
+def parse_resolution(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Mesures de performance de la chaîne de traitement")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="exécute les mesures et ajoute les résultats au fichier")
+    run.add_argument("--stages", default=",".join(STAGES), help="étapes à mesurer (séparées par des virgules)")
+    run.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="tailles des collections synthétiques")
+    run.add_argument("--images", type=int, default=DEFAULT_IMAGE_COUNT, help="nombre d'images synthétiques")
+    run.add_argument("--resolution", type=parse_resolution, default=DEFAULT_RESOLUTION,
+                     help="résolution des images synthétiques (LARGEURxHAUTEUR)")
+    run.add_argument("--backends", default=",".join(DEFAULT_BACKENDS), help="moteurs de stockage mesurés")
+    run.add_argument("--workers", type=int, default=None, help="processus de travail (images)")
+    run.add_argument("--work-dir", default=None, help="dossier des données générées (conservé s'il existe)")
+    run.add_argument("--output", default=RESULTS_FILE, help="fichier de résultats (JSON, une exécution par ligne)")
+    run.add_argument("--verbose", action="store_true", help="affiche la sortie des étapes")
+
+    compare = commands.add_parser("compare", help="compare les deux dernières exécutions")
+    compare.add_argument("--output", default=RESULTS_FILE, help="fichier de résultats")
+    compare.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                         help="écart signalé comme régression (0.1 = 10 %%)")
+
+    args = parser.parse_args(argv[1:])
+    if args.command == "compare":
+        entries = load_results(args.output)
+        if len(entries) < 2:
+            print("Il faut au moins deux exécutions pour comparer.")
+            return 1
+        return 1 if print_comparison(entries[-2], entries[-1], args.threshold) else 0
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"étape(s) inconnue(s) : {', '.join(unknown)}")
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    entry = run_benchmarks(stages, [int(size) for size in args.sizes.split(",") if size], args.images,
+                           args.resolution, [backend for backend in args.backends.split(",") if backend],
+                           args.workers, args.output, args.work_dir, args.verbose)
+    return 1 if any("error" in measure for measure in entry["results"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
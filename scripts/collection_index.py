@@ -0,0 +1,226 @@
+# coding: utf-8
+"""Index de la collection maintenus au fil des ajouts, modifications et suppressions"""
+import locale
+from bisect import bisect_left, insort
+from image_hash import ImageHashIndex, hex_to_hash
+from figurine_record import parse_timestamp
+from tag_query import TagQueryIndex, bitmap_keys
+
+
+def name_sort_key(figurine):
+    """Clé de tri par nom : insensible à la casse et conforme à la langue (LC_COLLATE)"""
+    return locale.strxfrm(figurine.get("name", "").casefold())
+
+
+def date_sort_key(figurine):
+    """Clé de tri par date de modification : horodatage numérique (les figurines sans date en premier)"""
+    modified = getattr(figurine, "modified", None)  # Déjà converti dans un FigurineRecord
+    if modified is None:
+        modified = parse_timestamp(figurine.get("modified_date", ""))
+    return float("-inf") if modified is None else modified
+
+
+# Vues triées tenues par défaut par CollectionIndex
+SORT_KEYS = {
+    "name": name_sort_key,
+    "date": date_sort_key,
+}
+
+
+class SortedView:
+    """Figurines triées selon une clé calculée une seule fois par figurine.
+
+    Les ajouts et suppressions se font par recherche dichotomique ; à clé égale,
+    l'id départage. La vue se lit dans un sens ou dans l'autre sans être retriée.
+    """
+
+    def __init__(self, key_func, figurines=()):
+        self.key_func = key_func
+        # Construction initiale par un seul tri plutôt que par insertions successives
+        entries = sorted(
+            ((key_func(figurine), figurine.get("id", 0)), figurine) for figurine in figurines
+        ) if figurines else []
+        self.keys = [key for key, _ in entries]
+        self.figurines = [figurine for _, figurine in entries]
+        self.key_by_id = {key[1]: key for key in self.keys}
+
+    def __len__(self):
+        return len(self.figurines)
+
+    def add(self, figurine):
+        """Insère une figurine à sa place et renvoie sa position"""
+        key = (self.key_func(figurine), figurine.get("id", 0))
+        self.key_by_id[key[1]] = key
+        position = bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.figurines.insert(position, figurine)
+        return position
+
+    def extend(self, figurines):
+        """Ajoute un lot de figurines : le lot est trié puis fusionné avec la vue.
+
+        La fusion recopie la vue par tranches (une recherche dichotomique par
+        figurine du lot) : aucune paire n'est allouée par figurine déjà présente,
+        le chargement par lots d'une grande collection reste linéaire.
+        """
+        added = sorted(((self.key_func(figurine), figurine.get("id", 0)), figurine) for figurine in figurines)
+        keys, merged = [], []
+        start = 0
+        for key, figurine in added:
+            self.key_by_id[key[1]] = key
+            position = bisect_left(self.keys, key, start)
+            keys += self.keys[start:position]
+            merged += self.figurines[start:position]
+            keys.append(key)
+            merged.append(figurine)
+            start = position
+        keys += self.keys[start:]
+        merged += self.figurines[start:]
+        self.keys = keys
+        self.figurines = merged
+
+    def remove(self, figurine):
+        """Retire une figurine (avec la clé calculée à son ajout) et renvoie son ancienne position"""
+        position = self.position(figurine)
+        del self.keys[position]
+        del self.figurines[position]
+        del self.key_by_id[figurine.get("id", 0)]
+        return position
+
+    def position(self, figurine):
+        """Position de la figurine dans la vue (ordre croissant)"""
+        return bisect_left(self.keys, self.key_by_id[figurine.get("id", 0)])
+
+    def get(self, position, reverse=False):
+        """Figurine à la position donnée, en ordre croissant ou décroissant"""
+        return self.figurines[len(self.figurines) - 1 - position if reverse else position]
+
+
+class CollectionIndex:
+    """Index nom → figurines, id → figurine, allocation des id, tags et images → nombre d'utilisations.
+
+    L'index tient aussi une vue triée (SortedView) par clé de `sort_keys`.
+    Une figurine modifiée doit être retirée de l'index avant la modification
+    (`remove`) puis ajoutée à nouveau (`add`) : chaque opération ne coûte
+    qu'une recherche dichotomique par vue et le nombre de tags de la figurine.
+    """
+
+    def __init__(self, figurines=(), sort_keys=None):
+        self.views = {}
+        self.by_id = {}
+        self.by_name = {}
+        self.tag_counts = {}
+        self.tags = []  # Tags triés, tenus à jour par insertion dichotomique
+        self.tags_version = 0  # Incrémenté quand la liste des tags change
+        self.image_counts = {}  # Image (fullImage) → nombre de figurines qui l'utilisent
+        self.image_hashes = ImageHashIndex()  # Empreintes perceptuelles ("phash") → figurines
+        self.query = TagQueryIndex()  # Bitmaps des tags et noms triés, par id (filtres)
+        self.next_id = 1
+        for figurine in figurines:
+            self.add(figurine)
+        self.views = {name: SortedView(key, figurines) for name, key in (sort_keys or SORT_KEYS).items()}
+
+    def add(self, figurine):
+        """Ajoute une figurine aux index"""
+        figurine_id = figurine.get("id", 0)
+        self.by_id[figurine_id] = figurine
+        if figurine_id >= self.next_id:
+            self.next_id = figurine_id + 1
+
+        self.by_name.setdefault(figurine.get("name"), []).append(figurine)
+        for view in self.views.values():
+            view.add(figurine)
+        self.query.add(figurine_id, figurine.get("tags", []), figurine.get("name", ""))
+
+        image = figurine.get("fullImage")
+        if image:
+            self.image_counts[image] = self.image_counts.get(image, 0) + 1
+        if figurine.get("phash"):
+            self.image_hashes.add(hex_to_hash(figurine["phash"]), figurine)
+
+        for tag in set(figurine.get("tags", [])):
+            count = self.tag_counts.get(tag, 0)
+            self.tag_counts[tag] = count + 1
+            if count == 0:
+                insort(self.tags, tag)
+                self.tags_version += 1
+
+    def extend(self, figurines):
+        """Ajoute un lot de figurines aux index (chargement progressif de la collection)"""
+        figurines = list(figurines)
+        views, self.views = self.views, {}
+        try:
+            for figurine in figurines:
+                self.add(figurine)
+        finally:
+            self.views = views
+        for view in views.values():
+            view.extend(figurines)
+
+    def remove(self, figurine):
+        """Retire une figurine des index"""
+        if self.by_id.get(figurine.get("id", 0)) is figurine:
+            del self.by_id[figurine.get("id", 0)]
+            for view in self.views.values():
+                view.remove(figurine)
+            self.query.remove(figurine.get("id", 0), figurine.get("tags", []), figurine.get("name", ""))
+
+        name = figurine.get("name")
+        same_name = self.by_name.get(name, [])
+        for position, candidate in enumerate(same_name):
+            if candidate is figurine:
+                del same_name[position]
+                break
+        if not same_name:
+            self.by_name.pop(name, None)
+
+        image = figurine.get("fullImage")
+        if image in self.image_counts:
+            if self.image_counts[image] > 1:
+                self.image_counts[image] -= 1
+            else:
+                del self.image_counts[image]
+        if figurine.get("phash"):
+            self.image_hashes.remove(hex_to_hash(figurine["phash"]), figurine)
+
+        for tag in set(figurine.get("tags", [])):
+            count = self.tag_counts.get(tag, 0) - 1
+            if count > 0:
+                self.tag_counts[tag] = count
+            elif tag in self.tag_counts:
+                del self.tag_counts[tag]
+                del self.tags[bisect_left(self.tags, tag)]
+                self.tags_version += 1
+
+    def contains(self, figurine):
+        """Indique si cette figurine (et non une copie) fait partie de la collection"""
+        return self.by_id.get(figurine.get("id", 0)) is figurine
+
+    def find_by_name(self, name, exclude=None):
+        """Renvoie une figurine portant ce nom, autre que `exclude`, ou None"""
+        for figurine in self.by_name.get(name, []):
+            if figurine is not exclude:
+                return figurine
+        return None
+
+    def image_references(self, image):
+        """Nombre de figurines de la collection dont l'image (fullImage) est `image`"""
+        return self.image_counts.get(image, 0)
+
+    def similar_images(self, phash, exclude=None):
+        """Figurines dont l'image est presque identique à l'empreinte `phash`: [(distance, figurine)]"""
+        return [(distance, figurine) for distance, figurine in self.image_hashes.search(hex_to_hash(phash))
+                if figurine is not exclude]
+
+    def filter(self, query, view_name, reverse=False):
+        """Figurines répondant à la requête `query` (voir tag_query), dans l'ordre de la vue `view_name`"""
+        view = self.views[view_name]
+        ids = bitmap_keys(self.query.query(query))
+        ids.sort(key=view.key_by_id.__getitem__, reverse=reverse)
+        return [self.by_id[figurine_id] for figurine_id in ids]
+
+    def allocate_id(self):
+        """Réserve et renvoie le prochain id libre (les id supprimés ne sont pas réutilisés)"""
+        figurine_id = self.next_id
+        self.next_id += 1
+        return figurine_id
@@ -0,0 +1,114 @@
+# coding: utf-8
+"""Lecture et écriture rapides des fichiers JSON de la collection
+
+Le module orjson est utilisé s'il est installé (pip install orjson), sinon le
+module json standard. `iter_figurines` lit un fichier de collection figurine par
+figurine, sans jamais le charger entièrement.
+"""
+import re
+import json
+
+try:
+    import orjson  # Optionnel : analyse et écriture JSON plusieurs fois plus rapides
+except ImportError:
+    orjson = None
+
+# Taille des blocs lus par l'analyseur incrémental
+CHUNK_SIZE = 1024 * 1024
+
+# Première ligne des fichiers écrits une figurine par ligne (voir collection_store.write_json_stream)
+LINES_HEADER = '{"figurines": ['
+
+FIGURINES_ARRAY = re.compile(r'"figurines"\s*:\s*\[')
+
+
+def loads(data):
+    """Analyse un texte (ou des octets) JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_json_value(obj):
+    """Conversion des objets que le module JSON ne sait pas écrire (figurine_record.FigurineRecord)"""
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Type non sérialisable en JSON: {type(obj).__name__}")
+
+
+def dumps(obj):
+    """Sérialise en JSON compact, caractères non ASCII conservés"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=to_json_value).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, default=to_json_value)
+
+
+def load_json(path):
+    """Charge un fichier JSON entier"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def iter_figurines(path, chunk_size=CHUNK_SIZE):
+    """Produit les figurines d'un fichier de collection une à une
+
+    Les fichiers écrits une figurine par ligne sont lus ligne à ligne ; les autres
+    (JSON indenté historique) sont analysés par blocs avec un décodeur incrémental.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if f.readline().strip() == LINES_HEADER:
+            for line in f:
+                line = line.strip()
+                if line.startswith("]"):
+                    return
+                if line:
+                    yield loads(line[:-1] if line.endswith(",") else line)
+            return
+        f.seek(0)
+        yield from _iter_array(f, chunk_size)
+
+
+def _iter_array(f, chunk_size):
+    """Analyse incrémentale du tableau "figurines" d'un fichier JSON quelconque"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def refill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    # Début du tableau des figurines
+    while True:
+        match = FIGURINES_ARRAY.search(buffer)
+        if match:
+            position = match.end()
+            break
+        if eof:
+            return
+        refill()
+
+    while True:
+        # Séparateurs entre deux figurines
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            refill()
+        if position >= len(buffer) or buffer[position] == "]":
+            return
+
+        try:
+            figurine, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            refill()  # Figurine coupée par la fin du bloc : lire la suite
+            continue
+        position = end
+        yield figurine
@@ -0,0 +1,634 @@
+# coding: utf-8
+"""Stockage de la collection de figurines (JSON, JSON journalisé ou SQLite)
+
+Le moteur est choisi par la variable d'environnement FIGURINES_STORE
+("sqlite" par défaut, "journal" ou "json"). Le fichier data/collection.json reste le
+format d'échange : la base SQLite l'importe lorsqu'il a été modifié par un autre
+outil (prepare_data.py par exemple) et peut le réécrire avec `export_json`.
+
+Les figurines chargées sont des FigurineRecord (voir figurine_record.py).
+Les fichiers JSON sont écrits une figurine par ligne (compact, lisible par
+morceaux) ; FIGURINES_JSON_LAYOUT=indented rétablit l'ancienne mise en forme indentée.
+
+Utilisation en ligne de commande :
+    python collection_store.py export ../data/collection.json
+"""
+import os
+import sys
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime
+import tracing
+from collection_io import dumps, loads, load_json, iter_figurines, to_json_value
+from figurine_record import FigurineRecord
+
+DEFAULT_BACKEND = "sqlite"
+STORE_FILES = {
+    "json": "collection.json",
+    "journal": "collection.json",
+    "sqlite": "collection.db",
+}
+
+# Mise en forme des fichiers JSON : "lines" (une figurine par ligne) ou "indented"
+DEFAULT_JSON_LAYOUT = "lines"
+JSON_LAYOUTS = ("lines", "indented")
+
+# Nombre de figurines lues à la fois par iter_load (SQLite)
+LOAD_BATCH_SIZE = 1000
+
+# Le journal est compacté dans un nouvel instantané au-delà de ces seuils
+JOURNAL_COMPACT_OPERATIONS = 500
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+# Erreurs pouvant être levées par les différents moteurs
+STORE_ERRORS = (OSError, ValueError, sqlite3.Error)
+
+
+def fsync_directory(path):
+    """Rend durable un renommage dans le dossier `path` (sans effet sous Windows)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def json_layout():
+    """Mise en forme des fichiers JSON choisie par la variable d'environnement FIGURINES_JSON_LAYOUT"""
+    layout = os.environ.get("FIGURINES_JSON_LAYOUT", DEFAULT_JSON_LAYOUT)
+    if layout not in JSON_LAYOUTS:
+        raise ValueError(f"Mise en forme JSON inconnue: {layout}")
+    return layout
+
+
+def write_json_atomic(path, figurines, generation=None, layout=None):
+    """Écrit la collection dans un fichier temporaire puis le renomme : un arrêt brutal ne tronque jamais le fichier"""
+    if (layout or json_layout()) == "lines":
+        write_json_stream(path, figurines, generation)
+        return
+
+    data = {"figurines": figurines}
+    if generation:
+        data["generation"] = generation
+
+    tmp_path = path + ".tmp"
+    with tracing.span("collection.write", file=os.path.basename(path)), open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False, default=to_json_value)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+@tracing.traced("collection.write")
+def write_json_stream(path, figurines, generation=None):
+    """Comme write_json_atomic, mais écrit les figurines au fur et à mesure (une par ligne)
+
+    `figurines` peut être un générateur : la collection n'a jamais besoin d'être
+    entièrement en mémoire. Le fichier reste au format JSON habituel, et se relit
+    ligne à ligne (collection_io.iter_figurines).
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('{"figurines": [')
+        separator = "\n"
+        for figurine in figurines:
+            f.write(separator)
+            f.write(dumps(figurine))
+            separator = ",\n"
+        f.write("\n]")
+        if generation:
+            f.write(f', "generation": {dumps(generation)}')
+        f.write("}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def journal_path(path):
+    """Chemin du journal associé à un instantané JSON"""
+    return os.path.splitext(path)[0] + ".journal"
+
+
+class JsonCollectionStore:
+    """Collection stockée dans un seul fichier JSON, réécrit entièrement à chaque modification"""
+
+    def __init__(self, path):
+        self.path = path
+        self.figurines = []
+
+    @tracing.traced("collection.read")
+    def load(self):
+        """Renvoie la liste des figurines"""
+        return list(self.iter_load())
+
+    def iter_load(self):
+        """Produit les figurines (FigurineRecord) au fur et à mesure de la lecture du fichier"""
+        self.figurines = []
+        if os.path.exists(self.path):
+            for values in iter_figurines(self.path):
+                figurine = FigurineRecord(values)
+                self.figurines.append(figurine)
+                yield figurine
+
+    def put(self, figurine):
+        """Ajoute ou met à jour une figurine (identifiée par son id)"""
+        for index, existing in enumerate(self.figurines):
+            if existing.get("id") == figurine.get("id"):
+                self.figurines[index] = figurine
+                break
+        else:
+            self.figurines.append(figurine)
+        write_json_atomic(self.path, self.figurines)
+
+    def delete(self, figurine_id):
+        """Supprime une figurine"""
+        self.figurines = [f for f in self.figurines if f.get("id") != figurine_id]
+        write_json_atomic(self.path, self.figurines)
+
+    def save_all(self, figurines):
+        """Remplace toute la collection"""
+        self.figurines = list(figurines)
+        write_json_atomic(self.path, self.figurines)
+
+    def export_json(self, path):
+        """Exporte la collection au format JSON historique"""
+        write_json_atomic(path, self.load())
+
+    def close(self):
+        pass
+
+
+class JournaledJsonStore:
+    """Instantané JSON accompagné d'un journal des modifications, en ajout seul.
+
+    Chaque ajout, mise à jour ou suppression est une ligne JSON ajoutée au
+    journal puis synchronisée sur disque (fsync). Au-delà de quelques centaines
+    d'opérations, un thread compacte le journal dans un nouvel instantané
+    (fichier temporaire puis renommage). Le chargement relit l'instantané puis
+    rejoue le journal.
+
+    L'instantané porte une génération, que la première ligne du journal répète :
+    un journal qui ne correspond plus à l'instantané (réécrit par prepare_data.py
+    par exemple) est ignoré. Pendant un compactage, l'ancien journal est renommé
+    en `.compacting` et le nouveau journal indique la génération précédente
+    (`base`), ce qui permet de reprendre après un arrêt brutal.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = journal_path(path)
+        self.compacting_path = self.journal_path + ".compacting"
+        self.records = {}
+        self.generation = None
+        self.loaded = False
+        self.journal = None
+        self.operations = 0
+        self.needs_compaction = False
+        self.lock = threading.Lock()
+        self.compaction_thread = None
+
+    @staticmethod
+    def _read_journal(path):
+        """Renvoie (en-tête, opérations) d'un journal ; une dernière ligne tronquée est ignorée"""
+        if not os.path.exists(path):
+            return None, []
+        header = None
+        operations = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if header is None:
+                    header = entry
+                else:
+                    operations.append(entry)
+        return header, operations
+
+    def _apply(self, operation):
+        if operation["op"] == "put":
+            record = FigurineRecord.from_dict(operation["record"])
+            self.records[record["id"]] = record
+        elif operation["op"] == "delete":
+            self.records.pop(operation["id"], None)
+
+    @tracing.traced("collection.read")
+    def load(self):
+        """Renvoie la liste des figurines (instantané + journal)"""
+        data = load_json(self.path) if os.path.exists(self.path) else {}
+        self.generation = data.get("generation")
+        self.records = {figurine.get("id"): FigurineRecord(figurine) for figurine in data.get("figurines", [])}
+
+        # Journal mis de côté par un compactage interrompu
+        compacting_header, compacting_ops = self._read_journal(self.compacting_path)
+        recovered = bool(self.generation) and compacting_header is not None \
+            and compacting_header.get("generation") == self.generation
+        if recovered:
+            for operation in compacting_ops:
+                self._apply(operation)
+
+        header, operations = self._read_journal(self.journal_path)
+        journal_valid = bool(self.generation) and header is not None and (
+            header.get("generation") == self.generation
+            or (recovered and header.get("base") == self.generation)
+        )
+        if journal_valid:
+            for operation in operations:
+                self._apply(operation)
+            self.operations = len(operations)
+
+        # Repartir d'un instantané propre après un compactage interrompu, un
+        # journal obsolète ou un instantané écrit par un autre outil
+        self.needs_compaction = (
+            compacting_header is not None
+            or not self.generation
+            or (header is not None and not journal_valid)
+        )
+        self.loaded = True
+        return [figurine.copy() for figurine in self.records.values()]
+
+    def iter_load(self):
+        """Produit les figurines (le journal doit être rejoué : tout est chargé avant la première)"""
+        yield from self.load()
+
+    def _start_journal(self, generation, base=None):
+        """Crée un journal vide pour l'instantané de génération `generation`"""
+        header = {"generation": generation}
+        if base:
+            header["base"] = base
+        journal = open(self.journal_path, 'w', encoding='utf-8')
+        journal.write(json.dumps(header) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+        return journal
+
+    def _wait_for_compaction(self):
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+            self.compaction_thread = None
+
+    def _write_snapshot(self, generation, figurines):
+        """Écrit l'instantané puis supprime le journal qu'il remplace"""
+        write_json_atomic(self.path, figurines, generation=generation)
+        if os.path.exists(self.compacting_path):
+            os.remove(self.compacting_path)
+
+    def _compact_now(self):
+        """Écrit immédiatement un instantané complet et repart d'un journal vide (appelé sous verrou)"""
+        self._wait_for_compaction()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+        generation = uuid.uuid4().hex
+        self._write_snapshot(generation, list(self.records.values()))
+        self.journal = self._start_journal(generation)
+        self.generation = generation
+        self.operations = 0
+        self.needs_compaction = False
+
+    def _open_journal(self):
+        """Ouvre le journal en ajout, en le remettant d'aplomb si nécessaire (appelé sous verrou)"""
+        if self.journal is not None:
+            return
+        if not self.loaded:
+            self.load()
+        if self.needs_compaction:
+            self._compact_now()
+        elif os.path.exists(self.journal_path):
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        else:
+            self.journal = self._start_journal(self.generation)
+
+    def _append(self, operation):
+        with self.lock:
+            self._open_journal()
+            self._apply(operation)
+            self.journal.write(dumps(operation) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.operations += 1
+            journal_size = self.journal.tell()
+
+        if self.operations >= JOURNAL_COMPACT_OPERATIONS or journal_size >= JOURNAL_COMPACT_BYTES:
+            self.compact()
+
+    def put(self, figurine):
+        """Ajoute ou met à jour une figurine (identifiée par son id)"""
+        # Copie : les modifications ultérieures de la figurine de l'appelant ne doivent pas atteindre l'instantané
+        self._append({"op": "put", "record": FigurineRecord(figurine)})
+
+    def delete(self, figurine_id):
+        """Supprime une figurine"""
+        self._append({"op": "delete", "id": figurine_id})
+
+    def compact(self):
+        """Compacte le journal dans un nouvel instantané, écrit par un thread en arrière-plan"""
+        with self.lock:
+            if self.journal is None or (self.compaction_thread is not None and self.compaction_thread.is_alive()):
+                return
+
+            # Le journal courant est mis de côté ; les opérations suivantes vont dans un journal neuf
+            base = self.generation
+            generation = uuid.uuid4().hex
+            figurines = list(self.records.values())
+            self.journal.close()
+            os.replace(self.journal_path, self.compacting_path)
+            self.journal = self._start_journal(generation, base)
+            self.generation = generation
+            self.operations = 0
+
+            self.compaction_thread = threading.Thread(
+                target=self._write_snapshot,
+                args=(generation, figurines),
+                name="journal-compaction",
+            )
+            self.compaction_thread.start()
+
+    def save_all(self, figurines):
+        """Remplace toute la collection"""
+        with self.lock:
+            self.records = {figurine.get("id"): FigurineRecord(figurine) for figurine in figurines}
+            self.loaded = True
+            self._compact_now()
+
+    def export_json(self, path):
+        """Exporte la collection au format JSON historique"""
+        if not self.loaded:
+            self.load()
+        write_json_atomic(path, list(self.records.values()))
+
+    def close(self):
+        """Attend la fin d'un compactage en cours puis ferme le journal"""
+        with self.lock:
+            self._wait_for_compaction()
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+
+class SqliteCollectionStore:
+    """Collection stockée dans une base SQLite : chaque modification est une transaction sur un seul enregistrement"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS figurines (
+            id INTEGER PRIMARY KEY,
+            position INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            modified_date TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_figurines_name ON figurines(name);
+        CREATE INDEX IF NOT EXISTS idx_figurines_modified_date ON figurines(modified_date);
+        CREATE INDEX IF NOT EXISTS idx_figurines_position ON figurines(position);
+
+        CREATE TABLE IF NOT EXISTS figurine_tags (
+            figurine_id INTEGER NOT NULL REFERENCES figurines(id) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (figurine_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS idx_figurine_tags_tag ON figurine_tags(tag);
+
+        -- Figurines supprimées depuis la dernière synchronisation avec le fichier JSON
+        CREATE TABLE IF NOT EXISTS deleted_figurines (
+            id INTEGER PRIMARY KEY
+        );
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # WAL : les écritures sont atomiques et n'interrompent pas les lectures
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+
+    @tracing.traced("collection.read")
+    def load(self):
+        """Renvoie la liste des figurines, dans l'ordre d'insertion"""
+        rows = self.conn.execute("SELECT data FROM figurines ORDER BY position")
+        return [FigurineRecord(loads(data)) for (data,) in rows]
+
+    def iter_load(self, batch_size=LOAD_BATCH_SIZE):
+        """Produit les figurines par lots, dans l'ordre d'insertion.
+
+        La lecture utilise sa propre connexion, ouverte au premier élément demandé :
+        le générateur peut donc être parcouru depuis un autre thread.
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute("SELECT data FROM figurines ORDER BY position")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for (data,) in rows:
+                    yield FigurineRecord(loads(data))
+        finally:
+            conn.close()
+
+    def _put(self, figurine, position=None):
+        figurine_id = figurine["id"]
+        self.conn.execute(
+            """
+            INSERT INTO figurines (id, position, name, modified_date, data)
+            VALUES (?, COALESCE(?, (SELECT COALESCE(MAX(position), 0) + 1 FROM figurines)), ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name = excluded.name,
+                modified_date = excluded.modified_date,
+                data = excluded.data
+            """,
+            (
+                figurine_id,
+                position,
+                figurine.get("name", ""),
+                figurine.get("modified_date"),
+                dumps(figurine),
+            ),
+        )
+        self.conn.execute("DELETE FROM figurine_tags WHERE figurine_id = ?", (figurine_id,))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO figurine_tags (figurine_id, tag) VALUES (?, ?)",
+            [(figurine_id, tag) for tag in figurine.get("tags", [])],
+        )
+
+    def put(self, figurine):
+        """Ajoute ou met à jour une figurine (identifiée par son id)"""
+        with self.conn:
+            self._put(figurine)
+            self.conn.execute("DELETE FROM deleted_figurines WHERE id = ?", (figurine["id"],))
+
+    def delete(self, figurine_id):
+        """Supprime une figurine (notée comme supprimée jusqu'à la prochaine synchronisation)"""
+        with self.conn:
+            self.conn.execute("DELETE FROM figurines WHERE id = ?", (figurine_id,))
+            self.conn.execute("INSERT OR IGNORE INTO deleted_figurines (id) VALUES (?)", (figurine_id,))
+
+    @tracing.traced("collection.write")
+    def save_all(self, figurines):
+        """Remplace toute la collection"""
+        with self.conn:
+            self.conn.execute("DELETE FROM figurines")
+            for position, figurine in enumerate(figurines, start=1):
+                self._put(figurine, position)
+            self.conn.execute("DELETE FROM deleted_figurines WHERE id IN (SELECT id FROM figurines)")
+
+    def is_empty(self):
+        return self.conn.execute("SELECT 1 FROM figurines LIMIT 1").fetchone() is None
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _json_version(json_path):
+        """Identifie l'état du fichier JSON et de son éventuel journal"""
+        version = []
+        for path in (json_path, journal_path(json_path)):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                version.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+        return "/".join(version)
+
+    def _mark_synced(self, json_path):
+        self.set_meta("json_version", self._json_version(json_path))
+        self.set_meta("synced_at", datetime.now().isoformat())
+
+    def sync_from_json(self, json_path):
+        """Importe le fichier JSON s'il a été modifié depuis le dernier import ou export
+
+        Les modifications faites dans la base depuis ne sont pas écrasées : une
+        figurine dont la date de modification est plus récente dans la base que
+        dans le fichier garde sa version de la base, une figurine ajoutée dans
+        la base depuis la dernière synchronisation est conservée et une figurine
+        supprimée de la base depuis n'est pas réimportée.
+        """
+        if not os.path.exists(json_path):
+            return False
+        version = self._json_version(json_path)
+        if self.get_meta("json_version") == version:
+            return False
+
+        json_store = open_store(json_path)
+        try:
+            figurines = json_store.load()
+        finally:
+            json_store.close()
+        deleted = {figurine_id for (figurine_id,) in self.conn.execute("SELECT id FROM deleted_figurines")}
+        self.save_all(self._merge_newer_rows(figurines, deleted))
+        # Tant que le fichier contient les figurines supprimées, elles restent notées comme telles
+        still_listed = deleted & {figurine.get("id") for figurine in figurines}
+        with self.conn:
+            self.conn.execute("DELETE FROM deleted_figurines")
+            self.conn.executemany("INSERT INTO deleted_figurines (id) VALUES (?)",
+                                  [(figurine_id,) for figurine_id in still_listed])
+        self._mark_synced(json_path)
+        return True
+
+    def _merge_newer_rows(self, figurines, deleted=()):
+        """Figurines du fichier JSON, remplacées ou complétées par les figurines plus récentes de la base"""
+        synced_at = self.get_meta("synced_at") or ""
+        current = {figurine.get("id"): figurine for figurine in self.load()}
+        merged = []
+        for figurine in figurines:
+            row = current.pop(figurine.get("id"), None)
+            if row is None and figurine.get("id") in deleted:
+                continue
+            if row is not None and (row.get("modified_date") or "") > (figurine.get("modified_date") or ""):
+                figurine = row
+            merged.append(figurine)
+        # Les autres figurines de la base ont été supprimées du fichier, ou ajoutées depuis
+        merged.extend(row for row in current.values() if (row.get("modified_date") or "") > synced_at)
+        return merged
+
+    def export_json(self, path):
+        """Exporte la collection au format JSON historique"""
+        write_json_atomic(path, self.load())
+        if os.path.basename(path) == STORE_FILES["json"] and not os.path.exists(journal_path(path)):
+            # Le fichier JSON reflète désormais les suppressions
+            with self.conn:
+                self.conn.execute("DELETE FROM deleted_figurines")
+            self._mark_synced(path)
+
+    def close(self):
+        self.conn.close()
+
+
+STORE_BACKENDS = {
+    "json": JsonCollectionStore,
+    "journal": JournaledJsonStore,
+    "sqlite": SqliteCollectionStore,
+}
+
+
+def store_backend():
+    """Moteur de stockage choisi par la variable d'environnement FIGURINES_STORE"""
+    backend = os.environ.get("FIGURINES_STORE", DEFAULT_BACKEND)
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Moteur de stockage inconnu: {backend}")
+    return backend
+
+
+def store_path(data_dir, backend=None):
+    """Chemin du fichier de stockage dans `data_dir` pour le moteur demandé"""
+    return os.path.join(data_dir, STORE_FILES[backend or store_backend()])
+
+
+def open_store(path, backend=None):
+    """Ouvre le stockage `path` avec le moteur demandé.
+
+    Sans moteur explicite, il est déduit du fichier : .db pour SQLite, .json
+    pour JSON (journalisé si un journal l'accompagne).
+    """
+    if backend is None:
+        if path.endswith(".db"):
+            backend = "sqlite"
+        elif os.path.exists(journal_path(path)):
+            backend = "journal"
+        else:
+            backend = "json"
+
+    store = STORE_BACKENDS[backend](path)
+    if backend == "sqlite":
+        store.sync_from_json(os.path.join(os.path.dirname(path), STORE_FILES["json"]))
+    return store
+
+
+def main(argv):
+    if len(argv) != 3 or argv[1] != "export":
+        print("Usage: python collection_store.py export <fichier.json>")
+        return 1
+
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    backend = store_backend()
+    store = open_store(store_path(data_dir, backend), backend)
+    try:
+        store.export_json(argv[2])
+    finally:
+        store.close()
+    print(f"Collection exportée dans {argv[2]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
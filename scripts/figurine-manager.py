@@ -1,11 +1,48 @@
 import os
-import json
-import shutil
+import sys
+import time
+import locale
+import queue
+import threading
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import ImageTk
+from image_loader import PreviewCache
+from collection_store import open_store, store_backend, store_path, STORE_ERRORS
+from collection_index import CollectionIndex
+from figurine_record import FigurineRecord
+from tag_query import QuerySyntaxError, parse_query
+from prepare_data import import_image
+import tracing
+from virtual_list import VirtualListbox
 from datetime import datetime  # Ajouter en haut du fichier
 
+# Nombre d'imports d'images traités en parallèle
+IMPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Intervalle (ms) de vérification des imports terminés
+IMPORT_POLL_INTERVAL = 100
+
+# Chargement de la collection en arrière-plan : figurines par lot et intervalle (ms) d'ajout à la liste
+LOAD_BATCH_SIZE = 2000
+LOAD_POLL_INTERVAL = 50
+
+# Délai (ms) après la dernière frappe avant d'appliquer le filtre
+FILTER_DELAY = 150
+
+# Taille des prévisualisations et mémoire maximale de leur cache
+PREVIEW_SIZE = (300, 300)
+PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+# Critères de tri proposés : vue triée de l'index et sens de lecture
+SORT_MODES = {
+    "Nom (A-Z)": ("name", False),
+    "Nom (Z-A)": ("name", True),
+    "Plus récent": ("date", True),
+    "Plus ancien": ("date", False),
+}
+
 class FigurineManager:
     def __init__(self, root):
         self.root = root
@@ -26,52 +63,161 @@ class FigurineManager:
         os.makedirs(self.thumbnails_dir, exist_ok=True)
         os.makedirs(self.full_images_dir, exist_ok=True)
         
-        # Chemin du fichier JSON
-        self.collection_file = os.path.join(self.data_dir, "collection.json")
+        # Stockage de la collection (SQLite par défaut, voir collection_store.py)
+        self.store_backend = store_backend()
+        self.collection_file = store_path(self.data_dir, self.store_backend)
+        self.store = None
         
-        # Charger la collection
-        self.collection = self.load_collection()
+        # Collection remplie par lots pendant le chargement (voir load_collection) :
+        # id → figurine, dans l'ordre du stockage (ajout et suppression en temps constant)
+        self.collection = {}
+        self.index = CollectionIndex()
+        self.loading = False
+        self.load_queue = queue.Queue()
         
         # Variables
         self.current_figurine = None
         self.selected_image_path = None
         self.all_tags = self.extract_all_tags()
+        self.all_tags_version = self.index.tags_version
+        
+        # Vue triée affichée dans la liste (la collection stockée n'est jamais réordonnée)
+        self.sort_view, self.sort_reverse = SORT_MODES["Nom (A-Z)"]
+        
+        # Filtre de la liste (requête tag_query) et figurines qui y répondent, dans l'ordre affiché
+        self.filter_query = ""
+        self.filtered = None
+        self.filter_job = None
+        
+        # Imports d'images en arrière-plan, appliqués par poll_imports
+        self.import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS)
+        self.pending_imports = []
+        self.imports_submitted = 0
+        self.imports_done = 0
+        
+        # Images qui ne sont peut-être plus utilisées, supprimées par collect_unused_images
+        self.unused_images = set()
+        
+        # Prévisualisations déjà réduites, et préchargement des figurines voisines
+        self.preview_cache = PreviewCache(PREVIEW_SIZE, PREVIEW_CACHE_BYTES)
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=2)
         
         # Interface
         self.setup_ui()
         
-        # Remplir la liste des figurines
-        self.update_figurines_list()
+        # Charger la collection : la fenêtre s'affiche aussitôt et la liste se remplit au fil de la lecture
+        self.load_collection()
+        
+        # Fermer proprement le stockage à la fermeture de la fenêtre
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+    
+    def on_close(self):
+        """Termine les imports en cours, ferme le stockage puis la fenêtre"""
+        self.prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        self.import_executor.shutdown(wait=True)
+        self.poll_imports()
+        
+        if self.store:
+            self.store.close()
+        self.root.destroy()
     
     def load_collection(self):
-        """Charge la collection depuis le fichier JSON ou crée une nouvelle collection"""
-        if os.path.exists(self.collection_file):
+        """Ouvre le stockage et lit la collection dans un thread, ajoutée à la liste par poll_loading"""
+        try:
+            self.store = open_store(self.collection_file, self.store_backend)
+        except STORE_ERRORS as e:
+            messagebox.showerror("Erreur", f"Impossible de charger la collection: {str(e)}")
+            return
+        
+        self.loading = True
+        self.status_var.set("Chargement de la collection...")
+        threading.Thread(target=self.read_collection, daemon=True).start()
+        self.root.after(LOAD_POLL_INTERVAL, self.poll_loading)
+    
+    def read_collection(self):
+        """Lit la collection par lots (thread de chargement) ; None signale la fin"""
+        batch = []
+        try:
+            for figurine in self.store.iter_load():
+                batch.append(figurine)
+                if len(batch) >= LOAD_BATCH_SIZE:
+                    self.load_queue.put(batch)
+                    batch = []
+            self.load_queue.put(batch)
+            self.load_queue.put(None)
+        except STORE_ERRORS as e:
+            self.load_queue.put(e)
+    
+    def poll_loading(self):
+        """Ajoute à la liste les figurines lues par le thread de chargement (appelé par la boucle Tk)"""
+        loaded = []
+        error = None
+        finished = False
+        while not finished:
             try:
-                with open(self.collection_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get("figurines", [])
-            except (json.JSONDecodeError, IOError) as e:
-                messagebox.showerror("Erreur", f"Impossible de charger la collection: {str(e)}")
-                return []
+                item = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, Exception):
+                error = item
+            if item is None or error is not None:
+                finished = True
+            else:
+                loaded.extend(item)
+        
+        if loaded:
+            self.collection.update((figurine.get("id", 0), figurine) for figurine in loaded)
+            self.index.extend(loaded)
+            self.sort_collection()
+            self.update_tags_combobox()
+        
+        if error is not None:
+            messagebox.showerror("Erreur", f"Impossible de charger la collection: {str(error)}")
+        if finished:
+            self.loading = False
+            self.status_var.set(f"{len(self.collection)} figurine(s) chargée(s)")
         else:
-            return []
+            self.status_var.set(f"Chargement de la collection... {len(self.collection)} figurine(s)")
+            self.root.after(LOAD_POLL_INTERVAL, self.poll_loading)
     
+    def check_loaded(self):
+        """Refuse les modifications tant que la collection n'est pas entièrement chargée"""
+        if self.loading:
+            messagebox.showinfo("Chargement", "La collection est en cours de chargement, veuillez patienter.")
+            return False
+        return True
+    
+    @tracing.traced("manager.save")
     def save_collection(self):
-        """Sauvegarde la collection dans le fichier JSON"""
+        """Sauvegarde toute la collection"""
+        try:
+            self.store.save_all(list(self.collection.values()))
+            return True
+        except STORE_ERRORS as e:
+            messagebox.showerror("Erreur", f"Impossible de sauvegarder la collection: {str(e)}")
+            return False
+    
+    def save_figurine_record(self, figurine):
+        """Enregistre une seule figurine (ajout ou mise à jour) dans le stockage"""
         try:
-            with open(self.collection_file, 'w', encoding='utf-8') as f:
-                json.dump({"figurines": self.collection}, f, indent=2, ensure_ascii=False)
+            self.store.put(figurine)
             return True
-        except IOError as e:
+        except STORE_ERRORS as e:
+            messagebox.showerror("Erreur", f"Impossible de sauvegarder la collection: {str(e)}")
+            return False
+    
+    def delete_figurine_record(self, figurine):
+        """Supprime une seule figurine du stockage"""
+        try:
+            self.store.delete(figurine.get("id"))
+            return True
+        except STORE_ERRORS as e:
             messagebox.showerror("Erreur", f"Impossible de sauvegarder la collection: {str(e)}")
             return False
     
     def extract_all_tags(self):
-        """Extrait tous les tags uniques de la collection"""
-        tags = set()
-        for figurine in self.collection:
-            tags.update(figurine.get("tags", []))
-        return sorted(list(tags))
+        """Renvoie tous les tags uniques de la collection, triés (tenus à jour par l'index)"""
+        return list(self.index.tags)
     
     def setup_ui(self):
         """Configure l'interface utilisateur"""
@@ -114,28 +260,27 @@ class FigurineManager:
         
         ttk.Label(sort_frame, text="Trier par:").pack(side=tk.LEFT)
         
-        self.sort_var = tk.StringVar(value="name_asc")
+        self.sort_var = tk.StringVar(value="Nom (A-Z)")
         sort_combobox = ttk.Combobox(sort_frame, textvariable=self.sort_var, width=20, state="readonly")
-        sort_combobox["values"] = [
-            "Nom (A-Z)",
-            "Nom (Z-A)",
-            "Plus récent",
-            "Plus ancien"
-        ]
+        sort_combobox["values"] = list(SORT_MODES)
         sort_combobox.pack(side=tk.LEFT, padx=5)
         sort_combobox.bind("<<ComboboxSelected>>", self.on_sort_change)
         
-        # Liste des figurines avec scrollbar
-        list_frame = ttk.Frame(left_frame)
-        list_frame.pack(fill=tk.BOTH, expand=True)
+        # Filtre par tags et nom (voir tag_query.py pour la syntaxe)
+        filter_frame = ttk.Frame(left_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
         
-        self.figurines_listbox = tk.Listbox(list_frame, exportselection=False)
-        self.figurines_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self.figurines_listbox.bind('<<ListboxSelect>>', self.on_figurine_select)
+        ttk.Label(filter_frame, text="Filtrer:").pack(side=tk.LEFT)
         
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.figurines_listbox.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.figurines_listbox.config(yscrollcommand=scrollbar.set)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", self.on_filter_change)
+        ttk.Entry(filter_frame, textvariable=self.filter_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Label(filter_frame, text="ex. : dragon #peint -#socle", foreground="gray").pack(side=tk.LEFT)
+        
+        # Liste des figurines avec scrollbar (seules les lignes visibles sont créées)
+        self.figurines_listbox = VirtualListbox(left_frame, self.figurine_row_text)
+        self.figurines_listbox.pack(fill=tk.BOTH, expand=True)
+        self.figurines_listbox.bind('<<ListboxSelect>>', self.on_figurine_select)
         
         # Côté droit - Détails de la figurine
         right_frame = ttk.Frame(main_frame)
@@ -230,10 +375,18 @@ class FigurineManager:
         canvas.bind_all("<MouseWheel>", on_mousewheel)
         
         # Barre de statut (doit être en dehors du canvas)
+        status_frame = ttk.Frame(self.root, relief=tk.SUNKEN)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
         self.status_var = tk.StringVar()
-        status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, anchor=tk.W)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.status_var.set("Prêt")
+        
+        # Progression des imports d'images (affichée seulement pendant un import)
+        self.import_progress_var = tk.StringVar()
+        self.import_progress_label = ttk.Label(status_frame, textvariable=self.import_progress_var)
+        self.import_progress = ttk.Progressbar(status_frame, mode="determinate", length=150)
     
     def toggle_form_state(self, enabled=True):
         """Active ou désactive le formulaire"""
@@ -244,7 +397,7 @@ class FigurineManager:
         self.set_widget_state(form_frame, state)
         
         # La liste des figurines et le bouton "Nouvelle" doivent toujours rester actifs
-        self.figurines_listbox.configure(state='normal')
+        self.figurines_listbox.listbox.configure(state='normal')
         for widget in self.root.winfo_children()[0].winfo_children()[0].winfo_children():  # Main frame -> Left frame
             if isinstance(widget, ttk.Button):  # Bouton "Nouvelle"
                 widget.configure(state='normal')
@@ -262,16 +415,40 @@ class FigurineManager:
                 pass
     
     def update_figurines_list(self):
-        """Met à jour la liste des figurines"""
-        self.figurines_listbox.delete(0, tk.END)
-        
-        # Afficher les figurines
-        for figurine in self.collection:
-            self.figurines_listbox.insert(tk.END, figurine.get("name", "Sans nom"))
+        """Met à jour toute la liste des figurines (seules les lignes visibles sont redessinées)"""
+        self.figurines_listbox.reset(self.row_count())
+    
+    def row_count(self):
+        """Nombre de lignes de la liste (figurines répondant au filtre, ou toute la collection)"""
+        return len(self.filtered) if self.filtered is not None else len(self.collection)
+    
+    def figurine_row_text(self, index):
+        """Texte de la ligne `index` de la liste des figurines"""
+        return self.figurine_at(index).get("name", "Sans nom")
+    
+    def figurine_at(self, row):
+        """Figurine affichée à la ligne `row` de la liste, selon le tri courant"""
+        if self.filtered is not None:
+            return self.filtered[row]
+        return self.index.views[self.sort_view].get(row, self.sort_reverse)
+    
+    def figurine_row(self, figurine):
+        """Ligne de la liste où la figurine est affichée, selon le tri courant (None si elle est filtrée)"""
+        if self.filtered is not None:
+            for row, candidate in enumerate(self.filtered):
+                if candidate is figurine:
+                    return row
+            return None
+        view = self.index.views[self.sort_view]
+        position = view.position(figurine)
+        return len(view) - 1 - position if self.sort_reverse else position
     
     def update_tags_combobox(self):
-        """Met à jour la liste déroulante des tags existants"""
+        """Met à jour la liste déroulante des tags existants, si elle a changé"""
+        if self.tag_entry['values'] and self.all_tags_version == self.index.tags_version:
+            return
         self.all_tags = self.extract_all_tags()
+        self.all_tags_version = self.index.tags_version
         self.tag_entry['values'] = self.all_tags
     
     def on_figurine_select(self, event):
@@ -281,8 +458,16 @@ class FigurineManager:
             return
         
         index = selection[0]
-        if 0 <= index < len(self.collection):
-            self.load_figurine(self.collection[index])
+        if 0 <= index < self.row_count():
+            self.load_figurine(self.figurine_at(index))
+            self.prefetch_neighbors(index)
+    
+    def prefetch_neighbors(self, index):
+        """Précharge en arrière-plan les prévisualisations des figurines précédente et suivante"""
+        for neighbor in (index - 1, index + 1):
+            if 0 <= neighbor < self.row_count():
+                image_path = os.path.join(self.project_root, self.figurine_at(neighbor).get("fullImage", ""))
+                self.prefetch_executor.submit(self.preview_cache.prefetch, image_path)
     
     def new_figurine(self):
         """Prépare le formulaire pour une nouvelle figurine"""
@@ -337,14 +522,14 @@ class FigurineManager:
             self.image_path_label.config(text=os.path.basename(filename))
             self.load_preview(filename)
     
+    @tracing.traced("manager.preview")
     def load_preview(self, image_path):
         """Charge une prévisualisation de l'image"""
         try:
             if os.path.exists(image_path):
-                img = Image.open(image_path)
-                
-                # Redimensionner l'image pour la prévisualisation (max 300x300)
-                img.thumbnail((300, 300))
+                # Image réduite à la taille de prévisualisation (max 300x300), mise en cache
+                with tracing.span("image.decode", file=os.path.basename(image_path)):
+                    img = self.preview_cache.load(image_path)
                 
                 photo = ImageTk.PhotoImage(img)
                 self.preview_label.config(image=photo)
@@ -377,17 +562,28 @@ class FigurineManager:
             self.tags_listbox.delete(selection[0])
     
     def save_figurine(self):
-        """Sauvegarde les modifications de la figurine"""
+        """Sauvegarde les modifications de la figurine.
+
+        Si une nouvelle image est sélectionnée, sa copie et sa miniature sont
+        faites en arrière-plan : le formulaire est libéré aussitôt et la
+        figurine est enregistrée par poll_imports une fois l'import terminé.
+        """
+        if not self.check_loaded():
+            return
+        
         name = self.name_var.get().strip()
         
         if not name:
             messagebox.showerror("Erreur", "Le nom de la figurine est obligatoire")
             return
         
-        # Vérifier si le nom existe déjà dans la collection
-        for figurine in self.collection:
-            if figurine.get("name") == name and figurine != self.current_figurine:
-                messagebox.showerror("Erreur", f"Une figurine avec le nom '{name}' existe déjà")
+        # Vérifier si le nom existe déjà dans la collection ou dans un import en attente
+        if self.index.find_by_name(name, exclude=self.current_figurine) is not None:
+            messagebox.showerror("Erreur", f"Une figurine avec le nom '{name}' existe déjà")
+            return
+        for job in self.pending_imports:
+            if job["name"] == name and job["figurine"] is not self.current_figurine:
+                messagebox.showerror("Erreur", f"Une figurine avec le nom '{name}' est en cours d'import")
                 return
         
         # Récupérer les tags
@@ -395,97 +591,187 @@ class FigurineManager:
         
         # Traiter l'image si une nouvelle est sélectionnée
         if self.selected_image_path:
-            filename = os.path.basename(self.selected_image_path)
-            full_path = os.path.join(self.full_images_dir, filename)
-            thumb_path = os.path.join(self.thumbnails_dir, filename)
-            
-            # Copier l'image dans le dossier des images complètes
-            shutil.copy2(self.selected_image_path, full_path)
-            
-            # Créer une miniature
-            try:
-                img = Image.open(full_path)
-                img.thumbnail((300, 300))
-                img.save(thumb_path)
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Impossible de créer la miniature: {str(e)}")
-                return
+            # Copier l'image et créer la miniature en arrière-plan
+            future = self.import_executor.submit(import_image, self.selected_image_path,
+                                                 self.full_images_dir, self.thumbnails_dir)
+            self.pending_imports.append({
+                "future": future,
+                "figurine": self.current_figurine,
+                "name": name,
+                "tags": tags,
+            })
+            self.imports_submitted += 1
+            if len(self.pending_imports) == 1:
+                self.root.after(IMPORT_POLL_INTERVAL, self.poll_imports)
+            self.update_import_progress()
             
-            full_image_path = f"images/full/{filename}"
-            thumbnail_path = f"images/thumbnails/{filename}"
+            self.status_var.set(f"Import de l'image de '{name}' en cours...")
+            self.reset_form()
         elif self.current_figurine:
             # Conserver les chemins d'image existants
-            full_image_path = self.current_figurine.get("fullImage", "")
-            thumbnail_path = self.current_figurine.get("thumbnail", "")
+            if self.commit_figurine(self.current_figurine, name, tags,
+                                    self.current_figurine.get("fullImage", ""),
+                                    self.current_figurine.get("thumbnail", "")):
+                self.reset_form()
         else:
             messagebox.showerror("Erreur", "Aucune image sélectionnée")
-            return
+    
+    def commit_figurine(self, figurine, name, tags, full_image_path, thumbnail_path, image_changed=False, phash=None):
+        """Crée (si `figurine` est None) ou met à jour une figurine, puis l'enregistre.
+
+        `phash` est l'empreinte perceptuelle de la nouvelle image (si `image_changed`).
+        """
+        if figurine is not None and not self.index.contains(figurine):
+            # La figurine a été supprimée pendant l'import de sa nouvelle image
+            self.status_var.set(f"Figurine '{name}' supprimée pendant l'import, modification ignorée")
+            return False
         
         # Ajouter la date de modification
         current_time = datetime.now().isoformat()
         
         # Créer ou mettre à jour la figurine
-        if self.current_figurine:
+        if figurine:
             # Mettre à jour une figurine existante
             
-            # Si l'image a changé, supprimer l'ancienne
-            if self.selected_image_path and self.current_figurine.get("fullImage"):
-                old_full = os.path.join(self.project_root, self.current_figurine.get("fullImage", ""))
-                old_thumb = os.path.join(self.project_root, self.current_figurine.get("thumbnail", ""))
-                
-                try:
-                    if os.path.exists(old_full) and os.path.basename(old_full) != os.path.basename(full_image_path):
-                        os.remove(old_full)
-                    if os.path.exists(old_thumb) and os.path.basename(old_thumb) != os.path.basename(thumbnail_path):
-                        os.remove(old_thumb)
-                except OSError as e:
-                    messagebox.showwarning("Attention", f"Impossible de supprimer les anciennes images: {str(e)}")
+            # Si l'image a changé, l'ancienne sera supprimée si plus aucune figurine ne l'utilise
+            if image_changed and figurine.get("fullImage") and figurine.get("fullImage") != full_image_path:
+                self.unused_images.add((figurine.get("fullImage"), figurine.get("thumbnail", "")))
             
-            # Mettre à jour les informations
-            self.current_figurine.update({
+            # Mettre à jour les informations (et les index)
+            old_row = self.figurine_row(figurine)
+            self.index.remove(figurine)
+            figurine.update({
                 "name": name,
                 "fullImage": full_image_path,
                 "thumbnail": thumbnail_path,
                 "tags": tags,
                 "modified_date": current_time  # Ajouter la date
             })
+            if image_changed:
+                figurine["phash"] = phash
+            self.index.add(figurine)
+            
+            # La ligne ne bouge que si la clé de tri a changé
+            new_row = self.figurine_row(figurine)
+            if self.filtered is not None:
+                # Liste filtrée : la figurine peut entrer dans le filtre ou en sortir
+                self.sort_collection()
+            elif new_row == old_row:
+                self.figurines_listbox.row_changed(new_row)
+            else:
+                self.figurines_listbox.row_removed(old_row)
+                self.figurines_listbox.row_inserted(new_row)
             
             self.status_var.set(f"Figurine '{name}' mise à jour")
         else:
             # Créer une nouvelle figurine
             
-            # Trouver le prochain ID disponible
-            next_id = 1
-            if self.collection:
-                next_id = max([f.get("id", 0) for f in self.collection]) + 1
-            
-            # Créer la nouvelle figurine
-            new_figurine = {
-                "id": next_id,
+            # Créer la nouvelle figurine avec le prochain ID disponible
+            figurine = FigurineRecord({
+                "id": self.index.allocate_id(),
                 "name": name,
                 "fullImage": full_image_path,
                 "thumbnail": thumbnail_path,
                 "tags": tags,
-                "modified_date": current_time  # Ajouter la date
-            }
+                "modified_date": current_time,  # Ajouter la date
+                "phash": phash
+            })
             
-            self.collection.append(new_figurine)
+            self.collection[figurine["id"]] = figurine
+            self.index.add(figurine)
+            if self.filtered is not None:
+                self.sort_collection()
+            else:
+                self.figurines_listbox.row_inserted(self.figurine_row(figurine))
             self.status_var.set(f"Nouvelle figurine '{name}' créée")
         
-        # Sauvegarder la collection
-        if self.save_collection():
-            # Mettre à jour l'interface
-            self.update_figurines_list()
-            self.update_tags_combobox()
+        # Sauvegarder la figurine
+        if not self.save_figurine_record(figurine):
+            return False
+        
+        # Mettre à jour l'interface
+        self.update_tags_combobox()
+        self.collect_unused_images()
+        return True
+    
+    def collect_unused_images(self):
+        """Supprime les images (et miniatures) qui ne sont plus utilisées par aucune figurine.
+
+        Les images sont partagées entre figurines de même contenu : une image n'est
+        supprimée que si l'index ne lui connaît plus de référence. Tant qu'un import
+        est en cours, rien n'est supprimé, car il peut réutiliser une image existante.
+        """
+        if self.pending_imports:
+            return
+        
+        for full_image, thumbnail in self.unused_images:
+            if self.index.image_references(full_image):
+                continue
+            try:
+                for image in (full_image, thumbnail):
+                    path = os.path.join(self.project_root, image)
+                    if image and os.path.exists(path):
+                        os.remove(path)
+            except OSError as e:
+                messagebox.showwarning("Attention", f"Impossible de supprimer les images: {str(e)}")
+        self.unused_images.clear()
+    
+    def poll_imports(self):
+        """Enregistre les figurines dont l'import d'image est terminé (appelé par la boucle Tk)"""
+        for job in [job for job in self.pending_imports if job["future"].done()]:
+            self.pending_imports.remove(job)
+            self.imports_done += 1
+            try:
+                full_image, thumbnail, phash = job["future"].result()
+            except Exception as e:
+                messagebox.showerror("Erreur", f"Impossible d'importer l'image de '{job['name']}': {str(e)}")
+                continue
             
-            # Réinitialiser le formulaire et le désactiver
-            self.toggle_form_state(False)
-            self.current_figurine = None
-            self.selected_image_path = None
+            # Image presque identique à celle d'une autre figurine (réexport, copie redimensionnée...)
+            similar = self.index.similar_images(phash, exclude=job["figurine"])
+            if similar and not messagebox.askyesno(
+                    "Doublon probable",
+                    f"L'image de '{job['name']}' ressemble beaucoup à celle de "
+                    f"'{similar[0][1].get('name', '')}'.\nEnregistrer quand même ?"):
+                self.unused_images.add((full_image, thumbnail))
+                self.status_var.set(f"Import de '{job['name']}' annulé (doublon probable)")
+                continue
+            
+            if not self.commit_figurine(job["figurine"], job["name"], job["tags"],
+                                        full_image, thumbnail, image_changed=True, phash=phash):
+                # L'image importée n'est peut-être utilisée par aucune figurine
+                self.unused_images.add((full_image, thumbnail))
+        
+        self.update_import_progress()
+        if self.pending_imports:
+            self.root.after(IMPORT_POLL_INTERVAL, self.poll_imports)
+        else:
+            self.collect_unused_images()
+    
+    def update_import_progress(self):
+        """Affiche la progression des imports dans la barre de statut"""
+        if not self.pending_imports:
+            self.imports_submitted = 0
+            self.imports_done = 0
+            self.import_progress.pack_forget()
+            self.import_progress_label.pack_forget()
+            return
+        
+        self.import_progress.configure(maximum=self.imports_submitted, value=self.imports_done)
+        self.import_progress_var.set(f"Imports : {self.imports_done}/{self.imports_submitted}")
+        if not self.import_progress.winfo_manager():
+            self.import_progress.pack(side=tk.RIGHT, padx=5, pady=2)
+            self.import_progress_label.pack(side=tk.RIGHT)
+    
+    def reset_form(self):
+        """Réinitialise le formulaire et le désactive"""
+        self.toggle_form_state(False)
+        self.current_figurine = None
+        self.selected_image_path = None
     
     def delete_figurine(self):
         """Supprime la figurine actuelle"""
-        if not self.current_figurine:
+        if not self.current_figurine or not self.check_loaded():
             return
         
         name = self.current_figurine.get("name", "")
@@ -495,33 +781,32 @@ class FigurineManager:
         )
         
         if confirm:
-            # Supprimer les fichiers image
-            try:
-                full_path = os.path.join(self.project_root, self.current_figurine.get("fullImage", ""))
-                thumb_path = os.path.join(self.project_root, self.current_figurine.get("thumbnail", ""))
-                
-                if os.path.exists(full_path):
-                    os.remove(full_path)
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-            except OSError as e:
-                messagebox.showwarning("Attention", f"Impossible de supprimer les images: {str(e)}")
+            figurine = self.current_figurine
+            
+            # Supprimer la figurine du stockage d'abord : en cas d'échec, la collection
+            # et les images qu'elle utilise restent intactes
+            if not self.delete_figurine_record(figurine):
+                return
             
             # Supprimer la figurine de la collection
-            self.collection.remove(self.current_figurine)
+            row = self.figurine_row(figurine)
+            del self.collection[figurine.get("id", 0)]
+            self.index.remove(figurine)
+            if self.filtered is not None:
+                self.sort_collection()
+            else:
+                self.figurines_listbox.row_removed(row)
             
-            # Sauvegarder la collection
-            if self.save_collection():
-                self.status_var.set(f"Figurine '{name}' supprimée")
-                
-                # Mettre à jour l'interface
-                self.update_figurines_list()
-                self.update_tags_combobox()
-                
-                # Réinitialiser le formulaire et le désactiver
-                self.toggle_form_state(False)
-                self.current_figurine = None
-                self.selected_image_path = None
+            # Les fichiers image seront supprimés si aucune autre figurine ne les utilise
+            self.unused_images.add((figurine.get("fullImage", ""), figurine.get("thumbnail", "")))
+            self.status_var.set(f"Figurine '{name}' supprimée")
+            self.collect_unused_images()
+            
+            # Mettre à jour l'interface
+            self.update_tags_combobox()
+            
+            # Réinitialiser le formulaire et le désactiver
+            self.reset_form()
     
     def cancel_edit(self):
         """Annule l'édition en cours"""
@@ -531,26 +816,68 @@ class FigurineManager:
         self.status_var.set("Édition annulée")
     
     def sort_collection(self):
-        """Trie la collection selon le critère sélectionné"""
-        sort_type = self.sort_var.get()
-        
-        if sort_type == "Nom (A-Z)":
-            self.collection.sort(key=lambda x: x.get("name", "").lower())
-        elif sort_type == "Nom (Z-A)":
-            self.collection.sort(key=lambda x: x.get("name", "").lower(), reverse=True)
-        elif sort_type == "Plus récent":
-            self.collection.sort(key=lambda x: x.get("modified_date", ""), reverse=True)
-        elif sort_type == "Plus ancien":
-            self.collection.sort(key=lambda x: x.get("modified_date", ""))
-        
-        # Mettre à jour l'affichage après le tri
+        """Affiche la collection selon le critère sélectionné.
+
+        Les vues triées sont tenues à jour par l'index : changer de critère ne
+        trie rien et ne réordonne pas la collection stockée.
+        """
+        self.sort_view, self.sort_reverse = SORT_MODES.get(self.sort_var.get(), SORT_MODES["Nom (A-Z)"])
+        if self.filter_query:
+            self.filtered = self.index.filter(self.filter_query, self.sort_view, self.sort_reverse)
+        else:
+            self.filtered = None
+        
+        # Mettre à jour l'affichage en gardant la figurine en cours sélectionnée
+        self.figurines_listbox.selection_clear()
         self.update_figurines_list()
+        if self.current_figurine is not None and self.index.contains(self.current_figurine):
+            row = self.figurine_row(self.current_figurine)
+            if row is not None:
+                self.figurines_listbox.see(row)
+                self.figurines_listbox.selection_set(row)
     
     def on_sort_change(self, event):
         """Appelé quand l'utilisateur change le critère de tri"""
         self.sort_collection()
+    
+    def on_filter_change(self, *args):
+        """Appelé à chaque frappe dans le filtre : le filtre est appliqué après une courte pause"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DELAY, self.apply_filter)
+    
+    def apply_filter(self):
+        """Filtre la liste selon la requête saisie (tags et début du nom, voir tag_query.py)"""
+        self.filter_job = None
+        query = self.filter_var.get().strip()
+        start = time.perf_counter()
+        try:
+            parse_query(query)
+        except QuerySyntaxError as e:
+            # La liste garde le dernier filtre valide
+            self.status_var.set(f"Filtre invalide : {str(e)}")
+            return
+        
+        # Requête valide : les tris suivants (enregistrement, import, suppression) la réutilisent
+        self.filter_query = query
+        self.sort_collection()
+        
+        if self.filtered is not None:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.status_var.set(f"{len(self.filtered)} figurine(s) trouvée(s) en {elapsed:.0f} ms")
+        else:
+            self.status_var.set(f"{len(self.collection)} figurine(s)")
 
 def main():
+    # --trace[=fichier] et --profile=étape : voir tracing.py
+    sys.argv = tracing.configure(sys.argv)
+    
+    # Tri des noms selon la langue de l'utilisateur
+    try:
+        locale.setlocale(locale.LC_COLLATE, "")
+    except locale.Error:
+        pass
+    
     root = tk.Tk()
     app = FigurineManager(root)
     root.mainloop()
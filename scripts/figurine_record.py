@@ -0,0 +1,279 @@
+# coding: utf-8
+"""Représentation compacte des figurines en mémoire
+
+Une figurine chargée est un FigurineRecord (attributs __slots__) plutôt qu'un
+dict : les clés ne sont pas répétées, les tags sont des numéros dans une table
+commune (TagTable), le chemin de la miniature est déduit de celui de l'image
+quand il suit la convention d'import, la date de modification est un entier et
+l'empreinte perceptuelle un entier de 64 bits.
+
+Un FigurineRecord s'utilise comme un dict (get, [], update, dict(record)...) et
+se sérialise en JSON par collection_io.dumps. Toute valeur qui ne se laisse pas
+compacter sans perte (chemin non conventionnel, date avec fuseau horaire, clé
+inconnue...) est conservée telle quelle, et les clés gardent leur ordre d'origine.
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+
+FULL_IMAGES_PREFIX = "images/full/"
+THUMBNAILS_PREFIX = "images/thumbnails/"
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Ordre des clés lors de la conversion en dict (puis les clés supplémentaires)
+RECORD_KEYS = ("id", "name", "fullImage", "thumbnail", "tags", "modified_date", "phash")
+KEY_RANKS = {key: rank for rank, key in enumerate(RECORD_KEYS)}
+EXTRA_RANK = len(RECORD_KEYS)
+
+# Empreinte perceptuelle telle qu'écrite par image_hash.hash_to_hex
+PHASH_PATTERN = re.compile(r"[0-9a-f]{16}")
+
+# Miniature absente, ou déduite du nom de l'image
+NO_THUMBNAIL = None
+DERIVED_THUMBNAIL = True
+
+
+class TagTable:
+    """Table des tags : chaque tag est stocké une seule fois et désigné par un numéro
+
+    Les figurines sont créées dans plusieurs threads (chargement, imports,
+    interface) : l'ajout d'un tag est protégé par un verrou.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def tag_id(self, tag):
+        """Numéro du tag (ajouté à la table s'il est nouveau)"""
+        tag_id = self.ids.get(tag)
+        if tag_id is None:
+            with self.lock:
+                tag_id = self.ids.get(tag)
+                if tag_id is None:
+                    # Nom ajouté avant l'id : un autre thread ne lit jamais un id sans son nom
+                    self.names.append(tag)
+                    tag_id = self.ids[tag] = len(self.names) - 1
+        return tag_id
+
+    def tag(self, tag_id):
+        return self.names[tag_id]
+
+
+# Table partagée par toutes les figurines du processus
+TAGS = TagTable()
+
+
+def parse_timestamp(text):
+    """Date ISO sans fuseau horaire → microsecondes depuis 1970 (None si illisible)"""
+    try:
+        value = datetime.fromisoformat(text)
+    except (TypeError, ValueError):
+        return None
+    if value.tzinfo is not None:
+        return None
+    return (value - EPOCH) // MICROSECOND
+
+
+def format_timestamp(value):
+    """Microsecondes depuis 1970 → date ISO (format de datetime.isoformat)"""
+    return (EPOCH + value * MICROSECOND).isoformat()
+
+
+def compact_timestamp(value):
+    """Date ISO → microsecondes, seulement si format_timestamp la réécrit à l'identique"""
+    timestamp = parse_timestamp(value) if isinstance(value, str) else None
+    if timestamp is None or format_timestamp(timestamp) != value:
+        return None
+    return timestamp
+
+
+class FigurineRecord:
+    """Figurine compacte, utilisable comme un dict"""
+
+    __slots__ = ("id", "name", "image", "thumbnail", "tag_ids", "modified", "phash", "extra", "order")
+
+    def __init__(self, values=None):
+        self.id = None
+        self.name = None
+        self.image = None  # Nom du fichier dans images/full/
+        self.thumbnail = NO_THUMBNAIL
+        self.tag_ids = None
+        self.modified = None  # Microsecondes depuis 1970
+        self.phash = None
+        self.extra = None  # Clés et valeurs non compactées
+        self.order = None  # Ordre des clés, s'il diffère de RECORD_KEYS puis clés supplémentaires
+        if values:
+            self._load(values)
+
+    @classmethod
+    def from_dict(cls, values):
+        return values if isinstance(values, cls) else cls(values)
+
+    def copy(self):
+        record = FigurineRecord()
+        for slot in self.__slots__:
+            setattr(record, slot, getattr(self, slot))
+        if self.extra:
+            record.extra = dict(self.extra)
+        return record
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
+
+    # Accès comme un dict
+
+    def __iter__(self):
+        if self.order is not None:
+            yield from self.order
+            return
+        for key in RECORD_KEYS:
+            if self._get(key, self) is not self:
+                yield key
+        if self.extra:
+            for key in self.extra:
+                if key not in RECORD_KEYS:
+                    yield key
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return self._get(key, self) is not self
+
+    def __getitem__(self, key):
+        value = self._get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._get(key, self)
+        return default if value is self else value
+
+    def setdefault(self, key, default=None):
+        value = self._get(key, self)
+        if value is self:
+            self[key] = value = default
+        return value
+
+    def _load(self, values):
+        """Remplit une figurine vide ; l'ordre des clés n'est noté que s'il n'est pas l'ordre habituel"""
+        keys = list(values.keys() if hasattr(values, "keys") else dict(values))
+        ranks = [KEY_RANKS.get(key, EXTRA_RANK) for key in keys]
+        if any(later < earlier for earlier, later in zip(ranks, ranks[1:])):
+            self.order = tuple(keys)
+        for key, value in (values.items() if hasattr(values, "items") else values):
+            self._store(key, value)
+
+    def update(self, values=(), **kwargs):
+        for key, value in (values.items() if hasattr(values, "items") else values):
+            self[key] = value
+        for key, value in kwargs.items():
+            self[key] = value
+
+    def _get(self, key, missing):
+        """Valeur de la clé, ou `missing` si la figurine ne l'a pas"""
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        if key == "id":
+            return missing if self.id is None else self.id
+        if key == "name":
+            return missing if self.name is None else self.name
+        if key == "fullImage":
+            return missing if self.image is None else FULL_IMAGES_PREFIX + self.image
+        if key == "thumbnail":
+            if self.thumbnail is DERIVED_THUMBNAIL:
+                return THUMBNAILS_PREFIX + self.image
+            return missing if self.thumbnail is NO_THUMBNAIL else self.thumbnail
+        if key == "tags":
+            return missing if self.tag_ids is None else [TAGS.tag(tag_id) for tag_id in self.tag_ids]
+        if key == "modified_date":
+            return missing if self.modified is None else format_timestamp(self.modified)
+        if key == "phash":
+            return missing if self.phash is None else f"{self.phash:016x}"
+        return missing
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._add_key(key)
+        self._store(key, value)
+
+    def _add_key(self, key):
+        """Note la nouvelle clé en dernière position, si l'ordre habituel ne l'y place pas déjà"""
+        if self.order is not None:
+            self.order += (key,)
+        elif any(KEY_RANKS.get(present, EXTRA_RANK) > KEY_RANKS.get(key, EXTRA_RANK) for present in self):
+            self.order = tuple(self) + (key,)
+
+    def _store(self, key, value):
+        """Enregistre la valeur sous sa forme compacte si possible"""
+        if self.extra:
+            self.extra.pop(key, None)
+        if key == "id" and type(value) is int:
+            self.id = value
+        elif key == "name" and isinstance(value, str):
+            self.name = value
+        elif key == "fullImage" and isinstance(value, str) and value.startswith(FULL_IMAGES_PREFIX):
+            # La miniature ne change pas avec l'image : elle est déduite à nouveau, ou gardée telle quelle
+            thumbnail = self.get("thumbnail")
+            self.image = value[len(FULL_IMAGES_PREFIX):]
+            if isinstance(thumbnail, str):
+                self._store("thumbnail", thumbnail)
+        elif key == "thumbnail" and isinstance(value, str):
+            derived = self.image is not None and value == THUMBNAILS_PREFIX + self.image
+            self.thumbnail = DERIVED_THUMBNAIL if derived else value
+        elif key == "tags" and type(value) is list and all(type(tag) is str for tag in value):
+            self.tag_ids = tuple([TAGS.tag_id(tag) for tag in value])
+        elif key == "modified_date" and (timestamp := compact_timestamp(value)) is not None:
+            self.modified = timestamp
+        elif key == "phash" and isinstance(value, str) and PHASH_PATTERN.fullmatch(value):
+            self.phash = int(value, 16)
+        else:
+            self._clear(key)
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if self.extra:
+            self.extra.pop(key, None)
+        if self.order is not None:
+            self.order = tuple(present for present in self.order if present != key)
+        self._clear(key)
+
+    def _clear(self, key):
+        """Efface la forme compacte de la clé"""
+        if key == "id":
+            self.id = None
+        elif key == "name":
+            self.name = None
+        elif key == "fullImage":
+            if self.thumbnail is DERIVED_THUMBNAIL:
+                self.thumbnail = THUMBNAILS_PREFIX + self.image
+            self.image = None
+        elif key == "thumbnail":
+            self.thumbnail = NO_THUMBNAIL
+        elif key == "tags":
+            self.tag_ids = None
+        elif key == "modified_date":
+            self.modified = None
+        elif key == "phash":
+            self.phash = None
+
+    def __repr__(self):
+        return f"FigurineRecord({self.to_dict()!r})"
@@ -1,71 +1,437 @@
 ﻿import os
+import re
+import glob
 import json
-import shutil
-from jinja2 import Template  # pip install jinja2
+import sys
+import unicodedata
+import tracing
+from jinja2 import Environment, FileSystemLoader, select_autoescape  # pip install jinja2
+from collection_io import to_json_value
+from collection_store import open_store, store_path
+from figurine_record import FigurineRecord
+from asset_sync import sync_tree, COMPRESSED_SUFFIXES
+from precompress import compression_formats, precompress_tree
+from tag_query import TagQueryIndex, bitmap_keys, fold_text
+
+# Attribut `sizes` des images des cartes (colonnes de 150 à ~300px de large)
+CARD_IMAGE_SIZES = "(max-width: 480px) 50vw, (max-width: 768px) 33vw, 300px"
+
+# Largeur visée pour l'image de repli (navigateurs sans srcset)
+FALLBACK_IMAGE_WIDTH = 320
+
+# Nombre de figurines par fichier de page des données du site
+PAGE_SIZE = 100
+
+# Cartes des pages HTML chargées sans attendre (première rangée visible)
+EAGER_CARDS = 4
+
+# En-têtes de cache du site (format _headers de Netlify / Cloudflare Pages) :
+# les ressources publiées sous un nom empreinté ne changent jamais
+IMMUTABLE_ASSET_DIRS = ("css", "js", "images")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Longueur des n-grammes de l'index de recherche par nom
+SEARCH_GRAM_SIZE = 3
+
+def load_variants_index(variants_file):
+    """Charge l'index des variantes produit par prepare_data.create_variants"""
+    if not variants_file or not os.path.exists(variants_file):
+        return {}
+    with open(variants_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_atlas_index(atlas_file):
+    """Charge l'index des planches de miniatures produit par prepare_data.create_atlases"""
+    if not atlas_file or not os.path.exists(atlas_file):
+        return {}
+    with open(atlas_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def attach_sprites(figurines, atlas_index, atlases_url="images/atlases", asset_url=None):
+    """Ajoute à chaque figurine la position de sa miniature dans la planche de sa page ("sprite")
+
+    Une figurine dont la miniature n'est pas dans la planche de sa page (collection
+    modifiée depuis l'assemblage des planches) garde sa miniature seule.
+    Les figurines restent des FigurineRecord, modifiés sur place ; renvoie la liste.
+    """
+    if asset_url is None:
+        asset_url = lambda path: path
+    figurines = [FigurineRecord.from_dict(figurine) for figurine in figurines]
+    page_size = atlas_index.get("pageSize", PAGE_SIZE)
+    by_page = {atlas["page"]: atlas for atlas in atlas_index.get("atlases", {}).values()}
+    for position, figurine in enumerate(figurines):
+        atlas = by_page.get(position // page_size + 1)
+        box = atlas and atlas["thumbnails"].get(os.path.basename(figurine.get("thumbnail") or ""))
+        if box:
+            x, y, width, height = box
+            figurine["sprite"] = {
+                "src": asset_url(f"{atlases_url}/{atlas['file']}"),
+                "x": x,
+                "y": y,
+                "width": width,
+                "height": height,
+                "atlasWidth": atlas["width"],
+                "atlasHeight": atlas["height"],
+            }
+    return figurines
+
+def attach_image_variants(figurines, variants_index, variants_url="images/variants", asset_url=None):
+    """Ajoute à chaque figurine les srcset, dimensions et image plein écran de ses variantes ("image")
+
+    `asset_url` donne l'URL publiée d'un chemin d'image (nom empreinté, voir copy_assets).
+    Les figurines restent des FigurineRecord, modifiés sur place, et les figurines
+    d'une même image partagent la même description ; renvoie la liste.
+    """
+    if asset_url is None:
+        asset_url = lambda path: path
+    figurines = [FigurineRecord.from_dict(figurine) for figurine in figurines]
+    images = {}
+    for figurine in figurines:
+        image_name = os.path.basename(figurine.get("fullImage", ""))
+        for key in ("fullImage", "thumbnail"):
+            if figurine.get(key):
+                figurine[key] = asset_url(figurine[key])
+        if image_name not in images:
+            images[image_name] = _variants_image(variants_index.get(image_name), variants_url, asset_url)
+        if images[image_name] is not None:
+            figurine["image"] = images[image_name]
+    return figurines
+
+def _variants_image(outputs, variants_url, asset_url):
+    """Description ("image") des variantes d'une image, ou None sans variantes"""
+    if not outputs:
+        return None
+
+    by_format = {}
+    for output in sorted(outputs, key=lambda o: o["width"]):
+        by_format.setdefault(output["format"], []).append(output)
+
+    fallback_set = by_format.get("jpeg") or next(iter(by_format.values()))
+    fallback = next((o for o in fallback_set if o["width"] >= FALLBACK_IMAGE_WIDTH), fallback_set[-1])
+    largest = by_format.get("webp", fallback_set)[-1]
+
+    return {
+        "src": asset_url(f"{variants_url}/{fallback['file']}"),
+        "srcset": {
+            fmt: ", ".join(asset_url(f"{variants_url}/{o['file']}") + f" {o['width']}w" for o in variants)
+            for fmt, variants in by_format.items()
+        },
+        "sizes": CARD_IMAGE_SIZES,
+        "width": fallback["width"],
+        "height": fallback["height"],
+        "full": asset_url(f"{variants_url}/{largest['file']}"),
+    }
+
+def slugify(text):
+    """Nom de fichier sûr dérivé d'un texte (accents retirés, minuscules, tirets)"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "tag"
+
+def write_json_compact(path, data):
+    """Écrit un fichier JSON sans indentation ni espaces superflus"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'), default=to_json_value)
+
+def delta_encode(positions):
+    """Liste de positions croissantes → écarts successifs (fichiers JSON plus petits)"""
+    previous = 0
+    deltas = []
+    for position in positions:
+        deltas.append(position - previous)
+        previous = position
+    return deltas
+
+def remove_stale_files(folder, written):
+    """Supprime de `folder` les fichiers d'une génération précédente absents de `written`
+
+    Les versions précompressées (voir precompress.py) des fichiers écrits sont conservées.
+    """
+    for name in os.listdir(folder):
+        source = os.path.splitext(name)[0] if name.endswith(COMPRESSED_SUFFIXES) else name
+        if source not in written:
+            os.remove(os.path.join(folder, name))
+
+@tracing.traced("site.search")
+def write_search_index(data_dir, figurines, gram_size=SEARCH_GRAM_SIZE):
+    """Écrit l'index de recherche par nom et renvoie sa description pour le manifeste
+
+    - data/search/names.json : noms normalisés, dans l'ordre de la collection
+      (recherches plus courtes qu'un n-gramme et vérification des candidats) ;
+    - data/search/<code>.json : listes de positions de chaque n-gramme, regroupées
+      par premier caractère (code hexadécimal) pour ne charger que l'utile.
+    """
+    search_dir = os.path.join(data_dir, 'search')
+    os.makedirs(search_dir, exist_ok=True)
+
+    names = [fold_text(figurine.get("name", "")) for figurine in figurines]
+    write_json_compact(os.path.join(search_dir, 'names.json'), {"names": names})
+
+    postings = {}
+    for position, name in enumerate(names):
+        for gram in {name[i:i + gram_size] for i in range(len(name) - gram_size + 1)}:
+            postings.setdefault(gram, []).append(position)
+
+    shards = {}
+    for gram in sorted(postings):
+        shards.setdefault(f"{ord(gram[0]):x}", {})[gram] = delta_encode(postings[gram])
+
+    shard_files = {}
+    for code, grams in shards.items():
+        shard_file = f"data/search/{code}.json"
+        write_json_compact(os.path.join(search_dir, f"{code}.json"), {"grams": grams})
+        shard_files[code] = shard_file
+    remove_stale_files(search_dir, {'names.json'} | {f"{code}.json" for code in shards})
+
+    return {"gramSize": gram_size, "names": "data/search/names.json", "shards": shard_files}
+
+@tracing.traced("site.tags")
+def tag_listings(figurines):
+    """Figurines de chaque tag, calculées par l'index bitmap de tag_query
+
+    Renvoie {tag: {"slug": nom de fichier sûr, "positions": positions dans la collection}}, par tag trié.
+    """
+    index = TagQueryIndex.from_figurines(figurines)
+    listings = {}
+    used_slugs = set()
+    for tag in sorted(index.bitmaps):
+        slug = slugify(tag)
+        while slug in used_slugs:
+            slug += "-"
+        used_slugs.add(slug)
+        listings[tag] = {"slug": slug, "positions": bitmap_keys(index.bitmap(tag))}
+    return listings
+
+@tracing.traced("site.data")
+def write_site_data(output_dir, figurines, page_size=PAGE_SIZE, listings=None):
+    """Écrit les données du site découpées en petits fichiers chargés à la demande par main.js
+
+    - data/manifest.json : nombre de figurines, taille des pages, liste des pages et des tags ;
+    - data/pages/page-NNNN.json : `page_size` figurines consécutives ;
+    - data/tags/<tag>.json : positions (dans l'ordre de la collection) des figurines portant ce tag ;
+    - data/search/ : index de recherche par nom (voir `write_search_index`).
+    """
+    data_dir = os.path.join(output_dir, 'data')
+    for subdir in ('pages', 'tags'):
+        os.makedirs(os.path.join(data_dir, subdir), exist_ok=True)
+    # Ancien fichier unique, remplacé par les pages
+    if os.path.exists(os.path.join(data_dir, 'collection.json')):
+        os.remove(os.path.join(data_dir, 'collection.json'))
+
+    pages = []
+    for start in range(0, len(figurines), page_size):
+        page_file = f"data/pages/page-{len(pages) + 1:04d}.json"
+        write_json_compact(os.path.join(output_dir, page_file), {"figurines": figurines[start:start + page_size]})
+        pages.append(page_file)
+    # Les anciens fichiers peuvent ne plus correspondre à aucune page ou tag
+    remove_stale_files(os.path.join(data_dir, 'pages'), {os.path.basename(page) for page in pages})
+
+    if listings is None:
+        listings = tag_listings(figurines)
+
+    tags = {}
+    for tag, listing in listings.items():
+        tag_file = f"data/tags/{listing['slug']}.json"
+        write_json_compact(os.path.join(output_dir, tag_file), {"tag": tag, "positions": listing["positions"]})
+        tags[tag] = {"count": len(listing["positions"]), "file": tag_file, "page": tag_page_url(listing["slug"])}
+    remove_stale_files(os.path.join(data_dir, 'tags'), {os.path.basename(tag["file"]) for tag in tags.values()})
+
+    write_json_compact(os.path.join(data_dir, 'manifest.json'), {
+        "total": len(figurines),
+        "pageSize": page_size,
+        "pages": pages,
+        "tags": tags,
+        "search": write_search_index(data_dir, figurines),
+    })
+
+@tracing.traced("site.load")
+def load_figurines(data_file):
+    """Charge les figurines depuis le stockage (collection.json ou base SQLite)"""
+    store = open_store(data_file)
+    try:
+        return store.load()
+    finally:
+        store.close()
+
+def page_url(page):
+    """Nom du fichier HTML d'une page de la galerie (numérotée à partir de 1)"""
+    return 'index.html' if page == 1 else f'page-{page}.html'
+
+def tag_page_url(slug, page=1):
+    """Nom du fichier HTML d'une page de la liste des figurines d'un tag
+
+    Le numéro de page suit un point, absent des slugs : la page 2 du tag
+    « dragon » ne peut pas prendre le nom de la page 1 du tag « dragon 2 ».
+    """
+    return f'tag-{slug}.html' if page == 1 else f'tag-{slug}.page-{page}.html'
+
+@tracing.traced("site.template")
+def load_template(template_path):
+    """Compile le template une seule fois ; il est ensuite réutilisé pour toutes les pages"""
+    env = Environment(
+        loader=FileSystemLoader(os.path.dirname(os.path.abspath(template_path))),
+        autoescape=select_autoescape(['html']),
+        auto_reload=False,
+    )
+    return env.get_template(os.path.basename(template_path))
+
+@tracing.traced("site.html")
+def write_html_pages(template, output_dir, figurines, page_size=PAGE_SIZE, asset_url=None, listings=None):
+    """Écrit les pages HTML de la galerie, cartes pré-rendues, `page_size` figurines par page
+
+    Chaque page est produite par morceaux (`stream`) directement dans son fichier,
+    sans construire tout le HTML en mémoire. main.js reprend les cartes existantes
+    et charge la suite au défilement ; les liens de pagination servent sans JavaScript.
+    Chaque tag a aussi ses pages (tag-<slug>.html), listant ses figurines (voir tag_listings).
+    """
+    if listings is None:
+        listings = tag_listings(figurines)
+    shared = page_context(listings, asset_url)
+    written = set()
+    for filename, context in html_pages(figurines, listings, page_size):
+        render_page(template, output_dir, filename, dict(shared, **context))
+        written.add(filename)
+    remove_stale_pages(output_dir, written)
+
+def page_context(listings, asset_url=None):
+    """Variables du template communes à toutes les pages"""
+    return {
+        "tags": list(listings),
+        "tag_url": lambda tag: tag_page_url(listings[tag]["slug"]),
+        "asset_url": asset_url or (lambda path: path),
+    }
+
+def html_pages(figurines, listings, page_size=PAGE_SIZE):
+    """Produit (nom du fichier, variables du template) pour chaque page HTML : galerie puis tags"""
+    yield from _listing_pages(figurines, range(len(figurines)), page_url, page_size, {})
+    for tag, listing in listings.items():
+        yield from _listing_pages(figurines, listing["positions"],
+                                  lambda page, slug=listing["slug"]: tag_page_url(slug, page),
+                                  page_size, {"current_tag": tag})
+
+def _listing_pages(figurines, positions, url, page_size, context):
+    page_count = max(1, -(-len(positions) // page_size))
+    for page in range(1, page_count + 1):
+        start = (page - 1) * page_size
+        yield url(page), dict(
+            context,
+            figurines=[figurines[position] for position in positions[start:start + page_size]],
+            first_position=start,
+            page=page,
+            page_count=page_count,
+            page_url=url,
+            eager_cards=EAGER_CARDS if page == 1 else 0,
+        )
+
+def render_page(template, output_dir, filename, context):
+    """Écrit une page HTML par morceaux (`stream`), sans construire tout le HTML en mémoire"""
+    with tracing.span("site.render", page=filename):
+        stream = template.stream(**context)
+        stream.enable_buffering(size=16)
+        stream.dump(os.path.join(output_dir, filename), encoding='utf-8')
+
+def remove_stale_pages(output_dir, written):
+    """Supprime les pages d'une collection plus grande, ou de tags disparus, d'une génération précédente"""
+    for pattern in ('page-*.html', 'tag-*.html'):
+        for path in glob.glob(os.path.join(output_dir, pattern)):
+            if os.path.basename(path) not in written:
+                os.remove(path)
+
+def write_cache_headers(output_dir, immutable_dirs=IMMUTABLE_ASSET_DIRS):
+    """Écrit le fichier _headers : cache permanent pour les ressources aux noms empreintés"""
+    with open(os.path.join(output_dir, '_headers'), 'w', encoding='utf-8') as f:
+        for folder in immutable_dirs:
+            f.write(f"/{folder}/*\n  Cache-Control: {IMMUTABLE_CACHE_CONTROL}\n")
+
+@tracing.traced("site")
+def generate_site(template_path, output_dir, data_file, variants_file=None, asset_urls=None, atlas_file=None):
+    """Génère le site statique (pages HTML et données de la collection)
+
+    `data_file` peut être le fichier JSON ou la base SQLite de la collection.
+    `atlas_file` est l'index des planches de miniatures (facultatif, voir
+    prepare_data.create_atlases) utilisées par les cartes de la galerie.
+    `asset_urls` associe le chemin des ressources (css/styles.css, images/full/x.jpg...)
+    à leur nom publié, tel que renvoyé par copy_assets.
+    """
+    def asset_url(path):
+        return (asset_urls or {}).get(path, path)
 
-def generate_site(template_path, output_dir, data_file):
-    """Génère le site statique"""
     # Crée le répertoire de sortie s'il n'existe pas
     if not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
     
-    # Charge les données
-    with open(data_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Charge le template
-    with open(template_path, 'r', encoding='utf-8') as f:
-        template_content = f.read()
+    # Charge les données et ajoute les images responsives
+    figurines = load_figurines(data_file)
+    with tracing.span("site.variants"):
+        figurines = attach_sprites(figurines, load_atlas_index(atlas_file), asset_url=asset_url)
+        figurines = attach_image_variants(figurines, load_variants_index(variants_file), asset_url=asset_url)
     
-    template = Template(template_content)
+    # Figurines de chaque tag (pages HTML par tag et fichiers data/tags)
+    listings = tag_listings(figurines)
     
-    # Génère la page HTML
-    html_content = template.render(figurines=data['figurines'])
+    # Génère les pages HTML (cartes pré-rendues)
+    write_html_pages(load_template(template_path), output_dir, figurines, asset_url=asset_url, listings=listings)
     
-    # Écrit le fichier HTML
-    with open(os.path.join(output_dir, 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    # Écrit les données utilisées par main.js
+    write_site_data(output_dir, figurines, listings=listings)
     
     print("Site généré avec succès!")
 
-def copy_assets(src_dir, dest_dir, subdirs=None):
-    """Copie les ressources (CSS, JS, images) vers le répertoire de destination"""
+def copy_assets(src_dir, dest_dir, subdirs=None, link=False, verify_hash=False, fingerprint=False, url_prefix=""):
+    """Synchronise les ressources (CSS, JS, images) vers le répertoire de destination
+
+    Seuls les fichiers modifiés sont copiés et les fichiers disparus de la source
+    sont supprimés (voir asset_sync.sync_tree). Avec `link`, les fichiers sont
+    liés plutôt que copiés quand le système de fichiers le permet ; avec
+    `fingerprint`, ils sont publiés sous un nom portant l'empreinte de leur contenu.
+    Renvoie {chemin de la ressource: chemin publié}, préfixés par `url_prefix`.
+    """
     if subdirs is None:
         subdirs = []
     
+    asset_urls = {}
     for subdir in subdirs:
         src_path = os.path.join(src_dir, subdir)
         dest_path = os.path.join(dest_dir, subdir)
         
         if os.path.exists(src_path):
-            if os.path.exists(dest_path):
-                shutil.rmtree(dest_path)
-            shutil.copytree(src_path, dest_path)
-            print(f"Ressources {subdir} copiées.")
+            with tracing.span("assets.copy", subdir=subdir):
+                summary = sync_tree(src_path, dest_path, link=link, verify_hash=verify_hash, fingerprint=fingerprint)
+            for source, published in summary["files"].items():
+                asset_urls[f"{url_prefix}{subdir}/{source}"] = f"{url_prefix}{subdir}/{published}"
+            print(f"Ressources {subdir} : {summary['copied']} copiées, "
+                  f"{summary['deleted']} supprimées, {summary['unchanged']} inchangées.")
+    
+    return asset_urls
 
 if __name__ == "__main__":
+    # --trace[=fichier] et --profile=étape : voir tracing.py
+    sys.argv = tracing.configure(sys.argv)
+    
     # Structure du projet
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     src_dir = os.path.join(project_root, "src")
     data_dir = os.path.join(project_root, "data")
     dist_dir = os.path.join(project_root, "dist")
     
+    # Copie les ressources sous des noms empreintés (mis en cache sans limite)
+    asset_urls = copy_assets(src_dir, dist_dir, ["css", "js"], fingerprint=True)
+    asset_urls.update(copy_assets(os.path.join(project_root, "images"), 
+                                  os.path.join(dist_dir, "images"),
+                                  ["thumbnails", "variants", "full", "atlases"],
+                                  verify_hash=True, fingerprint=True, url_prefix="images/"))
+    write_cache_headers(dist_dir)
+    
     # Génère le site
     generate_site(
         os.path.join(src_dir, "template.html"),
         dist_dir,
-        os.path.join(data_dir, "collection.json")
+        store_path(data_dir),
+        os.path.join(project_root, "images", "variants", "variants.json"),
+        asset_urls,
+        os.path.join(project_root, "images", "atlases", "atlases.json")
     )
     
-    # Copie les ressources
-    copy_assets(src_dir, dist_dir, ["css", "js"])
-    copy_assets(os.path.join(project_root, "images"), 
-                os.path.join(dist_dir, "images"),
-                ["thumbnails", "full"])
-    
-    # Copie le fichier de données
-    os.makedirs(os.path.join(dist_dir, "data"), exist_ok=True)
-    shutil.copy(
-        os.path.join(data_dir, "collection.json"),
-        os.path.join(dist_dir, "data", "collection.json")
-    )
\ No newline at end of file
+    # Versions compressées des fichiers texte, servies telles quelles par le serveur web
+    summary = precompress_tree(dist_dir)
+    print(f"Fichiers précompressés ({', '.join(compression_formats())}) : {summary['compressed']} compressés, "
+          f"{summary['skipped']} inchangés, {summary['deleted']} supprimés.")
\ No newline at end of file
@@ -0,0 +1,174 @@
+# coding: utf-8
+"""Empreintes perceptuelles (dHash) des images et recherche rapide des images presque identiques
+
+L'empreinte est calculée une fois à l'import et conservée dans la collection
+(champ "phash", 16 caractères hexadécimaux).
+
+Utilisation en ligne de commande (empreintes manquantes puis rapport des doublons) :
+    python image_hash.py duplicates
+"""
+import os
+import sys
+from PIL import Image
+from image_loader import load_thumbnail
+from collection_store import open_store, store_backend, store_path
+
+# Côté de la grille du dHash : 8 → empreinte de 64 bits
+DHASH_SIZE = 8
+
+# Distance de Hamming maximale entre deux empreintes d'images jugées identiques
+# (réexport, redimensionnement, recompression)
+DUPLICATE_DISTANCE = 6
+
+
+def dhash(path, hash_size=DHASH_SIZE):
+    """Empreinte dHash d'une image : sens du gradient horizontal sur une grille réduite
+
+    L'image est décodée directement à petite taille (voir image_loader.load_thumbnail),
+    ce qui rend le calcul rapide même pour des photos de plusieurs Mo.
+    """
+    img = load_thumbnail(path, (hash_size * 8, hash_size * 8))
+    img = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(img.getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_to_hex(value, hash_size=DHASH_SIZE):
+    """Empreinte → texte hexadécimal stocké dans la collection (champ "phash")"""
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hex_to_hash(text):
+    return int(text, 16)
+
+
+def hamming_distance(a, b):
+    """Nombre de bits différents entre deux empreintes"""
+    return bin(a ^ b).count("1")
+
+
+class ImageHashIndex:
+    """Index d'empreintes pour trouver celles à distance ≤ `max_distance` (multi-index hashing).
+
+    L'empreinte est découpée en `max_distance + 1` morceaux : deux empreintes à
+    distance ≤ `max_distance` ont forcément au moins un morceau identique (principe
+    des tiroirs). Une recherche ne compare donc que les empreintes partageant un
+    morceau, au lieu de toute la collection.
+    """
+
+    def __init__(self, max_distance=DUPLICATE_DISTANCE, bits=DHASH_SIZE * DHASH_SIZE):
+        self.max_distance = max_distance
+        chunk_count = max_distance + 1
+        self.chunks = []  # (décalage, masque) de chaque morceau
+        shift = 0
+        for position in range(chunk_count):
+            width = bits // chunk_count + (1 if position < bits % chunk_count else 0)
+            self.chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [{} for _ in self.chunks]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value, item):
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            table.setdefault((value >> shift) & mask, []).append((value, item))
+        self.count += 1
+
+    def remove(self, value, item):
+        """Retire `item` (comparé par identité) ajouté avec l'empreinte `value`"""
+        removed = False
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            key = (value >> shift) & mask
+            bucket = table.get(key, [])
+            for position, (_, candidate) in enumerate(bucket):
+                if candidate is item:
+                    del bucket[position]
+                    removed = True
+                    break
+            if not bucket:
+                table.pop(key, None)
+        if removed:
+            self.count -= 1
+
+    def search(self, value, max_distance=None):
+        """Renvoie [(distance, item)] des empreintes proches de `value`, les plus proches d'abord"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        seen = set()
+        results = []
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            for candidate_value, item in table.get((value >> shift) & mask, ()):
+                if id(item) in seen:
+                    continue
+                seen.add(id(item))
+                distance = hamming_distance(value, candidate_value)
+                if distance <= max_distance:
+                    results.append((distance, item))
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+def find_duplicates(figurines, max_distance=DUPLICATE_DISTANCE):
+    """Renvoie les paires (figurine, figurine déjà vue, distance) d'images probablement identiques
+
+    Seules les figurines ayant une empreinte ("phash") sont comparées.
+    """
+    index = ImageHashIndex(max_distance)
+    pairs = []
+    for figurine in figurines:
+        if not figurine.get("phash"):
+            continue
+        value = hex_to_hash(figurine["phash"])
+        for distance, other in index.search(value):
+            pairs.append((figurine, other, distance))
+        index.add(value, figurine)
+    return pairs
+
+
+def print_duplicates_report(pairs):
+    """Affiche le rapport des doublons probables"""
+    if not pairs:
+        print("Aucun doublon probable.")
+        return
+    print(f"{len(pairs)} doublon(s) probable(s) :")
+    for figurine, other, distance in pairs:
+        print(f"  {figurine.get('name')} ({figurine.get('fullImage')})"
+              f" ~ {other.get('name')} ({other.get('fullImage')}) : distance {distance}")
+
+
+def main(argv):
+    """Calcule les empreintes manquantes de la collection, les enregistre et affiche les doublons probables"""
+    if len(argv) != 2 or argv[1] != "duplicates":
+        print("Usage: python image_hash.py duplicates")
+        return 1
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    backend = store_backend()
+    store = open_store(store_path(os.path.join(project_root, "data"), backend), backend)
+    try:
+        figurines = store.load()
+        changed = 0
+        for figurine in figurines:
+            image = os.path.join(project_root, figurine.get("fullImage", ""))
+            if not figurine.get("phash") and os.path.isfile(image):
+                figurine["phash"] = hash_to_hex(dhash(image))
+                changed += 1
+        # Une seule écriture : un put par figurine réécrirait tout le fichier JSON à chaque fois
+        if changed:
+            store.save_all(figurines)
+        print_duplicates_report(find_duplicates(figurines))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,132 @@
+# coding: utf-8
+"""Chargement d'images à résolution réduite, partagé par les scripts et le gestionnaire"""
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image  # Nécessite l'installation de Pillow (pip install Pillow)
+
+# Au-delà de ce nombre de pixels, l'image est refusée plutôt que décodée
+MAX_IMAGE_PIXELS = 120_000_000
+
+# L'image est décodée au moins à `REDUCING_GAP` fois la taille finale avant le
+# rééchantillonnage de qualité, pour éviter le crénelage
+REDUCING_GAP = 2
+
+
+def check_image_size(img, max_pixels=MAX_IMAGE_PIXELS):
+    """Vérifie, à partir de l'en-tête seulement, que l'image reste dans la limite de pixels"""
+    pixels = img.width * img.height
+    if max_pixels and pixels > max_pixels:
+        raise Image.DecompressionBombError(
+            f"Image trop grande ({img.width}x{img.height}, limite {max_pixels} pixels)"
+        )
+
+
+def load_thumbnail(path, size, max_pixels=MAX_IMAGE_PIXELS):
+    """Charge une image réduite pour tenir dans `size`.
+
+    Le coût dépend de la taille de sortie et non de celle de la source : les JPEG
+    sont réduits directement par le décodeur (mode draft, facteurs 1/2 à 1/8),
+    puis un sous-échantillonnage par blocs (`reduce`) rapproche l'image de la
+    taille finale avant le rééchantillonnage de qualité.
+
+    La hauteur de `size` peut valoir None : elle est alors déduite de la largeur
+    en conservant les proportions de la source.
+    """
+    with Image.open(path) as img:
+        check_image_size(img, max_pixels)
+
+        if size[1] is None:
+            size = (size[0], max(1, round(img.height * size[0] / img.width)))
+        target = (size[0] * REDUCING_GAP, size[1] * REDUCING_GAP)
+
+        if img.format == "JPEG":
+            img.draft(None, target)
+        img.load()
+
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            if img.mode in ("P", "1"):
+                # `reduce` ne gère pas les images en palette ou en noir et blanc
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            img = img.reduce(factor)
+
+        img.thumbnail(size, reducing_gap=None)
+        return img
+
+
+class PreviewCache:
+    """Cache LRU d'images réduites, borné en mémoire et partagé entre threads.
+
+    Les entrées sont indexées par chemin et date de modification : une image
+    remplacée sur le disque est rechargée.
+    """
+
+    def __init__(self, size, max_bytes=64 * 1024 * 1024):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.loading = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        return path, os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def _image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, path):
+        """Renvoie l'image en cache pour `path`, ou None"""
+        key = self._key(path)
+        with self.lock:
+            img = self.entries.get(key)
+            if img is not None:
+                self.entries.move_to_end(key)
+            return img
+
+    def load(self, path):
+        """Renvoie l'image réduite de `path`, depuis le cache ou en la chargeant"""
+        key = self._key(path)
+        with self.lock:
+            img = self.entries.get(key)
+            if img is not None:
+                self.entries.move_to_end(key)
+                return img
+
+        img = load_thumbnail(path, self.size)
+        self._put(key, img)
+        return img
+
+    def prefetch(self, path):
+        """Charge `path` dans le cache s'il n'y est pas déjà (destiné à un thread de travail)"""
+        try:
+            key = self._key(path)
+        except OSError:
+            return
+        with self.lock:
+            if key in self.entries or key in self.loading:
+                return
+            self.loading.add(key)
+        try:
+            self._put(key, load_thumbnail(path, self.size))
+        except Exception:
+            # Le préchargement est opportuniste : l'erreur sera signalée au chargement réel
+            pass
+        finally:
+            with self.lock:
+                self.loading.discard(key)
+
+    def _put(self, key, img):
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self._image_bytes(self.entries.pop(key))
+            self.entries[key] = img
+            self.current_bytes += self._image_bytes(img)
+
+            # Évincer les images les moins récemment utilisées
+            while self.current_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= self._image_bytes(evicted)
@@ -0,0 +1,167 @@
+# coding: utf-8
+"""Versions précompressées des fichiers texte du site (.gz, et .br si brotli est installé)
+
+Chaque fichier texte du site (HTML, CSS, JS, JSON...) reçoit à côté de lui sa
+version compressée au niveau maximal (index.html.gz, index.html.br) : le
+serveur web sert directement ces octets (gzip_static / brotli_static de nginx,
+Caddy `precompressed`...) sans compresser à chaque requête.
+
+Les fichiers sont compressés en parallèle. Un manifeste enregistre la taille, la
+date et le hash de chaque source : une source inchangée, ou seulement réécrite
+à l'identique (pages régénérées), n'est pas recompressée.
+"""
+import os
+import gzip
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from asset_sync import file_hash, load_manifest, save_manifest
+import tracing
+
+try:
+    import brotli  # Optionnel (pip install brotli) : fichiers .br, plus petits que .gz
+except ImportError:
+    brotli = None
+
+# Manifeste de compression, écrit à la racine du site
+COMPRESS_MANIFEST = ".compress-manifest.json"
+
+TEXT_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg', '.txt', '.xml', '.map')
+
+# En dessous de cette taille (octets), la compression ne fait rien gagner
+MIN_SIZE = 256
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Fichiers compressés par tâche (les fichiers du site sont nombreux et souvent petits)
+FILES_PER_TASK = 32
+
+
+def compression_formats():
+    """Extensions des versions compressées produites : .gz, et .br si le module brotli est disponible"""
+    return ["gz", "br"] if brotli is not None else ["gz"]
+
+
+def _compress(data, fmt):
+    if fmt == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 : même contenu, même fichier compressé
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _write_atomic(path, data, mtime_ns):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def _compress_task(jobs, formats):
+    """Tâche exécutée dans un processus de travail : compresse un lot de fichiers.
+
+    `jobs` est une liste de (chemin, hash connu, formats écrits) ; un fichier dont
+    le contenu a toujours ce hash (réécrit à l'identique) et dont les versions
+    compressées existent n'est pas recompressé.
+    Renvoie [(chemin, statut, hash, formats écrits)].
+    """
+    results = []
+    for path, known_hash, known_written in jobs:
+        content_hash = file_hash(path)
+        if known_hash == content_hash and all(os.path.exists(f"{path}.{fmt}") for fmt in known_written):
+            results.append((path, "skipped", content_hash, known_written))
+            continue
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        mtime_ns = os.stat(path).st_mtime_ns
+        written = []
+        for fmt in formats:
+            compressed = _compress(data, fmt)
+            if len(compressed) < len(data):
+                _write_atomic(f"{path}.{fmt}", compressed, mtime_ns)
+                written.append(fmt)
+            elif os.path.exists(f"{path}.{fmt}"):
+                # Rien à gagner : une ancienne version compressée ne doit pas être servie
+                os.remove(f"{path}.{fmt}")
+        results.append((path, "compressed", content_hash, written))
+    return results
+
+
+def _text_files(root):
+    """Fichiers texte du site, par chemin relatif → os.stat_result (fichiers cachés ignorés)"""
+    files = {}
+    for folder, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in filenames:
+            if name.startswith(".") or not name.lower().endswith(TEXT_EXTENSIONS):
+                continue
+            path = os.path.join(folder, name)
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = os.stat(path)
+    return files
+
+
+@tracing.traced("site.compress")
+def precompress_tree(root, workers=None, min_size=MIN_SIZE):
+    """Écrit les versions compressées des fichiers texte de `root` (voir le module)
+
+    Les versions compressées dont la source a disparu (ou est devenue trop petite)
+    sont supprimées. Renvoie le résumé {"compressed": n, "skipped": n, "deleted": n}.
+    """
+    manifest_path = os.path.join(root, COMPRESS_MANIFEST)
+    previous = load_manifest(manifest_path)
+    formats = compression_formats()
+    files = _text_files(root)
+
+    entries = {}
+    jobs = []
+    summary = {"compressed": 0, "skipped": 0, "deleted": 0}
+    for relative, stat in files.items():
+        if stat.st_size < min_size:
+            continue
+        entry = previous.get(relative, {})
+        state = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        path = os.path.join(root, relative)
+        if (entry.get("formats") == formats and {k: entry.get(k) for k in state} == state
+                and all(os.path.exists(f"{path}.{fmt}") for fmt in entry.get("written", []))):
+            entries[relative] = entry
+            summary["skipped"] += 1
+            continue
+        entries[relative] = dict(state, formats=formats)
+        if entry.get("formats") == formats:
+            jobs.append((path, entry.get("hash"), entry.get("written", [])))
+        else:
+            # Autres formats (brotli installé depuis...) : tout est recompressé
+            jobs.append((path, None, []))
+
+    def record(results):
+        for path, status, content_hash, written in results:
+            entry = entries[os.path.relpath(path, root).replace(os.sep, "/")]
+            entry["hash"] = content_hash
+            entry["written"] = written
+            summary[status] += 1
+
+    batches = [jobs[start:start + FILES_PER_TASK] for start in range(0, len(jobs), FILES_PER_TASK)]
+    if workers == 1 or len(batches) <= 1:
+        for batch in batches:
+            record(_compress_task(batch, formats))
+    elif batches:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for results in executor.map(_compress_task, batches, repeat(formats)):
+                record(results)
+
+    # Versions compressées d'anciens fichiers, ou de fichiers désormais trop petits
+    for folder, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for name in filenames:
+            source, ext = os.path.splitext(name)
+            if ext not in (".gz", ".br") or not source.lower().endswith(TEXT_EXTENSIONS):
+                continue
+            relative = os.path.relpath(os.path.join(folder, source), root).replace(os.sep, "/")
+            if ext[1:] not in entries.get(relative, {}).get("written", []):
+                os.remove(os.path.join(folder, name))
+                summary["deleted"] += 1
+
+    if entries != previous:
+        save_manifest(manifest_path, entries)
+    return summary
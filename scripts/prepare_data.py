@@ -1,48 +1,701 @@
 ﻿# coding: utf-8
 import os
+import sys
 import json
+import math
+import time
+import tempfile
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image  # Nécessite l'installation de Pillow (pip install Pillow)
+import tracing
+from image_loader import load_thumbnail
+from asset_sync import file_hash, load_manifest, save_manifest, sync_file
+from image_hash import ImageHashIndex, dhash, hash_to_hex, hex_to_hash, print_duplicates_report
+from collection_store import open_store, store_backend, store_path, write_json_stream, STORE_FILES
 
-def create_thumbnails(input_folder, output_folder, size=(300, 300)):
-    """Crée des miniatures pour toutes les images dans le dossier d'entrée"""
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Fichiers (dans les dossiers de sortie) qui mémorisent l'état des sources déjà traitées
+THUMBNAIL_MANIFEST = ".thumbnails-manifest.json"
+VARIANTS_MANIFEST = ".variants-manifest.json"
+ATLAS_MANIFEST = ".atlases-manifest.json"
+
+# Index des variantes responsives lu par generate_site
+VARIANTS_INDEX = "variants.json"
+
+# Index des planches de miniatures (sprites) lu par generate_site
+ATLAS_INDEX = "atlases.json"
+
+# Figurines par planche : une planche par page de données du site (generate_site.PAGE_SIZE)
+ATLAS_PAGE_SIZE = 100
+
+# Marge (pixels) entre les miniatures d'une planche : le redimensionnement d'une
+# miniature dans le navigateur ne déborde pas sur ses voisines
+ATLAS_PADDING = 2
+
+# Largeurs (en pixels) et formats des variantes responsives
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_FORMATS = ("webp", "jpeg")
+VARIANT_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+# Version du schéma de nommage des variantes (nom-ext-320w.webp)
+VARIANT_NAMING = 2
+VARIANT_SAVE_OPTIONS = {
+    "webp": {"method": 4},
+    "jpeg": {"optimize": True, "progressive": True},
+}
+
+# Nombre de caractères du hash SHA-256 formant le nom des images importées
+IMAGE_NAME_HASH_LENGTH = 20
+
+# Convention de nommage de l'import : "dragon_rouge__peint_28mm.jpg" donne la figurine
+# "Dragon Rouge" avec les tags "peint" et "28mm" ; les dossiers deviennent aussi des tags
+FILENAME_TAGS_SEPARATOR = "__"
+
+# Imports en cours par processus de travail (borne la mémoire des gros imports)
+IMPORT_QUEUE_PER_WORKER = 8
+
+# Qualité d'encodage par format pour chaque préréglage
+QUALITY_PRESETS = {
+    "low": {"webp": 60, "jpeg": 65},
+    "medium": {"webp": 75, "jpeg": 80},
+    "high": {"webp": 85, "jpeg": 90},
+}
+
+@tracing.traced("thumbnail")
+def _thumbnail_task(source, output_folder, filename, settings, known_hash=None):
+    """Tâche exécutée dans un processus de travail : crée une miniature.
+
+    Si `known_hash` correspond au contenu actuel de la source (fichier simplement
+    touché ou recopié), les sorties existantes sont conservées.
+    Renvoie (statut, hash, durée, sorties).
+    """
+    start = time.perf_counter()
+    with tracing.span("image.hash", file=filename):
+        content_hash = file_hash(source)
+    if known_hash == content_hash:
+        return "skipped", content_hash, time.perf_counter() - start, None
+
+    with tracing.span("image.decode", file=filename):
+        img = load_thumbnail(source, tuple(settings["size"]))
+    with tracing.span("image.encode", file=filename):
+        img.save(os.path.join(output_folder, filename))
+    outputs = [{"file": filename, "width": img.width, "height": img.height}]
+    return "built", content_hash, time.perf_counter() - start, outputs
+
+@tracing.traced("variants.image")
+def _variants_task(source, output_folder, filename, settings, known_hash=None):
+    """Tâche exécutée dans un processus de travail : crée les variantes responsives.
+
+    La source est décodée une seule fois à la plus grande largeur utile, les
+    largeurs inférieures sont dérivées de cette image.
+    """
+    start = time.perf_counter()
+    with tracing.span("image.hash", file=filename):
+        content_hash = file_hash(source)
+    if known_hash == content_hash:
+        return "skipped", content_hash, time.perf_counter() - start, None
+
+    # L'extension source fait partie du nom : figurine.png et figurine.jpg ne s'écrasent pas
+    stem, source_ext = os.path.splitext(filename)
+    stem = f"{stem}-{source_ext[1:].lower()}" if source_ext else stem
+    quality = QUALITY_PRESETS[settings["quality"]]
+    outputs = []
+
+    with Image.open(source) as header:
+        source_width = header.width
+    # Pas d'agrandissement : les largeurs supérieures à la source sont ramenées à celle-ci
+    widths = sorted({min(width, source_width) for width in settings["widths"]}, reverse=True)
+
+    with tracing.span("image.decode", file=filename):
+        img = load_thumbnail(source, (widths[0], None))
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+
+    for width in widths:
+        if img.width != width:
+            with tracing.span("image.resize", file=filename, width=width):
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+
+        for fmt in settings["formats"]:
+            variant = img
+            if fmt == "jpeg" and variant.mode == "RGBA":
+                # Le JPEG ne gère pas la transparence : fond blanc
+                variant = Image.new("RGB", img.size, (255, 255, 255))
+                variant.paste(img, mask=img.getchannel("A"))
+
+            variant_name = f"{stem}-{width}w.{VARIANT_EXTENSIONS[fmt]}"
+            with tracing.span("image.encode", file=variant_name):
+                variant.save(
+                    os.path.join(output_folder, variant_name),
+                    fmt.upper(),
+                    quality=quality[fmt],
+                    **VARIANT_SAVE_OPTIONS[fmt]
+                )
+            outputs.append({"file": variant_name, "width": img.width, "height": img.height, "format": fmt})
+
+    return "built", content_hash, time.perf_counter() - start, outputs
+
+def _process_images(input_folder, output_folder, task, settings, manifest_name, label, workers=None, force=False):
+    """Applique `task` à toutes les images du dossier d'entrée.
+
+    Le travail est réparti sur plusieurs processus (`workers`, par défaut un par
+    cœur). Un manifeste enregistre pour chaque source sa taille, sa date de
+    modification, son hash, les paramètres et les fichiers de sortie : les
+    sources inchangées sont ignorées, sauf si `force` est vrai.
+    Renvoie (entrées du manifeste, résumé {"built", "skipped", "failed"}).
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
-    
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img = Image.open(os.path.join(input_folder, filename))
-            img.thumbnail(size)
-            img.save(os.path.join(output_folder, filename))
-            print(f"Thumbnail created for {filename}")
-
-def create_collection_json(image_folder, output_json, default_tags=None):
-    """Crée un fichier JSON avec les métadonnées des figurines"""
+
+    manifest_path = os.path.join(output_folder, manifest_name)
+    previous = load_manifest(manifest_path).get("files", {})
+    entries = {}
+    jobs = []
+    summary = {"built": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+
+        source = os.path.join(input_folder, filename)
+        stat = os.stat(source)
+        entry = previous.get(filename)
+        known_hash = None
+
+        if (not force and entry and entry.get("settings") == settings and entry.get("outputs")
+                and all(os.path.exists(os.path.join(output_folder, o["file"])) for o in entry["outputs"])):
+            if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime_ns:
+                entries[filename] = entry
+                summary["skipped"] += 1
+                continue
+            # Même taille mais date différente : le hash tranchera dans le processus de travail
+            if entry.get("size") == stat.st_size:
+                known_hash = entry.get("hash")
+
+        entries[filename] = {
+            "source": source,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "settings": settings,
+            "outputs": entry.get("outputs") if known_hash else None,
+        }
+        jobs.append((filename, source, known_hash))
+
+    def record(filename, status, content_hash, elapsed, outputs):
+        entries[filename]["hash"] = content_hash
+        if outputs is not None:
+            entries[filename]["outputs"] = outputs
+        summary[status] += 1
+        if status == "built":
+            print(f"{label} created for {filename} ({elapsed * 1000:.0f} ms)")
+
+    def record_failure(filename, error):
+        del entries[filename]
+        summary["failed"] += 1
+        print(f"{label} failed for {filename}: {error}")
+
+    if workers == 1 or len(jobs) <= 1:
+        for filename, source, known_hash in jobs:
+            try:
+                record(filename, *task(source, output_folder, filename, settings, known_hash))
+            except Exception as e:
+                record_failure(filename, e)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(task, source, output_folder, filename, settings, known_hash): filename
+                for filename, source, known_hash in jobs
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    record(filename, *future.result())
+                except Exception as e:
+                    record_failure(filename, e)
+
+    with tracing.span("manifest.write", file=manifest_name):
+        save_manifest(manifest_path, {"files": entries})
+
+    elapsed = time.perf_counter() - start
+    print(f"{label}s: {summary['built']} built, {summary['skipped']} skipped, "
+          f"{summary['failed']} failed in {elapsed:.2f} s")
+    return entries, summary
+
+@tracing.traced("thumbnails")
+def create_thumbnails(input_folder, output_folder, size=(300, 300), workers=None, force=False):
+    """Crée des miniatures pour toutes les images dans le dossier d'entrée.
+
+    Seules les sources nouvelles ou modifiées sont traitées, en parallèle.
+    Renvoie un dictionnaire {"built": n, "skipped": n, "failed": n}.
+    """
+    settings = {"size": list(size)}
+    _, summary = _process_images(input_folder, output_folder, _thumbnail_task, settings,
+                                 THUMBNAIL_MANIFEST, "Thumbnail", workers, force)
+    return summary
+
+@tracing.traced("variants")
+def create_variants(input_folder, output_folder, widths=VARIANT_WIDTHS, formats=VARIANT_FORMATS,
+                    quality="medium", workers=None, force=False):
+    """Crée plusieurs largeurs de chaque image (WebP et JPEG) pour les srcset du site.
+
+    `quality` est l'un des préréglages de QUALITY_PRESETS. Un index
+    (VARIANTS_INDEX) décrit pour chaque image source les fichiers produits et
+    leurs dimensions ; generate_site s'en sert pour les attributs srcset,
+    width et height.
+    Renvoie un dictionnaire {"built": n, "skipped": n, "failed": n}.
+    """
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Préréglage de qualité inconnu: {quality}")
+
+    # "naming" change quand le nom des fichiers produits change : les variantes sont recréées
+    settings = {"widths": sorted(widths), "formats": list(formats), "quality": quality,
+                "naming": VARIANT_NAMING}
+    entries, summary = _process_images(input_folder, output_folder, _variants_task, settings,
+                                       VARIANTS_MANIFEST, "Variant", workers, force)
+
+    index = {filename: entry["outputs"] for filename, entry in sorted(entries.items())}
+    save_manifest(os.path.join(output_folder, VARIANTS_INDEX), index)
+    return summary
+
+def pack_atlas(sizes, padding=ATLAS_PADDING):
+    """Range des rectangles (largeur, hauteur) en étagères, les plus hauts d'abord
+
+    La largeur visée est celle d'une planche à peu près carrée.
+    Renvoie ([(x, y)] dans l'ordre de `sizes`, largeur, hauteur de la planche).
+    """
+    if not sizes:
+        return [], 0, 0
+    area = sum((width + padding) * (height + padding) for width, height in sizes)
+    max_width = max(max(width for width, _ in sizes), math.ceil(math.sqrt(area)))
+
+    positions = [None] * len(sizes)
+    x = y = shelf_height = atlas_width = 0
+    for index in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        width, height = sizes[index]
+        if x and x + width > max_width:
+            y += shelf_height + padding
+            x = shelf_height = 0
+        positions[index] = (x, y)
+        atlas_width = max(atlas_width, x + width)
+        x += width + padding
+        shelf_height = max(shelf_height, height)
+    return positions, atlas_width, y + shelf_height
+
+@tracing.traced("atlas")
+def _atlas_task(name, thumbnails_folder, output_folder, members, settings):
+    """Tâche exécutée dans un processus de travail : assemble une planche de miniatures.
+
+    Renvoie (fichier, largeur, hauteur, {miniature: [x, y, largeur, hauteur]}).
+    """
+    fmt = settings["format"]
+    images = []
+    for filename in members:
+        with tracing.span("image.decode", file=filename):
+            img = Image.open(os.path.join(thumbnails_folder, filename))
+            img.load()
+        images.append(img)
+
+    positions, width, height = pack_atlas([img.size for img in images], settings["padding"])
+    # Transparence conservée en WebP ; le JPEG reçoit un fond blanc
+    transparent = fmt == "webp" and any(
+        img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info for img in images)
+    atlas = Image.new("RGBA" if transparent else "RGB", (width, height),
+                      (0, 0, 0, 0) if transparent else (255, 255, 255))
+    thumbnails = {}
+    for filename, img, (x, y) in zip(members, images, positions):
+        img = img.convert("RGBA")
+        atlas.paste(img, (x, y), None if transparent else img)
+        thumbnails[filename] = [x, y, img.width, img.height]
+
+    atlas_file = f"{name}.{VARIANT_EXTENSIONS[fmt]}"
+    with tracing.span("image.encode", file=atlas_file):
+        atlas.save(
+            os.path.join(output_folder, atlas_file),
+            fmt.upper(),
+            quality=QUALITY_PRESETS[settings["quality"]][fmt],
+            **VARIANT_SAVE_OPTIONS[fmt]
+        )
+    return atlas_file, width, height, thumbnails
+
+@tracing.traced("atlases")
+def create_atlases(collection_file, thumbnails_folder, output_folder, page_size=ATLAS_PAGE_SIZE,
+                   fmt="webp", quality="medium", workers=None, force=False):
+    """Assemble les miniatures de chaque page du site en une planche (sprite) WebP ou JPEG.
+
+    Les figurines sont découpées dans l'ordre de la collection, `page_size` par
+    planche comme les pages de données du site : une page de la galerie ne
+    télécharge qu'une image au lieu d'une par carte. Un index (ATLAS_INDEX)
+    donne la position de chaque miniature dans sa planche ; generate_site s'en
+    sert pour les cartes de la galerie.
+    Seules les planches dont les miniatures ont changé sont réassemblées. Les
+    planches suivent l'ordre de la collection : à relancer après un import ou
+    une modification des miniatures.
+    Renvoie un dictionnaire {"built": n, "skipped": n, "failed": n}.
+    """
+    if fmt not in VARIANT_EXTENSIONS:
+        raise ValueError(f"Format de planche inconnu: {fmt}")
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Préréglage de qualité inconnu: {quality}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    store = open_store(collection_file)
+    try:
+        figurines = store.load()
+    finally:
+        store.close()
+
+    settings = {"format": fmt, "quality": quality, "padding": ATLAS_PADDING}
+    manifest_path = os.path.join(output_folder, ATLAS_MANIFEST)
+    previous = load_manifest(manifest_path).get("atlases", {})
+    entries = {}
+    jobs = []
+    summary = {"built": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+
+    for page, first in enumerate(range(0, len(figurines), page_size), 1):
+        # Miniatures de la page, sans doublons (images partagées) ni fichiers manquants
+        members = {}
+        for figurine in figurines[first:first + page_size]:
+            filename = os.path.basename(figurine.get("thumbnail") or "")
+            if filename and filename not in members:
+                path = os.path.join(thumbnails_folder, filename)
+                if os.path.exists(path):
+                    stat = os.stat(path)
+                    members[filename] = [stat.st_size, stat.st_mtime_ns]
+        if not members:
+            continue
+
+        name = f"atlas-{page:04d}"
+        entry = previous.get(name)
+        if (not force and entry and entry.get("settings") == settings and entry.get("members") == members
+                and os.path.exists(os.path.join(output_folder, entry["file"]))):
+            entries[name] = entry
+            summary["skipped"] += 1
+            continue
+        entries[name] = {"page": page, "settings": settings, "members": members}
+        jobs.append((name, list(members)))
+
+    def record(name, atlas_file, width, height, thumbnails):
+        entries[name].update(file=atlas_file, width=width, height=height, thumbnails=thumbnails)
+        summary["built"] += 1
+        print(f"Atlas {atlas_file}: {len(thumbnails)} thumbnails, {width}x{height}")
+
+    def record_failure(name, error):
+        del entries[name]
+        summary["failed"] += 1
+        print(f"Atlas failed for {name}: {error}")
+
+    if workers == 1 or len(jobs) <= 1:
+        for name, members in jobs:
+            try:
+                record(name, *_atlas_task(name, thumbnails_folder, output_folder, members, settings))
+            except Exception as e:
+                record_failure(name, e)
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_atlas_task, name, thumbnails_folder, output_folder, members, settings): name
+                for name, members in jobs
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    record(name, *future.result())
+                except Exception as e:
+                    record_failure(name, e)
+
+    # Planches d'une collection plus grande, ou d'un autre format
+    kept = {entry["file"] for entry in entries.values()}
+    for filename in os.listdir(output_folder):
+        if filename.startswith("atlas-") and filename not in kept:
+            os.remove(os.path.join(output_folder, filename))
+
+    with tracing.span("manifest.write", file=ATLAS_MANIFEST):
+        save_manifest(manifest_path, {"atlases": entries})
+    index = {name: {key: entry[key] for key in ("page", "file", "width", "height", "thumbnails")}
+             for name, entry in sorted(entries.items())}
+    save_manifest(os.path.join(output_folder, ATLAS_INDEX), {"pageSize": page_size, "atlases": index})
+
+    elapsed = time.perf_counter() - start
+    print(f"Atlases: {summary['built']} built, {summary['skipped']} skipped, "
+          f"{summary['failed']} failed in {elapsed:.2f} s")
+    return summary
+
+def _write_thumbnail(source, thumb_path, size):
+    filename = os.path.basename(thumb_path)
+    with tracing.span("image.decode", file=filename):
+        img = load_thumbnail(source, size)
+    with tracing.span("image.encode", file=filename):
+        img.save(thumb_path)
+
+def _phash(path):
+    with tracing.span("image.phash", file=os.path.basename(path)):
+        return hash_to_hex(dhash(path))
+
+def import_image(source_path, full_images_dir, thumbnails_dir, size=(300, 300), complete_images=()):
+    """Copie une image dans la collection sous le hash de son contenu et crée sa miniature.
+
+    Une image déjà présente (même contenu) n'est ni recopiée ni réduite à nouveau :
+    les figurines qui l'utilisent partagent le même fichier.
+    Renvoie les chemins (relatifs au projet) de l'image et de sa miniature, et
+    l'empreinte perceptuelle de l'image (calculée sur la miniature), ou None pour
+    une image de `complete_images` (déjà dans la collection avec miniature et empreinte).
+    """
+    extension = os.path.splitext(source_path)[1].lower()
+    with tracing.span("image.hash", file=os.path.basename(source_path)):
+        filename = file_hash(source_path)[:IMAGE_NAME_HASH_LENGTH] + extension
+    full_path = os.path.join(full_images_dir, filename)
+    thumb_path = os.path.join(thumbnails_dir, filename)
+    if f"images/full/{filename}" in complete_images and os.path.exists(full_path):
+        return f"images/full/{filename}", f"images/thumbnails/{filename}", None
+
+    if not os.path.exists(full_path):
+        with tracing.span("image.copy", file=filename):
+            sync_file(source_path, full_path)
+    if not os.path.exists(thumb_path):
+        _write_thumbnail(full_path, thumb_path, size)
+    return f"images/full/{filename}", f"images/thumbnails/{filename}", _phash(thumb_path)
+
+# Images de la collection ayant déjà miniature et empreinte (processus de travail d'un import)
+_complete_images = frozenset()
+
+def _init_import_worker(complete_images):
+    global _complete_images
+    _complete_images = complete_images
+
+@tracing.traced("import.image")
+def _import_task(source, full_images_dir, thumbnails_dir, size):
+    """Tâche exécutée dans un processus de travail : importe une image.
+
+    Une image déjà rangée dans le dossier des images de la collection garde son
+    nom ; les autres sont copiées sous le hash de leur contenu (voir import_image).
+    """
+    if os.path.dirname(os.path.abspath(source)) == os.path.abspath(full_images_dir):
+        filename = os.path.basename(source)
+        thumb_path = os.path.join(thumbnails_dir, filename)
+        if not os.path.exists(thumb_path):
+            _write_thumbnail(source, thumb_path, size)
+        return f"images/full/{filename}", f"images/thumbnails/{filename}", _phash(thumb_path)
+    return import_image(source, full_images_dir, thumbnails_dir, size, _complete_images)
+
+def scan_images(folder, recursive=True):
+    """Parcourt le dossier (et ses sous-dossiers) et produit (chemin, dossiers relatifs) pour chaque image
+
+    Le parcours utilise os.scandir et produit les images au fur et à mesure, dans
+    l'ordre alphabétique de chaque dossier ; les fichiers cachés sont ignorés.
+    """
+    pending = [(folder, ())]
+    while pending:
+        current, folders = pending.pop()
+        with os.scandir(current) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        subfolders = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir():
+                if recursive:
+                    subfolders.append((entry.path, folders + (entry.name,)))
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path, folders
+        pending.extend(reversed(subfolders))
+
+def name_and_tags(filename, folders=(), default_tags=()):
+    """Nom de figurine et tags déduits du nom de fichier et des dossiers (voir FILENAME_TAGS_SEPARATOR)"""
+    stem = os.path.splitext(filename)[0]
+    name_part, _, tags_part = stem.partition(FILENAME_TAGS_SEPARATOR)
+
+    tags = list(default_tags)
+    candidates = [folder.replace("_", " ") for folder in folders] + tags_part.split("_")
+    for tag in candidates:
+        tag = tag.strip().lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return name_part.replace("_", " ").strip().title(), tags
+
+def _bounded_results(executor, task, jobs, window):
+    """Soumet les tâches au fil de l'eau (au plus `window` en cours) et produit (job, future) dans l'ordre"""
+    pending = deque()
+    for job in jobs:
+        pending.append((job, executor.submit(task, *job[0])))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+@tracing.traced("import")
+def bulk_import(source_folder, output_json, existing=(), images_dir="images", default_tags=None,
+                workers=None, recursive=True, thumbnail_size=(300, 300)):
+    """Importe toutes les images d'un dossier et écrit la collection fusionnée dans `output_json`.
+
+    - les images sont découvertes récursivement (os.scandir) et importées par un
+      groupe de processus (copie sous le hash du contenu, miniature, empreinte) ;
+    - une image déjà présente dans `existing` (même chemin, donc même contenu pour
+      les images importées) garde sa figurine, ses tags et son nom modifiés à la main ;
+      seuls les champs manquants (miniature, empreinte) sont complétés : une image
+      qui les a déjà n'est ni réduite ni analysée à nouveau (les images du dossier de
+      la collection ne sont même pas soumises) ;
+    - le nom et les tags des nouvelles figurines sont déduits du nom du fichier et
+      des dossiers (voir name_and_tags) ;
+    - les nouvelles figurines sont écrites au fur et à mesure dans un fichier
+      temporaire, puis la collection est écrite en flux (write_json_stream) : la
+      mémoire ne dépend pas du nombre d'images importées.
+    Les doublons probables (empreintes proches) sont signalés à la fin.
+    Renvoie un résumé {"added": n, "updated": n, "unchanged": n, "failed": n}.
+    """
     if default_tags is None:
         default_tags = []
-    
-    collection = []
-    
-    for filename in os.listdir(image_folder):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            # Ici vous pouvez extraire des informations du nom de fichier si vous avez une convention
-            # Par exemple: "dragon_red_large.jpg" pourrait donner les tags ["dragon", "red", "large"]
-            name = os.path.splitext(filename)[0]  # Nom sans extension
-            
+
+    full_images_dir = os.path.join(images_dir, "full")
+    thumbnails_dir = os.path.join(images_dir, "thumbnails")
+    os.makedirs(full_images_dir, exist_ok=True)
+    os.makedirs(thumbnails_dir, exist_ok=True)
+    # Dossier de la collection, où est aussi créé le fichier temporaire des nouvelles figurines
+    os.makedirs(os.path.dirname(os.path.abspath(output_json)), exist_ok=True)
+
+    existing = list(existing)
+    by_image = {figurine.get("fullImage"): figurine for figurine in existing}
+    next_id = max((figurine.get("id", 0) for figurine in existing), default=0) + 1
+    hash_index = ImageHashIndex()
+    for figurine in existing:
+        if figurine.get("phash"):
+            hash_index.add(hex_to_hash(figurine["phash"]), (figurine.get("name"), figurine.get("fullImage")))
+
+    summary = {"added": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    duplicates = []
+    start = time.perf_counter()
+    now = datetime.now().isoformat()
+
+    complete_images = frozenset(figurine.get("fullImage") for figurine in existing
+                                if figurine.get("phash") and figurine.get("thumbnail"))
+
+    def pending_jobs():
+        for path, folders in scan_images(source_folder, recursive):
+            if (os.path.dirname(os.path.abspath(path)) == os.path.abspath(full_images_dir)
+                    and f"images/full/{os.path.basename(path)}" in complete_images):
+                summary["unchanged"] += 1
+                continue
+            yield (path, full_images_dir, thumbnails_dir, thumbnail_size), (path, folders)
+
+    with tempfile.TemporaryFile('w+', encoding='utf-8', dir=os.path.dirname(os.path.abspath(output_json))) as added, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_import_worker,
+                                initargs=(complete_images,)) as executor:
+        window = (workers or os.cpu_count() or 1) * IMPORT_QUEUE_PER_WORKER
+        for (_, (path, folders)), future in _bounded_results(executor, _import_task, pending_jobs(), window):
+            try:
+                full_image, thumbnail, phash = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                print(f"Import failed for {path}: {e}")
+                continue
+
+            if full_image in by_image:
+                figurine = by_image[full_image]
+                if figurine is None:
+                    # Même contenu qu'une image déjà importée pendant cet import
+                    summary["unchanged"] += 1
+                elif not figurine.get("phash") or not figurine.get("thumbnail"):
+                    figurine.setdefault("thumbnail", thumbnail)
+                    figurine["phash"] = figurine.get("phash") or phash
+                    summary["updated"] += 1
+                else:
+                    summary["unchanged"] += 1
+                continue
+
+            name, tags = name_and_tags(os.path.basename(path), folders, default_tags)
             figurine = {
-                "id": len(collection) + 1,
-                "name": name.replace("_", " ").title(),
-                "thumbnail": f"images/thumbnails/{filename}",
-                "fullImage": f"images/full/{filename}",
-                "tags": default_tags.copy()  # À personnaliser pour chaque figurine
+                "id": next_id,
+                "name": name,
+                "thumbnail": thumbnail,
+                "fullImage": full_image,
+                "tags": tags,
+                "modified_date": now,
+                "phash": phash,
             }
-            collection.append(figurine)
-    
-    with open(output_json, 'w', encoding='utf-8') as f:
-        json.dump({"figurines": collection}, f, indent=2, ensure_ascii=False)
-    
-    print(f"Created collection with {len(collection)} figurines")
-
-# Exemple d'utilisation
+            next_id += 1
+            by_image[full_image] = None  # Les nouvelles figurines ne restent pas en mémoire
+            added.write(json.dumps(figurine, ensure_ascii=False) + "\n")
+            summary["added"] += 1
+
+            value = hex_to_hash(phash)
+            for distance, (other_name, other_image) in hash_index.search(value):
+                duplicates.append(({"name": name, "fullImage": full_image},
+                                   {"name": other_name, "fullImage": other_image}, distance))
+            hash_index.add(value, (name, full_image))
+
+            if summary["added"] % 1000 == 0:
+                print(f"{summary['added']} figurines imported...")
+
+        added.seek(0)
+        write_json_stream(output_json, _chain_records(existing, added))
+
+    elapsed = time.perf_counter() - start
+    print(f"Import: {summary['added']} added, {summary['updated']} updated, {summary['unchanged']} unchanged, "
+          f"{summary['failed']} failed in {elapsed:.2f} s")
+    print_duplicates_report(duplicates)
+    return summary
+
+def _chain_records(existing, added_file):
+    """Figurines existantes puis nouvelles figurines relues ligne à ligne du fichier temporaire"""
+    yield from existing
+    for line in added_file:
+        yield json.loads(line)
+
+def create_collection_json(image_folder, output_json, default_tags=None, workers=None):
+    """Crée (ou complète) un fichier JSON avec les métadonnées des figurines
+
+    Les figurines déjà présentes dans la collection (lue avec le moteur de
+    stockage configuré, à côté de `output_json`) sont conservées avec leurs
+    modifications (voir bulk_import).
+    """
+    backend = store_backend()
+    collection_file = store_path(os.path.dirname(output_json), backend)
+    existing = []
+    if os.path.exists(collection_file) or os.path.exists(output_json):
+        store = open_store(collection_file, backend)
+        try:
+            existing = store.load()
+        finally:
+            store.close()
+
+    return bulk_import(image_folder, output_json, existing, os.path.dirname(image_folder),
+                       default_tags, workers, recursive=False)
+
+def import_folder(source_folder, default_tags=None, workers=None):
+    """Importe un dossier d'images dans la collection du projet (quel que soit le moteur de stockage)
+
+    La collection fusionnée est écrite dans data/collection.json, le format
+    d'échange que la base SQLite réimporte à sa prochaine ouverture.
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data_dir = os.path.join(project_root, "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    backend = store_backend()
+    store = open_store(store_path(data_dir, backend), backend)
+    try:
+        existing = store.load()
+    finally:
+        store.close()
+
+    return bulk_import(source_folder, os.path.join(data_dir, STORE_FILES["json"]), existing,
+                       os.path.join(project_root, "images"), default_tags, workers)
+
 if __name__ == "__main__":
-    create_thumbnails("images/full", "images/thumbnails")
-    create_collection_json("images/full", "data/collection.json", ["figurine", "3d"])
\ No newline at end of file
+    # --trace[=fichier] et --profile=étape : voir tracing.py
+    sys.argv = tracing.configure(sys.argv)
+    if len(sys.argv) >= 3 and sys.argv[1] == "import":
+        # Import d'un dossier : python prepare_data.py import <dossier> [tag ...]
+        import_folder(sys.argv[2], sys.argv[3:])
+    elif len(sys.argv) >= 2 and sys.argv[1] == "atlases":
+        # Planches de miniatures par page du site : python prepare_data.py atlases [webp|jpeg]
+        create_atlases(store_path("data"), "images/thumbnails", "images/atlases",
+                       fmt=sys.argv[2] if len(sys.argv) >= 3 else "webp")
+    else:
+        # Exemple d'utilisation
+        create_thumbnails("images/full", "images/thumbnails")
+        create_variants("images/full", "images/variants")
+        create_collection_json("images/full", "data/collection.json", ["figurine", "3d"])
\ No newline at end of file
@@ -0,0 +1,345 @@
+# coding: utf-8
+"""Requêtes booléennes sur les tags et les noms de la collection (index bitmap)
+
+Chaque tag a un bitmap : un entier Python dont le bit n vaut 1 quand la figurine
+de clé n porte ce tag (la clé est l'id de la figurine, ou sa position dans la
+collection). ET, OU et NON sont alors de simples opérations sur des entiers,
+exécutées en C sur toute la collection à la fois. Les noms normalisés sont
+tenus triés pour les recherches par préfixe (recherche dichotomique).
+
+Les ajouts et suppressions sont mis en attente et appliqués d'un bloc à la
+requête suivante : charger un million de figurines ne recopie pas un bitmap
+à chaque figurine.
+
+Syntaxe des requêtes :
+    dragon            nom commençant par « dragon » (accents et casse ignorés)
+    dragon rouge      nom commençant par « dragon rouge » (mots consécutifs)
+    #peint, tag:peint figurines portant le tag « peint » (casse et accents ignorés)
+    tag:"28 mm"       guillemets pour un tag ou un nom contenant des espaces
+    a b, a AND b      les deux conditions
+    a OR b, a | b     l'une ou l'autre
+    -a, NOT a         condition inversée
+    ( ... )           groupement
+"""
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+
+# Au-delà de ce nombre de changements de noms en attente, la liste triée est reconstruite d'un bloc
+NAME_REBUILD_THRESHOLD = 1000
+
+# Nombre de bitmaps de préfixes de noms gardés en cache (saisie progressive dans un filtre)
+PREFIX_CACHE_SIZE = 64
+
+TOKEN = re.compile(r'\s*(?:(\()|(\))|(\|)|"([^"]*)"|([^\s()|"]+))')
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+class QuerySyntaxError(ValueError):
+    """Requête mal formée"""
+
+
+def fold_text(text):
+    """Texte normalisé pour la recherche : accents retirés, minuscules
+
+    Doit rester identique à `foldText` dans main.js.
+    """
+    if text.isascii():
+        return text.lower()  # Ni accent ni décomposition possibles
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.category(c).startswith("M")).lower()
+
+
+def bitmap_from_keys(keys):
+    """Bitmap (entier) ayant à 1 les bits des clés données"""
+    keys = list(keys)
+    if not keys:
+        return 0
+    buffer = bytearray(max(keys) // 8 + 1)
+    for key in keys:
+        buffer[key >> 3] |= 1 << (key & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def bitmap_keys(bitmap):
+    """Clés (bits à 1) d'un bitmap, en ordre croissant"""
+    bits = bin(bitmap)[:1:-1]  # Bit de poids faible en premier
+    keys = []
+    find = bits.find
+    key = find("1")
+    while key >= 0:
+        keys.append(key)
+        key = find("1", key + 1)
+    return keys
+
+
+def _apply_changes(bitmap, changes):
+    """Applique à un bitmap les changements [(clé, présente)], dans l'ordre"""
+    if len(changes) == 1:
+        key, present = changes[0]
+        return bitmap | (1 << key) if present else bitmap & ~(1 << key)
+    size = max(bitmap.bit_length(), max(key for key, _ in changes) + 1)
+    buffer = bytearray(bitmap.to_bytes((size + 7) // 8, "little"))
+    for key, present in changes:
+        if present:
+            buffer[key >> 3] |= 1 << (key & 7)
+        else:
+            buffer[key >> 3] &= ~(1 << (key & 7)) & 0xFF
+    return int.from_bytes(buffer, "little")
+
+
+def parse_query(text):
+    """Analyse une requête et renvoie son arbre :
+    ("tag", tag), ("name", préfixe), ("and", a, b), ("or", a, b), ("not", a) ou None (requête vide)
+    """
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if not match:
+            raise QuerySyntaxError(f"Guillemet non fermé : {text[position:].strip()}")
+        position = match.end()
+        opening, closing, pipe, quoted, word = match.groups()
+        if opening or closing or pipe:
+            tokens.append(("op", opening or closing or "OR"))
+        elif quoted is not None:
+            tokens.append(("quoted", quoted))
+        elif word in OPERATORS:
+            tokens.append(("op", word))
+        else:
+            tokens.append(("term", word))
+
+    parser = _Parser(tokens)
+    tree = parser.parse_or()
+    if parser.position < len(tokens):
+        raise QuerySyntaxError(f"Élément inattendu : {tokens[parser.position][1]}")
+    return tree
+
+
+def _is_plain_word(word):
+    """Mot de recherche par nom, sans opérateur ni préfixe"""
+    return word not in OPERATORS and not word.startswith(("#", "-", "tag:", "name:"))
+
+
+class _Parser:
+    """Analyseur descendant : OU < ET (implicite) < NON < terme"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def parse_or(self):
+        tree = self.parse_and()
+        while self.peek() == ("op", "OR"):
+            self.position += 1
+            right = self.parse_and()
+            if tree is None or right is None:
+                raise QuerySyntaxError("OR doit relier deux conditions")
+            tree = ("or", tree, right)
+        return tree
+
+    def parse_and(self):
+        tree = None
+        while True:
+            kind, value = self.peek()
+            if kind is None or (kind == "op" and value in ("OR", ")")):
+                return tree
+            if (kind, value) == ("op", "AND"):
+                self.position += 1
+                continue
+            right = self.parse_not()
+            tree = right if tree is None else ("and", tree, right)
+
+    def parse_not(self):
+        kind, value = self.peek()
+        if (kind, value) == ("op", "NOT"):
+            self.position += 1
+            operand = self.parse_not()
+            if operand is None:
+                raise QuerySyntaxError("NOT doit précéder une condition")
+            return ("not", operand)
+        return self.parse_term()
+
+    def parse_term(self):
+        kind, value = self.peek()
+        if kind is None:
+            raise QuerySyntaxError("Condition manquante en fin de requête")
+        self.position += 1
+        if (kind, value) == ("op", "("):
+            tree = self.parse_or()
+            if self.peek() != ("op", ")"):
+                raise QuerySyntaxError("Parenthèse non fermée")
+            self.position += 1
+            if tree is None:
+                raise QuerySyntaxError("Parenthèses vides")
+            return tree
+        if kind == "op":
+            raise QuerySyntaxError(f"Élément inattendu : {value}")
+        if kind == "quoted":
+            return ("name", value)
+
+        negate = value.startswith("-") and len(value) > 1
+        if negate:
+            value = value[1:]
+        if value.startswith("#"):
+            tree = ("tag", value[1:])
+        elif value.startswith("tag:"):
+            tree = ("tag", value[4:])
+        elif value.startswith("name:"):
+            tree = ("name", value[5:])
+        else:
+            # Mots consécutifs : un seul préfixe de nom (« dragon rouge »)
+            words = [value]
+            while not negate and self.peek()[0] == "term" and _is_plain_word(self.peek()[1]):
+                words.append(self.peek()[1])
+                self.position += 1
+            tree = ("name", " ".join(words))
+
+        # Valeur entre guillemets après le préfixe : tag:"28 mm"
+        if not tree[1] and self.peek()[0] == "quoted":
+            tree = (tree[0], self.peek()[1])
+            self.position += 1
+        if not tree[1] and tree[0] == "tag":
+            raise QuerySyntaxError("Nom de tag manquant")
+        return ("not", tree) if negate else tree
+
+
+class TagQueryIndex:
+    """Bitmaps des tags et noms triés d'une collection, interrogés par `query` ou `search`"""
+
+    def __init__(self):
+        self.bitmaps = {}  # Tag → bitmap
+        self.folded_tags = {}  # Tag normalisé → tags (casse et accents ignorés)
+        self.all = 0  # Bitmap de toutes les clés
+        self.changes = {}  # Tag (None pour `all`) → [(clé, présente)] en attente
+        self.names = []  # Noms normalisés, triés
+        self.name_keys = []  # Clé de chaque nom de `names`
+        self.name_changes = []  # [(nom normalisé, clé, présente)] en attente
+        self.prefix_cache = {}  # Préfixe normalisé → bitmap
+
+    @classmethod
+    def from_figurines(cls, figurines):
+        """Index dont les clés sont les positions des figurines dans la liste"""
+        index = cls()
+        for position, figurine in enumerate(figurines):
+            index.add(position, figurine.get("tags", []), figurine.get("name", ""))
+        return index
+
+    def add(self, key, tags, name):
+        """Ajoute la figurine de clé `key` (entier positif)"""
+        self._change(key, tags, name, True)
+
+    def remove(self, key, tags, name):
+        """Retire la figurine de clé `key` (avec les tags et le nom donnés à son ajout)"""
+        self._change(key, tags, name, False)
+
+    def _change(self, key, tags, name, present):
+        self.changes.setdefault(None, []).append((key, present))
+        for tag in set(tags):
+            if tag not in self.bitmaps:
+                self.bitmaps[tag] = 0
+                self.folded_tags.setdefault(fold_text(tag), []).append(tag)
+            self.changes.setdefault(tag, []).append((key, present))
+        self.name_changes.append((fold_text(name or ""), key, present))
+
+    def _flush(self, tag):
+        """Applique les changements en attente du bitmap de `tag` (None pour `all`)"""
+        changes = self.changes.pop(tag, None)
+        if changes:
+            if tag is None:
+                self.all = _apply_changes(self.all, changes)
+            else:
+                self.bitmaps[tag] = _apply_changes(self.bitmaps[tag], changes)
+
+    def _flush_names(self):
+        changes, self.name_changes = self.name_changes, []
+        if len(changes) < NAME_REBUILD_THRESHOLD:
+            for name, key, present in changes:
+                if present:
+                    position = bisect_right(self.names, name)
+                    self.names.insert(position, name)
+                    self.name_keys.insert(position, key)
+                    continue
+                position = bisect_left(self.names, name)
+                while position < len(self.names) and self.names[position] == name:
+                    if self.name_keys[position] == key:
+                        del self.names[position]
+                        del self.name_keys[position]
+                        break
+                    position += 1
+            return
+
+        # Nombreux changements (chargement de la collection) : un seul tri
+        removed = {}
+        for name, key, present in changes:
+            if not present:
+                removed[(name, key)] = removed.get((name, key), 0) + 1
+        entries = []
+        for entry in list(zip(self.names, self.name_keys)) + [(name, key) for name, key, present in changes if present]:
+            if removed.get(entry):
+                removed[entry] -= 1
+            else:
+                entries.append(entry)
+        entries.sort(key=lambda entry: entry[0])
+        self.names = [name for name, _ in entries]
+        self.name_keys = [key for _, key in entries]
+
+    def bitmap(self, tag):
+        """Bitmap des figurines portant exactement `tag`"""
+        self._flush(tag)
+        return self.bitmaps.get(tag, 0)
+
+    def tag_bitmap(self, tag):
+        """Bitmap des figurines portant `tag` (casse et accents ignorés)"""
+        bitmap = 0
+        for name in self.folded_tags.get(fold_text(tag), ()):
+            bitmap |= self.bitmap(name)
+        return bitmap
+
+    def prefix_bitmap(self, prefix):
+        """Bitmap des figurines dont le nom normalisé commence par `prefix`"""
+        if self.name_changes:
+            self._flush_names()
+            self.prefix_cache.clear()
+        prefix = fold_text(prefix)
+        if not prefix:
+            return self.all_bitmap()
+        bitmap = self.prefix_cache.get(prefix)
+        if bitmap is None:
+            start = bisect_left(self.names, prefix)
+            end = bisect_left(self.names, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+            bitmap = bitmap_from_keys(self.name_keys[start:end])
+            if len(self.prefix_cache) >= PREFIX_CACHE_SIZE:
+                self.prefix_cache.clear()
+            self.prefix_cache[prefix] = bitmap
+        return bitmap
+
+    def all_bitmap(self):
+        self._flush(None)
+        return self.all
+
+    def evaluate(self, tree):
+        """Bitmap du résultat d'un arbre de requête (voir parse_query)"""
+        if tree is None:
+            return self.all_bitmap()
+        kind = tree[0]
+        if kind == "tag":
+            return self.tag_bitmap(tree[1])
+        if kind == "name":
+            return self.prefix_bitmap(tree[1])
+        if kind == "not":
+            return self.all_bitmap() & ~self.evaluate(tree[1])
+        left, right = self.evaluate(tree[1]), self.evaluate(tree[2])
+        return left & right if kind == "and" else left | right
+
+    def query(self, text):
+        """Bitmap des figurines répondant à la requête `text` (voir la syntaxe en tête du module)"""
+        return self.evaluate(parse_query(text))
+
+    def search(self, text):
+        """Clés des figurines répondant à la requête `text`, en ordre croissant"""
+        return bitmap_keys(self.query(text))
@@ -0,0 +1,23 @@
+# coding: utf-8
+"""Tests de l'analyse des requêtes de tag_query (python -m pytest, ou python -m unittest)"""
+import unittest
+from tag_query import QuerySyntaxError, parse_query
+
+
+class ParseQueryTest(unittest.TestCase):
+
+    def test_valid_queries(self):
+        self.assertIsNone(parse_query(""))
+        self.assertEqual(parse_query("dragon rouge"), ("name", "dragon rouge"))
+        self.assertEqual(parse_query("#peint NOT dragon"), ("and", ("tag", "peint"), ("not", ("name", "dragon"))))
+        self.assertEqual(parse_query("(#a | #b)"), ("or", ("tag", "a"), ("tag", "b")))
+
+    def test_incomplete_queries(self):
+        for query in ("NOT", "dragon NOT", "#a NOT", "dragon OR", "OR", "#a |", "()", "#a ()", "(#a", "tag:"):
+            with self.subTest(query=query):
+                with self.assertRaises(QuerySyntaxError):
+                    parse_query(query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+# coding: utf-8
+"""Traces d'exécution de la chaîne de traitement (format « trace event » de Chrome)
+
+Les étapes instrumentées (décodage et encodage des images, sérialisation JSON,
+rendu Jinja, copie des fichiers...) sont des intervalles (`span`) mesurés
+seulement quand les traces sont activées :
+    FIGURINES_TRACE=trace.json python generate_site.py
+    python prepare_data.py --trace[=trace.json]
+À la fin du programme, le fichier est écrit (à ouvrir dans chrome://tracing ou
+https://ui.perfetto.dev) et un résumé par étape (nombre, durée totale, moyenne,
+maximum) est affiché. Les processus de travail (miniatures, import) héritent de
+la variable d'environnement et transmettent leurs intervalles au processus principal.
+
+FIGURINES_PROFILE=étape[,étape] (ou --profile=étape) exécute en plus ces étapes
+sous cProfile : les statistiques sont écrites à côté de la trace
+(trace.<étape>.prof, lisible avec pstats ou snakeviz) et les fonctions les plus
+coûteuses sont affichées.
+
+Utilisation dans le code :
+    with tracing.span("image.decode", file=filename):
+        ...
+    @tracing.traced("thumbnails")
+    def create_thumbnails(...):
+"""
+import os
+import sys
+import glob
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import functools
+import threading
+import contextlib
+
+TRACE_ENV = "FIGURINES_TRACE"
+PROFILE_ENV = "FIGURINES_PROFILE"
+# Processus qui écrit la trace finale ; les autres (processus de travail) lui transmettent leurs intervalles
+OWNER_ENV = "FIGURINES_TRACE_OWNER"
+
+DEFAULT_TRACE_FILE = "trace.json"
+
+# Nombre de fonctions affichées pour chaque étape profilée
+PROFILE_TOP = 20
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """Intervalles mesurés dans ce processus, et fusion des traces des processus de travail"""
+
+    def __init__(self, path, profiled=()):
+        self.path = os.path.abspath(path)
+        self.profiled = set(profiled)
+        owner = os.environ.get(OWNER_ENV)
+        self.owner_pid = int(owner) if owner else os.getpid()
+        os.environ[OWNER_ENV] = str(self.owner_pid)
+        self.events = []
+        self.profiles = {}  # Étape → pstats.Stats cumulées
+        self.profiling = False  # Un seul cProfile actif à la fois par processus
+        self.local = threading.local()
+
+    @property
+    def is_owner(self):
+        return os.getpid() == self.owner_pid
+
+    def _reset_after_fork(self):
+        # Un processus de travail créé par fork repart d'une trace vide
+        self.events = []
+        self.profiles = {}
+        self.profiling = False
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def span(self, name, args):
+        depth = getattr(self.local, "depth", 0)
+        self.local.depth = depth + 1
+        profiler = None
+        if name in self.profiled and not self.profiling:
+            self.profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        timestamp = time.time_ns() // 1000
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = (time.perf_counter_ns() - start) / 1000
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+                self._add_profile(name, profiler)
+            self.local.depth = depth
+            self.events.append({
+                "name": name,
+                "cat": name.partition(".")[0],
+                "ph": "X",
+                "ts": timestamp,
+                "dur": duration,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            })
+            if depth == 0 and not self.is_owner:
+                self.flush()
+
+    def _add_profile(self, name, profiler):
+        if name in self.profiles:
+            self.profiles[name].add(profiler)
+        else:
+            self.profiles[name] = pstats.Stats(profiler)
+
+    def _part_path(self, suffix):
+        return f"{self.path}.{os.getpid()}.{suffix}"
+
+    def flush(self):
+        """Processus de travail : ajoute les intervalles terminés au fichier partiel du processus"""
+        events, self.events = self.events, []
+        if events:
+            with open(self._part_path("part"), "a", encoding="utf-8") as f:
+                for event in events:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        for name, stats in self.profiles.items():
+            stats.dump_stats(self._part_path(f"{name}.prof"))
+
+    def finish(self):
+        """Fin du programme : écrit la trace complète et affiche le résumé (processus principal)"""
+        if not self.is_owner:
+            self.flush()
+            return
+
+        events = self.events
+        for part in glob.glob(f"{glob.escape(self.path)}.*.part"):
+            with open(part, encoding="utf-8") as f:
+                events.extend(json.loads(line) for line in f if line.strip())
+            os.remove(part)
+        events.sort(key=lambda event: event["ts"])
+
+        processes = {event["pid"] for event in events} | {os.getpid()}
+        metadata = [{"name": "process_name", "ph": "M", "pid": pid,
+                     "args": {"name": os.path.basename(sys.argv[0]) if pid == os.getpid() else f"worker {pid}"}}
+                    for pid in sorted(processes)]
+        stages = summarize(events)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms", "summary": stages},
+                      f, ensure_ascii=False)
+
+        print(f"Trace écrite dans {self.path}")
+        print_summary(stages)
+        self._finish_profiles()
+
+    def _finish_profiles(self):
+        prefix = os.path.splitext(self.path)[0]
+        for name in sorted(self.profiled):
+            parts = glob.glob(f"{glob.escape(self.path)}.*.{glob.escape(name)}.prof")
+            stats = self.profiles.get(name)
+            for part in parts:
+                if stats is None:
+                    stats = pstats.Stats(part)
+                else:
+                    stats.add(part)
+                os.remove(part)
+            if stats is None:
+                continue
+            profile_path = f"{prefix}.{name}.prof"
+            stats.dump_stats(profile_path)
+            print(f"\nProfil de « {name} » écrit dans {profile_path}")
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+
+def summarize(events):
+    """Résumé par étape : {nom: {"count", "total_ms", "mean_ms", "max_ms"}}, par durée totale décroissante"""
+    stages = {}
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        stage = stages.setdefault(event["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        duration = event["dur"] / 1000
+        stage["count"] += 1
+        stage["total_ms"] += duration
+        stage["max_ms"] = max(stage["max_ms"], duration)
+    for stage in stages.values():
+        stage["mean_ms"] = stage["total_ms"] / stage["count"]
+        for key in ("total_ms", "mean_ms", "max_ms"):
+            stage[key] = round(stage[key], 3)
+    return dict(sorted(stages.items(), key=lambda item: -item[1]["total_ms"]))
+
+
+def print_summary(stages):
+    print(f"{'Étape':<28} {'Nombre':>8} {'Total (ms)':>12} {'Moyenne':>10} {'Max':>10}")
+    for name, stage in stages.items():
+        print(f"{name:<28} {stage['count']:>8} {stage['total_ms']:>12.1f} "
+              f"{stage['mean_ms']:>10.2f} {stage['max_ms']:>10.2f}")
+
+
+_tracer = None
+
+
+def enable(path=DEFAULT_TRACE_FILE, profiled=()):
+    """Active les traces (et le profilage des étapes `profiled`) pour ce processus et ses processus de travail"""
+    global _tracer
+    if _tracer is not None:
+        return _tracer
+    os.environ[TRACE_ENV] = path
+    if profiled:
+        os.environ[PROFILE_ENV] = ",".join(profiled)
+    _tracer = Tracer(path, profiled)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_tracer._reset_after_fork)
+    atexit.register(_tracer.finish)
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def configure(argv):
+    """Active les traces demandées par l'environnement ou par les options de la ligne de commande
+
+    Reconnaît --trace, --trace=fichier et --profile=étape[,étape] ; renvoie
+    `argv` sans ces options.
+    """
+    path = os.environ.get(TRACE_ENV) or None
+    profiled = [name for name in os.environ.get(PROFILE_ENV, "").split(",") if name]
+    remaining = []
+    for arg in argv:
+        if arg == "--trace":
+            path = path or DEFAULT_TRACE_FILE
+        elif arg.startswith("--trace="):
+            path = arg.partition("=")[2]
+        elif arg.startswith("--profile="):
+            profiled += [name for name in arg.partition("=")[2].split(",") if name]
+        else:
+            remaining.append(arg)
+    if profiled and not path:
+        path = DEFAULT_TRACE_FILE
+    if path:
+        enable(path, profiled)
+    return remaining
+
+
+def span(name, **args):
+    """Intervalle nommé (gestionnaire de contexte) ; sans effet si les traces sont désactivées"""
+    if _tracer is None:
+        return _NO_SPAN
+    return _tracer.span(name, args)
+
+
+def traced(name=None):
+    """Décorateur : chaque appel de la fonction est un intervalle `name` (par défaut le nom de la fonction)"""
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(label, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Processus de travail (ou script lancé avec FIGURINES_TRACE) : traces actives dès l'import
+if os.environ.get(TRACE_ENV):
+    configure([])
@@ -0,0 +1,189 @@
+# coding: utf-8
+"""Liste Tk virtualisée : seules les lignes visibles existent dans le widget"""
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+
+
+class VirtualListbox(ttk.Frame):
+    """Listbox qui n'affiche qu'une fenêtre de lignes d'un modèle de taille quelconque.
+
+    Le texte de chaque ligne est demandé à la fonction `row_text(index)`.
+    Les modifications ponctuelles du modèle sont signalées par `row_inserted`,
+    `row_removed` et `row_changed` : seules les lignes visibles concernées
+    sont redessinées, et la sélection comme la position de défilement restent
+    stables. Les indices de `curselection`, `selection_set` et `see` sont ceux
+    du modèle. Le changement de sélection émet l'événement <<ListboxSelect>>
+    sur ce widget.
+    """
+
+    def __init__(self, master, row_text, **listbox_options):
+        super().__init__(master)
+        self.row_text = row_text
+        self.row_count = 0
+        self.top = 0
+        self.visible_rows = 1
+        self.selected = None
+
+        self.listbox = tk.Listbox(self, exportselection=False, **listbox_options)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.listbox.bind("<<ListboxSelect>>", self.on_listbox_select)
+        self.listbox.bind("<Configure>", self.on_configure)
+        self.listbox.bind("<MouseWheel>", self.on_mousewheel)
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(3))
+        self.listbox.bind("<Up>", lambda event: self.move_selection(-1))
+        self.listbox.bind("<Down>", lambda event: self.move_selection(1))
+        self.listbox.bind("<Prior>", lambda event: self.move_selection(-self.visible_rows))
+        self.listbox.bind("<Next>", lambda event: self.move_selection(self.visible_rows))
+        self.listbox.bind("<Home>", lambda event: self.move_selection(-self.row_count))
+        self.listbox.bind("<End>", lambda event: self.move_selection(self.row_count))
+
+    # Modèle
+
+    def reset(self, row_count):
+        """Remplace tout le modèle (la position de défilement est conservée si possible)"""
+        self.row_count = row_count
+        if self.selected is not None and self.selected >= row_count:
+            self.selected = None
+        self.render()
+
+    def row_inserted(self, index):
+        """Signale l'insertion d'une ligne à la position `index`"""
+        self.row_count += 1
+        if self.selected is not None and self.selected >= index:
+            self.selected += 1
+        if index < self.top:
+            # Insertion au-dessus de la fenêtre : le contenu visible ne bouge pas
+            self.top += 1
+            self.update_scrollbar()
+        elif index < self.top + self.visible_rows:
+            self.render()
+        else:
+            self.update_scrollbar()
+
+    def row_removed(self, index):
+        """Signale la suppression de la ligne `index`"""
+        self.row_count -= 1
+        if self.selected == index:
+            self.selected = None
+        elif self.selected is not None and self.selected > index:
+            self.selected -= 1
+        if index < self.top:
+            self.top -= 1
+            self.update_scrollbar()
+        elif index < self.top + self.visible_rows:
+            self.render()
+        else:
+            self.update_scrollbar()
+
+    def row_changed(self, index):
+        """Signale la modification du texte de la ligne `index`"""
+        position = index - self.top
+        if 0 <= position < self.listbox.size():
+            self.listbox.delete(position)
+            self.listbox.insert(position, self.row_text(index))
+            if index == self.selected:
+                self.listbox.selection_set(position)
+
+    # Sélection
+
+    def curselection(self):
+        """Renvoie l'indice sélectionné dans le modèle, sous forme de tuple comme tk.Listbox"""
+        return () if self.selected is None else (self.selected,)
+
+    def selection_set(self, index):
+        """Sélectionne la ligne `index` du modèle (sans émettre d'événement)"""
+        self.selected = index
+        self.listbox.selection_clear(0, tk.END)
+        if self.top <= index < self.top + self.listbox.size():
+            self.listbox.selection_set(index - self.top)
+
+    def selection_clear(self):
+        self.selected = None
+        self.listbox.selection_clear(0, tk.END)
+
+    def see(self, index):
+        """Fait défiler la liste pour que la ligne `index` soit visible"""
+        if index < self.top:
+            self.scroll_to(index)
+        elif index >= self.top + self.visible_rows:
+            self.scroll_to(index - self.visible_rows + 1)
+
+    def move_selection(self, delta):
+        """Déplace la sélection au clavier, en faisant défiler si nécessaire"""
+        if self.row_count:
+            if self.selected is not None:
+                current = self.selected
+            else:
+                # Sans sélection, le premier déplacement sélectionne la première ligne visible
+                current = self.top - 1 if delta > 0 else self.top + 1
+            index = min(max(current + delta, 0), self.row_count - 1)
+            self.see(index)
+            self.selection_set(index)
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected = self.top + selection[0]
+            self.event_generate("<<ListboxSelect>>")
+
+    # Défilement
+
+    def scroll_to(self, top):
+        top = min(max(top, 0), max(self.row_count - self.visible_rows, 0))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def scroll(self, rows):
+        self.scroll_to(self.top + rows)
+        return "break"
+
+    def on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.row_count))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll(int(amount) * step)
+
+    def on_configure(self, event):
+        """Recalcule le nombre de lignes visibles d'après la hauteur du widget"""
+        line_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+        border = 2 * (int(self.listbox.cget("borderwidth")) + int(self.listbox.cget("highlightthickness")))
+        visible_rows = max(1, (event.height - border) // line_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.top = min(self.top, max(self.row_count - visible_rows, 0))
+            self.render()
+
+    # Affichage
+
+    def render(self):
+        """Redessine les lignes visibles (coût proportionnel à la hauteur de la liste, pas au modèle)"""
+        self.top = min(self.top, max(self.row_count - self.visible_rows, 0))
+        end = min(self.top + self.visible_rows, self.row_count)
+
+        self.listbox.delete(0, tk.END)
+        for index in range(self.top, end):
+            self.listbox.insert(tk.END, self.row_text(index))
+        if self.selected is not None and self.top <= self.selected < end:
+            self.listbox.selection_set(self.selected - self.top)
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        if self.row_count:
+            first = self.top / self.row_count
+            last = min(self.top + self.visible_rows, self.row_count) / self.row_count
+        else:
+            first, last = 0.0, 1.0
+        self.scrollbar.set(first, last)
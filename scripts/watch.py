@@ -0,0 +1,454 @@
+# coding: utf-8
+"""Mode surveillance : reconstruction partielle du site et serveur de prévisualisation
+
+Surveille images/full, la collection (data/), src/template.html, src/css et
+src/js (inotify sous Linux, sinon examen périodique des dates de modification)
+et ne refait que ce qui dépend des fichiers modifiés :
+    images/full       miniatures et variantes des images modifiées (manifestes
+                      de prepare_data), synchronisation de dist/images, puis les pages
+                      dont les figurines utilisent ces images
+    data/             données du site, puis les pages dont les figurines ont changé
+                      (les planches de miniatures, si elles ont été demandées avec
+                      `prepare_data.py atlases`, suivent les images et les données)
+    src/template.html toutes les pages HTML (les données ne changent pas)
+    src/css, src/js   copie des fichiers modifiés seulement
+Chaque page HTML garde l'empreinte de ce qui a servi à la produire (figurines,
+numéro de page, tags) : elle n'est réécrite que si cette empreinte change.
+
+dist/ est servi en local ; les pages ouvertes se rechargent après chaque
+reconstruction (les feuilles de style seules sont rechargées sans recharger la page).
+Les ressources sont publiées sous leur nom d'origine, sans empreinte : ce mode
+est fait pour travailler sur le site, pas pour le publier (voir generate_site.py).
+
+Utilisation en ligne de commande :
+    python watch.py [--port 8000] [--poll] [--no-serve]
+"""
+import os
+import sys
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import hashlib
+import argparse
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from collection_io import to_json_value
+from collection_store import journal_path, store_path
+from prepare_data import ATLAS_INDEX, create_atlases, create_thumbnails, create_variants
+from generate_site import (attach_image_variants, attach_sprites, copy_assets, html_pages, load_atlas_index,
+                           load_figurines, load_template, load_variants_index, page_context, remove_stale_pages,
+                           render_page, tag_listings, write_site_data)
+
+DEFAULT_PORT = 8000
+
+# Les modifications arrivant à moins de DEBOUNCE secondes d'intervalle sont traitées ensemble
+DEBOUNCE = 0.05
+
+# Intervalle d'examen des dates de modification (sans inotify)
+POLL_INTERVAL = 0.5
+
+LIVE_RELOAD_PATH = "/__livereload"
+# Commentaire envoyé régulièrement aux pages ouvertes pour détecter les connexions fermées
+LIVE_RELOAD_KEEPALIVE = 15
+
+LIVE_RELOAD_SCRIPT = b"""<script>
+(function () {
+    var source = new EventSource('/__livereload');
+    source.onmessage = function (event) {
+        if (event.data !== 'css') {
+            location.reload();
+            return;
+        }
+        document.querySelectorAll('link[rel="stylesheet"]').forEach(function (link) {
+            var url = new URL(link.href);
+            if (url.origin === location.origin) {
+                url.searchParams.set('livereload', Date.now());
+                link.href = url.href;
+            }
+        });
+    };
+})();
+</script>
+"""
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """Modifications des fichiers sous les dossiers surveillés, signalées par le noyau (Linux)"""
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify indisponible")
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.folders = {}  # Descripteur de surveillance → dossier
+        for root in roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, root):
+        for folder, _, _ in os.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK)
+            if wd >= 0:
+                self.folders[wd] = folder
+
+    def changes(self, timeout=None):
+        """Chemins modifiés (attend au plus `timeout` secondes) ; None si des événements ont été perdus"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self.folders:
+                continue
+            path = os.path.join(self.folders[wd], os.fsdecode(name))
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(path)
+            paths.add(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Modifications des fichiers, par comparaison périodique des tailles et dates de modification"""
+
+    def __init__(self, roots):
+        self.roots = roots
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for root in self.roots:
+            for folder, _, files in os.walk(root):
+                for name in files:
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def changes(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(POLL_INTERVAL if deadline is None else max(0, min(POLL_INTERVAL, deadline - time.monotonic())))
+            snapshot = self._scan()
+            paths = {path for path in snapshot.keys() | self.snapshot.keys()
+                     if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if paths or (deadline is not None and time.monotonic() >= deadline):
+                return paths
+
+    def close(self):
+        pass
+
+
+def open_watcher(roots, polling=False):
+    """Surveillance inotify si disponible, sinon examen périodique"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(roots)
+        except OSError as e:
+            print(f"inotify indisponible ({e}), examen périodique des fichiers.")
+    return PollingWatcher(roots)
+
+
+def page_signature(context):
+    """Empreinte de ce qui a servi à produire une page (voir generate_site.html_pages)"""
+    content = [context["figurines"], context["first_position"], context["page"], context["page_count"],
+               context.get("current_tag")]
+    data = json.dumps(content, ensure_ascii=False, default=to_json_value).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class SiteBuilder:
+    """Reconstruit dist/ d'après les modifications, en ne refaisant que les sorties concernées"""
+
+    def __init__(self, project_root, output_dir=None):
+        self.project_root = project_root
+        self.images_dir = os.path.join(project_root, "images")
+        self.full_images_dir = os.path.join(self.images_dir, "full")
+        self.data_dir = os.path.join(project_root, "data")
+        self.src_dir = os.path.join(project_root, "src")
+        self.template_path = os.path.join(self.src_dir, "template.html")
+        self.output_dir = output_dir or os.path.join(project_root, "dist")
+        self.store_file = store_path(self.data_dir)
+        self.atlas_file = os.path.join(self.images_dir, "atlases", ATLAS_INDEX)
+
+        self.template = None
+        self.figurines = None
+        self.listings = None
+        self.tags_signature = None
+        self.pages = {}  # Page HTML → empreinte de son contenu (page_signature)
+        self.data_stats = self._data_stats()
+
+    def roots(self):
+        """Dossiers à surveiller (ceux qui existent)"""
+        return [folder for folder in (self.full_images_dir, self.data_dir, self.src_dir) if os.path.isdir(folder)]
+
+    def _data_stats(self):
+        """Taille et date des fichiers de la collection lus par le site
+
+        En mode WAL, les modifications de la base SQLite sont écrites dans le
+        fichier -wal : la base elle-même ne change qu'au point de contrôle.
+        """
+        stats = {}
+        json_file = os.path.join(self.data_dir, "collection.json")
+        for path in {self.store_file, self.store_file + "-wal", json_file, journal_path(json_file)}:
+            try:
+                stat = os.stat(path)
+                stats[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                pass
+        return stats
+
+    def classify(self, paths):
+        """Types de modifications ("images", "data", "template", "css", "js") des chemins donnés"""
+        kinds = set()
+        for path in paths:
+            name = os.path.basename(path)
+            if name.startswith(".") or name.endswith((".tmp", "~")):
+                continue
+            folder = os.path.dirname(path)
+            if path.startswith(self.full_images_dir + os.sep):
+                kinds.add("images")
+            elif folder == self.data_dir:
+                # L'ouverture de la base SQLite par le site la met à jour : seul un vrai changement compte
+                if self._data_stats() != self.data_stats:
+                    kinds.add("data")
+            elif path == self.template_path:
+                kinds.add("template")
+            elif path.startswith(os.path.join(self.src_dir, "css") + os.sep):
+                kinds.add("css")
+            elif path.startswith(os.path.join(self.src_dir, "js") + os.sep):
+                kinds.add("js")
+        return kinds
+
+    def build(self, kinds=None):
+        """Reconstruit ce qui dépend des modifications `kinds` (tout si None) ; renvoie le nombre de pages écrites"""
+        everything = kinds is None
+        kinds = kinds or set()
+
+        if everything or "images" in kinds:
+            create_thumbnails(self.full_images_dir, os.path.join(self.images_dir, "thumbnails"))
+            create_variants(self.full_images_dir, os.path.join(self.images_dir, "variants"))
+            copy_assets(self.images_dir, os.path.join(self.output_dir, "images"),
+                        ["thumbnails", "variants", "full"], link=True, url_prefix="images/")
+        if os.path.exists(self.atlas_file) and (everything or kinds & {"images", "data"}):
+            create_atlases(self.store_file, os.path.join(self.images_dir, "thumbnails"),
+                           os.path.dirname(self.atlas_file))
+            copy_assets(self.images_dir, os.path.join(self.output_dir, "images"),
+                        ["atlases"], link=True, url_prefix="images/")
+        if everything or kinds & {"css", "js"}:
+            copy_assets(self.src_dir, self.output_dir, ["css", "js"])
+        if everything or "template" in kinds or self.template is None:
+            self.template = load_template(self.template_path)
+            self.pages.clear()
+
+        if everything or kinds & {"images", "data"} or self.figurines is None:
+            figurines = load_figurines(self.store_file)
+            variants_index = load_variants_index(os.path.join(self.images_dir, "variants", "variants.json"))
+            figurines = attach_sprites(figurines, load_atlas_index(self.atlas_file))
+            self.figurines = attach_image_variants(figurines, variants_index)
+            self.listings = tag_listings(self.figurines)
+            write_site_data(self.output_dir, self.figurines, listings=self.listings)
+            self.data_stats = self._data_stats()
+
+        return self._render_pages()
+
+    def _render_pages(self):
+        # Les liens vers les tags figurent sur toutes les pages
+        tags_signature = [(tag, listing["slug"]) for tag, listing in self.listings.items()]
+        if tags_signature != self.tags_signature:
+            self.tags_signature = tags_signature
+            self.pages.clear()
+
+        shared = page_context(self.listings)
+        written = set()
+        rendered = 0
+        for filename, context in html_pages(self.figurines, self.listings):
+            written.add(filename)
+            signature = page_signature(context)
+            if self.pages.get(filename) != signature:
+                render_page(self.template, self.output_dir, filename, dict(shared, **context))
+                self.pages[filename] = signature
+                rendered += 1
+        remove_stale_pages(self.output_dir, written)
+        for filename in set(self.pages) - written:
+            del self.pages[filename]
+        return rendered
+
+
+class LiveReload:
+    """Prévient les pages ouvertes (Server-Sent Events) qu'une reconstruction a eu lieu"""
+
+    def __init__(self):
+        self.version = 0
+        self.kind = None
+        self.condition = threading.Condition()
+
+    def notify(self, kind):
+        with self.condition:
+            self.version += 1
+            self.kind = kind
+            self.condition.notify_all()
+
+    def wait(self, version, timeout):
+        """Attend une reconstruction postérieure à `version` : renvoie (version, type) ou (version, None)"""
+        with self.condition:
+            if self.condition.wait_for(lambda: self.version != version, timeout):
+                return self.version, self.kind
+            return version, None
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """Sert dist/ sans cache, avec le script de rechargement ajouté aux pages HTML"""
+
+    live_reload = None
+
+    def end_headers(self):
+        self.send_header("Cache-Control", "no-store")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == LIVE_RELOAD_PATH:
+            self.send_events()
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if path.endswith(".html") and os.path.isfile(path):
+            self.send_page(path)
+        else:
+            super().do_GET()
+
+    def send_page(self, path):
+        with open(path, "rb") as f:
+            content = f.read()
+        head, body_end, tail = content.rpartition(b"</body>")
+        content = head + LIVE_RELOAD_SCRIPT + body_end + tail if body_end else content + LIVE_RELOAD_SCRIPT
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        version = self.live_reload.version
+        try:
+            while True:
+                version, kind = self.live_reload.wait(version, LIVE_RELOAD_KEEPALIVE)
+                self.wfile.write(f"data: {kind}\n\n".encode() if kind else b": keepalive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(directory, port, live_reload):
+    """Lance le serveur de prévisualisation dans un thread et le renvoie"""
+    handler = type("Handler", (PreviewHandler,), {"live_reload": live_reload})
+    server = ThreadingHTTPServer(("127.0.0.1", port), functools.partial(handler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def watch(builder, watcher, live_reload=None):
+    """Boucle principale : attend des modifications, reconstruit, prévient les pages ouvertes"""
+    while True:
+        paths = watcher.changes()
+        # Regroupe les modifications d'une même opération (copie de plusieurs fichiers...)
+        while paths is not None:
+            more = watcher.changes(DEBOUNCE)
+            if not more:
+                if more is None:
+                    paths = None
+                break
+            paths |= more
+
+        kinds = None if paths is None else builder.classify(paths)
+        if kinds is not None and not kinds:
+            continue
+        start = time.perf_counter()
+        try:
+            rendered = builder.build(kinds)
+        except Exception as e:
+            print(f"Erreur lors de la reconstruction : {e}")
+            continue
+        label = "tout" if kinds is None else ", ".join(sorted(kinds))
+        print(f"Reconstruit ({label}) en {(time.perf_counter() - start) * 1000:.0f} ms : {rendered} page(s) écrite(s)")
+        if live_reload:
+            live_reload.notify("css" if kinds == {"css"} else "reload")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="watch.py", description="Reconstruction partielle du site et prévisualisation")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port du serveur de prévisualisation")
+    parser.add_argument("--poll", action="store_true", help="examen périodique des fichiers plutôt qu'inotify")
+    parser.add_argument("--no-serve", action="store_true", help="reconstruit sans servir dist/")
+    args = parser.parse_args(argv[1:])
+
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    builder = SiteBuilder(project_root)
+    os.makedirs(builder.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    rendered = builder.build()
+    print(f"Site construit en {(time.perf_counter() - start) * 1000:.0f} ms : {rendered} page(s) écrite(s)")
+
+    live_reload = None
+    if not args.no_serve:
+        live_reload = LiveReload()
+        serve(builder.output_dir, args.port, live_reload)
+        print(f"Prévisualisation sur http://127.0.0.1:{args.port}/")
+
+    watcher = open_watcher(builder.roots(), args.poll)
+    print("Surveillance des modifications (Ctrl+C pour arrêter)...")
+    try:
+        watch(builder, watcher, live_reload)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
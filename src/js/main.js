@@ -1,34 +1,215 @@
 document.addEventListener('DOMContentLoaded', function () {
     // Variables globales
-    let figurines = [];
-    let allTags = new Set();
+    let manifest = null;
+    let allTags = [];
     let activeFilters = new Set();
 
-    // Charge les donnes des figurines
-    fetch('data/collection.json')
+    // Fichiers de donnes dj demands (promesses partages)
+    const dataCache = new Map();
+
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+
+    // Rsultat affich : positions des figurines dans la collection (null = toutes)
+    let resultPositions = null;
+    let resultLength = 0;
+    let resultQuery = null; // Texte normalis  vrifier sur les candidats de l'index (sinon null)
+    let renderedCount = 0;
+    let renderToken = 0;
+    let filterToken = 0;
+    let rendering = false;
+
+    // Repre plac aprs la grille : quand il devient visible, la suite est charge
+    const container = document.getElementById('figurines-container');
+    const sentinel = document.createElement('div');
+    sentinel.className = 'figurines-sentinel';
+    container.after(sentinel);
+
+    // Charge le manifeste des donnes (pages et tags), puis la premire page
+    fetch('data/manifest.json')
         .then(response => response.json())
         .then(data => {
-            figurines = data.figurines;
-
-            // Collecte tous les tags uniques
-            figurines.forEach(figurine => {
-                figurine.tags.forEach(tag => allTags.add(tag));
-            });
+            manifest = data;
+            allTags = Object.keys(manifest.tags);
 
             // Gnre les boutons de filtrage par tag
             generateTagButtons();
 
-            // Affiche toutes les figurines
-            displayFigurines(figurines);
-
-            // Configure la recherche
+            // Configure la recherche et le chargement au dfilement
             setupSearch();
+            setupInfiniteScroll();
+
+            // Reprend les cartes pr-rendues par generate_site.py, puis charge la suite au dfilement
+            hydrate();
+        });
+
+    // Reprend la page HTML gnre : cartes dj affiches et pagination remplace par le dfilement.
+    // Sur la page d'un tag (tag-<slug>.html), le rsultat affich est celui du filtre par ce tag.
+    function hydrate() {
+        const renderedCards = container.querySelectorAll('.figurine-card').length;
+        const pageTag = container.dataset.tag;
+        if (pageTag && manifest.tags[pageTag]) {
+            activeFilters.add(pageTag);
+        }
+        if (!renderedCards) {
+            applyFilters();
+            return;
+        }
+
+        document.querySelectorAll('.pagination').forEach(nav => { nav.hidden = true; });
+        const firstPosition = Number(container.dataset.firstPosition || 0);
+        const result = activeFilters.size ? fetchTagPositions(pageTag) : Promise.resolve(null);
+        const token = renderToken;
+        result.then(positions => {
+            // Filtres modifis entre-temps : le nouveau rsultat est dj affich
+            if (token !== renderToken) {
+                return;
+            }
+            resultPositions = positions;
+            resultLength = positions ? positions.length : manifest.total;
+            renderedCount = firstPosition + renderedCards;
+            if (sentinelVisible()) {
+                renderMore();
+            }
+        });
+    }
+
+    // Charge un fichier de donnes (une seule requte par fichier)
+    function fetchData(file) {
+        if (!dataCache.has(file)) {
+            dataCache.set(file, fetch(file).then(response => response.json()));
+        }
+        return dataCache.get(file);
+    }
+
+    // Charge une page de figurines
+    function fetchPage(pageIndex) {
+        return fetchData(manifest.pages[pageIndex]).then(data => data.figurines);
+    }
+
+    // Charge les positions des figurines portant un tag
+    function fetchTagPositions(tag) {
+        return fetchData(manifest.tags[tag].file).then(data => data.positions);
+    }
+
+    // Renvoie les figurines aux positions demandes, en ne chargeant que les pages ncessaires
+    function fetchFigurines(positions) {
+        const pageSize = manifest.pageSize;
+        const pageIndexes = [...new Set(positions.map(position => Math.floor(position / pageSize)))];
+
+        return Promise.all(pageIndexes.map(fetchPage)).then(pages => {
+            const pagesByIndex = new Map(pageIndexes.map((pageIndex, i) => [pageIndex, pages[i]]));
+            return positions.map(position =>
+                pagesByIndex.get(Math.floor(position / pageSize))[position % pageSize]);
+        });
+    }
+
+    // Texte normalis pour la recherche (identique  fold_text dans generate_site.py)
+    function foldText(text) {
+        return text.normalize('NFKD').replace(/\p{M}/gu, '').toLowerCase();
+    }
+
+    // Liste de positions de l'index de recherche (carts successifs) en positions
+    function deltaDecode(deltas) {
+        const positions = new Array(deltas.length);
+        let position = 0;
+        for (let i = 0; i < deltas.length; i++) {
+            position += deltas[i];
+            positions[i] = position;
+        }
+        return positions;
+    }
+
+    // Intersection de deux listes de positions tries
+    function intersectPositions(a, b) {
+        const result = [];
+        let i = 0;
+        let j = 0;
+        while (i < a.length && j < b.length) {
+            if (a[i] < b[j]) {
+                i++;
+            } else if (a[i] > b[j]) {
+                j++;
+            } else {
+                result.push(a[i]);
+                i++;
+                j++;
+            }
+        }
+        return result;
+    }
+
+    // Union de deux listes de positions tries
+    function mergePositions(a, b) {
+        const result = [];
+        let i = 0;
+        let j = 0;
+        while (i < a.length || j < b.length) {
+            if (j >= b.length || (i < a.length && a[i] < b[j])) {
+                result.push(a[i++]);
+            } else {
+                if (i < a.length && a[i] === b[j]) {
+                    i++;
+                }
+                result.push(b[j++]);
+            }
+        }
+        return result;
+    }
+
+    // Positions des figurines dont le nom peut contenir le texte normalis `query`.
+    // Renvoie { positions, verify } : `verify` indique que les positions sont des
+    // candidats (tous les n-grammes prsents)  confirmer sur le nom complet.
+    function searchPositions(query) {
+        const search = manifest.search;
+        const gramSize = search.gramSize;
+
+        // Texte plus court qu'un n-gramme : parcours des noms normaliss
+        if (query.length < gramSize) {
+            return fetchData(search.names).then(data => {
+                const positions = [];
+                data.names.forEach((name, position) => {
+                    if (name.includes(query)) {
+                        positions.push(position);
+                    }
+                });
+                return { positions, verify: false };
+            });
+        }
+
+        const grams = new Set();
+        for (let i = 0; i + gramSize <= query.length; i++) {
+            grams.add(query.slice(i, i + gramSize));
+        }
+
+        return Promise.all([...grams].map(gram => {
+            const shard = search.shards[gram.codePointAt(0).toString(16)];
+            if (!shard) {
+                return [];
+            }
+            return fetchData(shard).then(data => data.grams[gram] || []);
+        })).then(postingLists => {
+            // Intersection en commenant par les listes les plus courtes
+            postingLists.sort((a, b) => a.length - b.length);
+            let positions = deltaDecode(postingLists[0]);
+            for (let i = 1; i < postingLists.length && positions.length; i++) {
+                positions = intersectPositions(positions, deltaDecode(postingLists[i]));
+            }
+            // Un seul n-gramme : correspondance exacte, pas de vrification ncessaire
+            return { positions, verify: grams.size > 1 };
         });
+    }
 
-    // Gnre les boutons de tags pour le filtrage
+    // Gnre les boutons de tags pour le filtrage (ou reprend ceux de la page gnre)
     function generateTagButtons() {
         const tagsContainer = document.getElementById('tags-container');
 
+        const existingButtons = tagsContainer.querySelectorAll('.tag-btn');
+        if (existingButtons.length) {
+            existingButtons.forEach(button =>
+                button.addEventListener('click', () => toggleTagFilter(button, button.dataset.tag)));
+            return;
+        }
+
         allTags.forEach(tag => {
             const button = document.createElement('button');
             button.className = 'tag-btn';
@@ -58,34 +239,159 @@ document.addEventListener('DOMContentLoaded', function () {
         searchInput.addEventListener('input', applyFilters);
     }
 
+    // Charge la suite des figurines quand le bas de la grille approche
+    function setupInfiniteScroll() {
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                renderMore();
+            }
+        }, { rootMargin: '600px' });
+
+        observer.observe(sentinel);
+    }
+
+    function sentinelVisible() {
+        return sentinel.getBoundingClientRect().top < window.innerHeight + 600;
+    }
+
     // Applique tous les filtres actifs
     function applyFilters() {
-        const searchText = document.getElementById('search-input').value.toLowerCase();
+        const token = ++filterToken;
+        const searchText = foldText(document.getElementById('search-input').value);
+
+        // Filtre par tags : figurines ayant au moins un des tags actifs (fichiers par tag)
+        const byTags = activeFilters.size === 0
+            ? Promise.resolve(null)
+            : Promise.all([...activeFilters].map(fetchTagPositions))
+                .then(lists => lists.reduce(mergePositions));
 
-        const filteredFigurines = figurines.filter(figurine => {
-            // Filtre par texte de recherche
-            const matchesSearch = figurine.name.toLowerCase().includes(searchText);
+        // Filtre par texte de recherche : index de n-grammes construit par generate_site.py
+        const byText = searchText
+            ? searchPositions(searchText)
+            : Promise.resolve(null);
 
-            // Si aucun tag actif, n'applique pas de filtre par tag
-            if (activeFilters.size === 0) {
-                return matchesSearch;
+        Promise.all([byTags, byText]).then(([tagPositions, textResult]) => {
+            // Ignore le rsultat si l'utilisateur a modifi les filtres entre-temps
+            if (token !== filterToken) {
+                return;
             }
 
-            // Vrifie si la figurine a au moins un des tags actifs
-            const hasActiveTag = [...activeFilters].some(tag =>
-                figurine.tags.includes(tag)
-            );
+            let positions = tagPositions;
+            if (textResult) {
+                positions = positions
+                    ? intersectPositions(positions, textResult.positions)
+                    : textResult.positions;
+            }
+            showResult(positions, textResult && textResult.verify ? searchText : null);
+        });
+    }
+
+    // Remplace le rsultat affich (positions, ou null pour toute la collection).
+    // Si `query` est donn, seules les figurines dont le nom le contient sont affiches.
+    function showResult(positions, query = null) {
+        resultPositions = positions;
+        resultLength = positions ? positions.length : manifest.total;
+        resultQuery = query;
+        renderedCount = 0;
+        renderToken++;
+        container.innerHTML = '';
+        renderMore();
+    }
+
+    // Affiche la page suivante du rsultat
+    function renderMore() {
+        if (rendering || renderedCount >= resultLength) {
+            return;
+        }
 
-            return matchesSearch && hasActiveTag;
+        rendering = true;
+        const token = renderToken;
+        const end = Math.min(renderedCount + manifest.pageSize, resultLength);
+        const positions = [];
+        for (let i = renderedCount; i < end; i++) {
+            positions.push(resultPositions ? resultPositions[i] : i);
+        }
+
+        fetchFigurines(positions).then(figurinesToDisplay => {
+            rendering = false;
+
+            // Un autre rsultat a t demand pendant le chargement : l'afficher  la place
+            if (token !== renderToken) {
+                renderMore();
+                return;
+            }
+
+            displayFigurines(resultQuery === null
+                ? figurinesToDisplay
+                : figurinesToDisplay.filter(figurine => foldText(figurine.name).includes(resultQuery)));
+            renderedCount = end;
+
+            // Continue tant que le bas de la grille reste visible
+            if (sentinelVisible()) {
+                renderMore();
+            }
         });
+    }
+
+    // Cre l'image d'une carte : variantes WebP/JPEG en srcset si disponibles
+    function createPicture(figurine) {
+        const picture = document.createElement('picture');
+        const img = document.createElement('img');
+        img.alt = figurine.name;
+        img.loading = 'lazy';
+        img.decoding = 'async';
+
+        const image = figurine.image;
+        if (image) {
+            if (image.srcset.webp) {
+                const source = document.createElement('source');
+                source.type = 'image/webp';
+                source.srcset = image.srcset.webp;
+                source.sizes = image.sizes;
+                picture.appendChild(source);
+            }
+            img.src = image.src;
+            if (image.srcset.jpeg) {
+                img.srcset = image.srcset.jpeg;
+                img.sizes = image.sizes;
+            }
+            // Dimensions connues d'avance : pas de dcalage de mise en page
+            img.width = image.width;
+            img.height = image.height;
+        } else {
+            img.src = figurine.thumbnail;
+        }
 
-        displayFigurines(filteredFigurines);
+        picture.appendChild(img);
+        return picture;
     }
 
-    // Affiche les figurines sur la page
+    // Cre l'image d'une carte dcoupe dans la planche de miniatures de sa page
+    // (une seule image tlcharge pour toute la page)
+    function createSprite(figurine) {
+        const sprite = figurine.sprite;
+        const svg = document.createElementNS(SVG_NS, 'svg');
+        svg.setAttribute('class', 'figurine-sprite');
+        svg.setAttribute('viewBox', `${sprite.x} ${sprite.y} ${sprite.width} ${sprite.height}`);
+        svg.setAttribute('preserveAspectRatio', 'xMidYMid slice');
+        svg.setAttribute('role', 'img');
+        svg.setAttribute('aria-label', figurine.name);
+
+        const image = document.createElementNS(SVG_NS, 'image');
+        image.setAttribute('href', sprite.src);
+        image.setAttribute('width', sprite.atlasWidth);
+        image.setAttribute('height', sprite.atlasHeight);
+        svg.appendChild(image);
+        return svg;
+    }
+
+    // Ajoute des figurines  la fin de la grille
     function displayFigurines(figurinesToDisplay) {
-        const container = document.getElementById('figurines-container');
-        container.innerHTML = '';
+        // Planches seulement pour la galerie complte : un rsultat filtr
+        // n'utilise que quelques miniatures de chaque planche
+        const useSprites = resultPositions === null;
+
+        const fragment = document.createDocumentFragment();
 
         figurinesToDisplay.forEach(figurine => {
             const card = document.createElement('div');
@@ -93,15 +399,12 @@ document.addEventListener('DOMContentLoaded', function () {
 
             // Cre le lien vers l'image complte avec lightbox
             const link = document.createElement('a');
-            link.href = figurine.fullImage;
+            link.href = figurine.image ? figurine.image.full : figurine.fullImage;
             link.setAttribute('data-lightbox', 'figurines');
             link.setAttribute('data-title', figurine.name);
 
             // Ajoute l'image miniature
-            const img = document.createElement('img');
-            img.src = figurine.thumbnail;
-            img.alt = figurine.name;
-            link.appendChild(img);
+            link.appendChild(useSprites && figurine.sprite ? createSprite(figurine) : createPicture(figurine));
 
             // Ajoute les infos de la figurine
             const info = document.createElement('div');
@@ -116,10 +419,13 @@ document.addEventListener('DOMContentLoaded', function () {
             tags.className = 'figurine-tags';
 
             figurine.tags.forEach(tag => {
-                const tagSpan = document.createElement('span');
-                tagSpan.className = 'figurine-tag';
-                tagSpan.textContent = tag;
-                tags.appendChild(tagSpan);
+                const tagLink = document.createElement('a');
+                tagLink.className = 'figurine-tag';
+                tagLink.textContent = tag;
+                if (manifest.tags[tag] && manifest.tags[tag].page) {
+                    tagLink.href = manifest.tags[tag].page;
+                }
+                tags.appendChild(tagLink);
             });
 
             info.appendChild(tags);
@@ -127,7 +433,9 @@ document.addEventListener('DOMContentLoaded', function () {
             // Assemble la carte
             card.appendChild(link);
             card.appendChild(info);
-            container.appendChild(card);
+            fragment.appendChild(card);
         });
+
+        container.appendChild(fragment);
     }
 });
\ No newline at end of file